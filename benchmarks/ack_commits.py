@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Compares acking CommitsCreated/CommitDetailsCreated messages one at a time against the batched ack
+# path of the analytics subscriber. The benchmark creates its own organization, repository and commits
+# and removes them when it is done, but it should still be pointed at a test database.
+#
+# Only the database side is measured. The messages are served from memory by QueueChannel rather than
+# a broker, so the basic_get and ack round trips of the batched path are not included in its timings,
+# and the gain it shows is an upper bound on what a subscriber sees against a real queue.
+#
+#   python benchmarks/ack_commits.py --commits 20000 --commits-per-message 20 --batch-size 2000
+
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from types import SimpleNamespace
+
+import argh
+
+from polaris.common import db
+from polaris.common.enums import VcsIntegrationTypes
+from polaris.messaging.messages import CommitsCreated, CommitDetailsCreated
+from polaris.repos.db.model import Organization, Repository, repositories
+from polaris.repos.db.schema import commits, contributors, contributor_aliases
+from polaris.utils.config import get_config_provider
+from polaris.utils.logging import config_logging
+from polaris.vcs.db import api
+from polaris.vcs.messaging.subscribers.analytics_topic_subscriber import CommitAckBatch
+
+logger = logging.getLogger('polaris.vcs.benchmarks.ack_commits')
+
+
+class QueueChannel:
+    """
+    Serves (message_type, body) pairs to basic_get the way the broker does for the subscriber queue,
+    from memory and without any round trips.
+    """
+
+    def __init__(self, messages):
+        self.messages = deque(messages)
+        self.delivery_tag = 0
+        self.acked = 0
+
+    def basic_get(self, queue):
+        if len(self.messages) == 0:
+            return None, None, None
+        self.delivery_tag = self.delivery_tag + 1
+        message_type, body = self.messages.popleft()
+        return SimpleNamespace(delivery_tag=self.delivery_tag), SimpleNamespace(type=message_type), body
+
+    def basic_ack(self, delivery_tag):
+        self.acked = self.acked + 1
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+def create_commits(count):
+    organization_key = uuid.uuid4()
+    with db.orm_session() as session:
+        session.expire_on_commit = False
+        organization = Organization(organization_key=organization_key, name='ack-benchmark', public=False)
+        repository = Repository(
+            organization_key=organization_key,
+            key=uuid.uuid4(),
+            name='ack-benchmark',
+            source_id=str(uuid.uuid4()),
+            description='Commit ack benchmark',
+            integration_type=VcsIntegrationTypes.github.value,
+            url='https://ack.benchmark'
+        )
+        organization.repositories.append(repository)
+        session.add(organization)
+        session.flush()
+
+    contributor_key = uuid.uuid4().hex
+    with db.create_session() as session:
+        contributor_id = session.connection.execute(
+            contributors.insert(dict(key=contributor_key, name='Ack Benchmark'))
+        ).inserted_primary_key[0]
+        alias_id = session.connection.execute(
+            contributor_aliases.insert(
+                dict(
+                    alias='ack@benchmark',
+                    key=uuid.uuid4().hex,
+                    display_name='Ack Benchmark',
+                    contributor_id=contributor_id,
+                    contributor_key=contributor_key,
+                    contributor_name='Ack Benchmark'
+                )
+            )
+        ).inserted_primary_key[0]
+
+        now = datetime.utcnow()
+        keys = [uuid.uuid4().hex for _ in range(count)]
+        session.connection.execute(
+            commits.insert(),
+            [
+                dict(
+                    repository_id=repository.id,
+                    key=key,
+                    source_commit_id=key,
+                    commit_message='Ack benchmark',
+                    commit_date=now,
+                    commit_date_tz_offset=0,
+                    committer_contributor_key=contributor_key,
+                    committer_contributor_name='Ack Benchmark',
+                    committer_alias_id=alias_id,
+                    author_date=now,
+                    author_date_tz_offset=0,
+                    author_contributor_key=contributor_key,
+                    author_contributor_name='Ack Benchmark',
+                    author_alias_id=alias_id,
+                    created_at=now
+                )
+                for key in keys
+            ]
+        )
+
+    return organization_key, repository, contributor_id, keys
+
+
+def remove_commits(organization_key, repository, contributor_id):
+    with db.create_session() as session:
+        session.connection.execute(commits.delete().where(commits.c.repository_id == repository.id))
+        session.connection.execute(
+            contributor_aliases.delete().where(contributor_aliases.c.contributor_id == contributor_id)
+        )
+        session.connection.execute(contributors.delete().where(contributors.c.id == contributor_id))
+        session.connection.execute(repositories.delete().where(repositories.c.id == repository.id))
+        session.connection.execute(
+            f"delete from repos.organizations where organization_key='{organization_key}'"
+        )
+
+
+def reset_acks(repository):
+    with db.create_session() as session:
+        session.connection.execute(
+            commits.update().where(
+                commits.c.repository_id == repository.id
+            ).values(
+                analytics_commit_synced_at=None,
+                analytics_details_synced_at=None
+            )
+        )
+
+
+def unacked(repository):
+    return db.connection().execute(
+        f'select count(id) from repos.commits where repository_id={repository.id} '
+        f'and (analytics_commit_synced_at is null or analytics_details_synced_at is null)'
+    ).scalar()
+
+
+def message_payloads(keys, commits_per_message):
+    for start in range(0, len(keys), commits_per_message):
+        chunk = keys[start:start + commits_per_message]
+        yield CommitsCreated.message_type, dict(new_commits=[dict(key=key) for key in chunk])
+        yield CommitDetailsCreated.message_type, dict(commit_details=[dict(key=key) for key in chunk])
+
+
+def ack_one_at_a_time(payloads):
+    for message_type, payload in payloads:
+        if message_type == CommitsCreated.message_type:
+            result = api.ack_commits_created([commit['key'] for commit in payload['new_commits']])
+        else:
+            result = api.ack_commits_details_created([commit['key'] for commit in payload['commit_details']])
+        assert result['success'], result
+
+
+def ack_in_batches(payloads, batch_size):
+    # The first message of each batch is dispatched by the consumer, the rest are fetched from the queue.
+    message_type, payload = payloads[0]
+    channel = QueueChannel((message_type, json.dumps(payload)) for message_type, payload in payloads[1:])
+    while True:
+        batch = CommitAckBatch(channel, 'analytics_vcs', batch_size, interval=60)
+        batch.add(message_type, payload)
+        batch.fill()
+        result = batch.write()
+        assert result['success'], result
+
+        method, properties, body = channel.basic_get('analytics_vcs')
+        if method is None:
+            break
+        message_type, payload = properties.type, json.loads(body)
+
+
+def run(commits=20000, commits_per_message=20, batch_size=2000, repeat=3):
+    config_logging()
+    db.init(get_config_provider().get('POLARIS_DB_URL'))
+
+    organization_key, repository, contributor_id, keys = create_commits(commits)
+    payloads = list(message_payloads(keys, commits_per_message))
+    try:
+        for method, ack in [
+            ('one at a time', lambda: ack_one_at_a_time(payloads)),
+            (f'batches of {batch_size}', lambda: ack_in_batches(payloads, batch_size))
+        ]:
+            timings = []
+            for _ in range(repeat):
+                reset_acks(repository)
+                start = time.perf_counter()
+                ack()
+                timings.append(time.perf_counter() - start)
+                assert unacked(repository) == 0, f'{method} left commits unacked'
+
+            best = min(timings)
+            logger.info(
+                f'{method}: {len(payloads)} messages, {commits} commits: best {best:.3f}s '
+                f'({len(payloads) / best:.0f} messages/s) over {repeat} runs'
+            )
+    finally:
+        remove_commits(organization_key, repository, contributor_id)
+
+
+if __name__ == '__main__':
+    argh.dispatch_command(run)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Compares the executemany insert path against the COPY path for loading pull_requests_temp.
+# Only the temp table is written to, so this is safe to run against a live database.
+#
+#   python benchmarks/bulk_load_pull_requests.py --rows 50000 --page-size 100
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+import argh
+
+from polaris.common import db
+from polaris.utils.config import get_config_provider
+from polaris.utils.logging import config_logging
+from polaris.vcs.db.impl.pull_requests import create_pull_requests_temp_table, load_pull_requests_temp
+
+logger = logging.getLogger('polaris.vcs.benchmarks.bulk_load_pull_requests')
+
+
+def source_pull_request_pages(rows, page_size):
+    created_at = datetime.utcnow() - timedelta(days=365)
+    for start in range(0, rows, page_size):
+        yield [
+            dict(
+                source_id=str(i),
+                source_display_id=str(i),
+                title=f'PR-{i} A pull request title with\ta tab',
+                description=f'A description that spans\nmultiple lines for pull request {i}',
+                source_state='merged',
+                state='merged',
+                source_created_at=created_at + timedelta(minutes=i),
+                source_last_updated=created_at + timedelta(minutes=i, seconds=30),
+                source_merge_status='can_be_merged',
+                source_merged_at=created_at + timedelta(minutes=i, seconds=30),
+                source_branch=f'feature-{i}',
+                target_branch='master',
+                source_repository_source_id='1000',
+                target_repository_source_id='1000',
+                web_url=f'https://gitlab.com/polaris-services/benchmark/-/merge_requests/{i}'
+            )
+            for i in range(start, min(start + page_size, rows))
+        ]
+
+
+def time_load(rows, page_size, use_copy):
+    with db.orm_session() as session:
+        pull_requests_temp = create_pull_requests_temp_table(session)
+        start = time.perf_counter()
+        load_pull_requests_temp(
+            session,
+            pull_requests_temp,
+            0,
+            source_pull_request_pages(rows, page_size),
+            datetime.utcnow(),
+            use_copy=use_copy
+        )
+        elapsed = time.perf_counter() - start
+        loaded = session.connection().execute(pull_requests_temp.count()).scalar()
+
+    return elapsed, loaded
+
+
+def run(rows=10000, page_size=100, repeat=3):
+    config_logging()
+    db.init(get_config_provider().get('POLARIS_DB_URL'))
+
+    for method, use_copy in [('insert', False), ('copy', True)]:
+        timings = []
+        for _ in range(repeat):
+            elapsed, loaded = time_load(rows, page_size, use_copy)
+            assert loaded == rows, f'{method} loaded {loaded} rows, expected {rows}'
+            timings.append(elapsed)
+
+        best = min(timings)
+        logger.info(
+            f'{method}: {rows} rows in pages of {page_size}: best {best:.3f}s '
+            f'({rows / best:.0f} rows/s) over {repeat} runs'
+        )
+
+
+if __name__ == '__main__':
+    argh.dispatch_command(run)
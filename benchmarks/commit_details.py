@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Compares the two query modes of get_commit_details on the commits that touch the most files:
+# one row per changed file regrouped in python, against source files aggregated into json in the
+# database. Reports the size of each result set in the postgres text format, which is what goes
+# over the wire, and the python cpu time spent building the commit details. Read only.
+#
+#   python benchmarks/commit_details.py --commits 200 --repeat 3
+
+import io
+import logging
+import time
+from types import SimpleNamespace
+
+import argh
+from sqlalchemy.dialects import postgresql
+
+from polaris.common import db
+from polaris.utils.config import get_config_provider
+from polaris.utils.logging import config_logging
+from polaris.vcs.messaging.tasks.send_commit_details_imported import get_commit_details, \
+    commit_detail_rows_query, commit_details_json_query
+
+logger = logging.getLogger('polaris.vcs.benchmarks.commit_details')
+
+
+class ByteCounter(io.TextIOBase):
+
+    def __init__(self):
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.count = self.count + len(data.encode('utf-8') if isinstance(data, str) else data)
+        return len(data)
+
+
+def commits_with_most_files(session, count):
+    return [
+        SimpleNamespace(id=row.commit_id, files=row.files)
+        for row in session.connection().execute(
+            f'select commit_id, count(*) as files from repos.source_file_versions '
+            f'group by commit_id order by files desc limit {int(count)}'
+        )
+    ]
+
+
+def result_size(session, query):
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    counter = ByteCounter()
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY ({sql}) TO STDOUT', counter)
+    finally:
+        cursor.close()
+    return counter.count
+
+
+def run(commits=200, repeat=3):
+    config_logging()
+    db.init(get_config_provider().get('POLARIS_DB_URL'))
+
+    with db.orm_session() as session:
+        commits_batch = commits_with_most_files(session, commits)
+        if len(commits_batch) == 0:
+            logger.info('No commits with source files found')
+            return
+        files = sum(commit.files for commit in commits_batch)
+        commit_ids = [commit.id for commit in commits_batch]
+        logger.info(f'{len(commits_batch)} commits touching {files} files')
+
+        for mode, aggregate_files, query in [
+            ('rows', False, commit_detail_rows_query(commit_ids)),
+            ('json_agg', True, commit_details_json_query(commit_ids))
+        ]:
+            size = result_size(session, query)
+            elapsed = []
+            cpu = []
+            for _ in range(repeat):
+                start, start_cpu = time.perf_counter(), time.process_time()
+                details = get_commit_details(session, commits_batch, aggregate_files=aggregate_files)
+                elapsed.append(time.perf_counter() - start)
+                cpu.append(time.process_time() - start_cpu)
+
+            assert len(details) == len(commits_batch)
+            logger.info(
+                f'{mode}: {size / 1024:.0f} KB transferred, best {min(elapsed):.3f}s elapsed, '
+                f'{min(cpu):.3f}s python cpu over {repeat} runs'
+            )
+
+
+if __name__ == '__main__':
+    argh.dispatch_command(run)
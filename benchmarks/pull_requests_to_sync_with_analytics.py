@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Compares the single OR query that used to select pull requests to sync with analytics against the
+# UNION ALL candidate query followed by a fetch of the page by id. Loads a repository with --rows pull
+# requests, most of them already synced, inside one transaction that is rolled back at the end, so
+# nothing is left behind. With --create-indexes the partial indexes the candidate branches are written
+# for are created in the same transaction.
+#
+#   python benchmarks/pull_requests_to_sync_with_analytics.py --rows 1000000 --limit 100 --repeat 5
+
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import argh
+from sqlalchemy import select, and_, or_, text
+from sqlalchemy.dialects import postgresql
+
+from polaris.common import db
+from polaris.common.enums import VcsIntegrationTypes
+from polaris.repos.db.model import Organization, pull_requests, repositories
+from polaris.repos.db.schema import RepositoryImportState
+from polaris.utils.config import get_config_provider
+from polaris.utils.logging import config_logging
+from polaris.vcs.db.impl.pull_requests import get_pull_requests_to_sync_with_analytics, \
+    pull_requests_to_sync_with_analytics_candidates
+
+logger = logging.getLogger('polaris.vcs.benchmarks.pull_requests_to_sync_with_analytics')
+
+supporting_indexes = [
+    "CREATE INDEX benchmark_pull_requests_never_synced ON repos.pull_requests (source_last_updated) "
+    "WHERE analytics_last_updated IS NULL",
+    "CREATE INDEX benchmark_pull_requests_out_of_date ON repos.pull_requests (source_last_updated) "
+    "WHERE analytics_last_updated IS NOT NULL AND source_last_updated > analytics_last_updated"
+]
+
+
+def create_pull_requests(connection, rows, description_bytes):
+    organization_key = uuid.uuid4()
+    organization_id = connection.execute(
+        Organization.__table__.insert().values(
+            organization_key=organization_key, name='analytics-sync-benchmark', public=False
+        )
+    ).inserted_primary_key[0]
+    repository_id = connection.execute(
+        repositories.insert().values(
+            organization_id=organization_id,
+            organization_key=organization_key,
+            key=uuid.uuid4(),
+            name='analytics-sync-benchmark',
+            source_id=str(uuid.uuid4()),
+            description='Pull request analytics sync benchmark',
+            integration_type=VcsIntegrationTypes.gitlab.value,
+            url='https://analytics-sync.benchmark',
+            import_state=RepositoryImportState.CHECK_FOR_UPDATES
+        )
+    ).inserted_primary_key[0]
+
+    # One pull request every 30 seconds going back from now. 1% have never been synced and 1% were
+    # updated at the source after their last sync, the rest are up to date.
+    connection.execute(
+        text(
+            """
+            INSERT INTO repos.pull_requests (
+                key, repository_id, source_repository_id, source_id, source_display_id, title, description,
+                source_state, state, source_created_at, source_last_updated, source_merge_status,
+                source_branch, target_branch, source_repository_source_id, target_repository_source_id,
+                web_url, last_sync, analytics_last_updated
+            )
+            SELECT
+                CAST(md5(CAST(:repository_id AS TEXT) || '-' || CAST(i AS TEXT)) AS UUID),
+                :repository_id, :repository_id, CAST(i AS TEXT), CAST(i AS TEXT), 'PR-' || i,
+                repeat('x', :description_bytes),
+                'merged', 'merged', updated_at - interval '1 day', updated_at, 'can_be_merged',
+                'feature-' || i, 'master', '1000', '1000',
+                'https://gitlab.com/polaris-services/benchmark/-/merge_requests/' || i,
+                now() AT TIME ZONE 'UTC',
+                CASE
+                    WHEN i % 100 = 0 THEN NULL
+                    WHEN i % 100 = 1 THEN updated_at - interval '1 hour'
+                    ELSE updated_at
+                END
+            FROM (
+                SELECT i, (now() AT TIME ZONE 'UTC') - i * interval '30 seconds' AS updated_at
+                FROM generate_series(1, :rows) AS i
+            ) AS series
+            """
+        ),
+        repository_id=repository_id,
+        rows=rows,
+        description_bytes=description_bytes
+    )
+    connection.execute('ANALYZE repos.pull_requests')
+    connection.execute('ANALYZE repos.repositories')
+
+
+def or_query(before, after, limit):
+    # The query this replaced, kept here for comparison.
+    return select([
+        repositories.c.organization_key,
+        repositories.c.key.label('repository_key'),
+        *pull_requests.columns
+    ]).select_from(
+        pull_requests.join(
+            repositories, pull_requests.c.repository_id == repositories.c.id
+        )
+    ).where(
+        or_(
+            and_(
+                repositories.c.import_state == RepositoryImportState.CHECK_FOR_UPDATES,
+                pull_requests.c.analytics_last_updated == None,
+                pull_requests.c.source_last_updated < before
+            ),
+            and_(
+                repositories.c.import_state == RepositoryImportState.CHECK_FOR_UPDATES,
+                pull_requests.c.analytics_last_updated != None,
+                pull_requests.c.source_last_updated < before,
+                pull_requests.c.source_last_updated >= after,
+                pull_requests.c.source_last_updated > pull_requests.c.analytics_last_updated
+            )
+        )
+    ).order_by(
+        pull_requests.c.source_last_updated.desc()
+    ).limit(
+        limit
+    )
+
+
+def plan(connection, query):
+    compiled = query.compile(dialect=postgresql.dialect())
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN {compiled}', compiled.params)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = run()
+        timings.append(time.perf_counter() - start)
+    return min(timings), count
+
+
+def run(rows=1000000, limit=100, days=1, description_bytes=2000, create_indexes=True, repeat=5):
+    config_logging()
+    db.init(get_config_provider().get('POLARIS_DB_URL'))
+
+    connection = db.connection()
+    transaction = connection.begin()
+    try:
+        start = time.perf_counter()
+        create_pull_requests(connection, rows, description_bytes)
+        logger.info(f'Loaded {rows} pull requests in {time.perf_counter() - start:.1f}s')
+        if create_indexes:
+            for index in supporting_indexes:
+                connection.execute(index)
+            connection.execute('ANALYZE repos.pull_requests')
+
+        before = datetime.utcnow() - timedelta(minutes=15)
+        after = before - timedelta(days=days)
+        session = SimpleNamespace(connection=lambda: connection)
+
+        for method, query, fetch in [
+            (
+                'or query',
+                or_query(before, after, limit),
+                lambda: len(connection.execute(or_query(before, after, limit)).fetchall())
+            ),
+            (
+                'union all candidates',
+                pull_requests_to_sync_with_analytics_candidates(before, after, limit),
+                lambda: len(
+                    get_pull_requests_to_sync_with_analytics(session, before=before, days=days, limit=limit)[
+                        'pull_requests'
+                    ]
+                )
+            )
+        ]:
+            best, count = best_of(repeat, fetch)
+            logger.info(f'{method}: {count} pull requests, best {best * 1000:.1f}ms over {repeat} runs')
+            for line in plan(connection, query):
+                logger.info(f'{method}: {line}')
+    finally:
+        transaction.rollback()
+        connection.close()
+
+
+if __name__ == '__main__':
+    argh.dispatch_command(run)
@@ -28,3 +28,17 @@ def db_up(pytestconfig):
 def setup_schema(db_up):
     model.recreate_all(db.engine())
     integrations_model.recreate_all(db.engine())
+    # the commit triggers that maintain the sync state counters and the replay checkpoints table
+    # are not part of the repos model.
+    from polaris.vcs.db import api
+    assert api.install_sync_state_counters()['success']
+    assert api.install_replay_checkpoints()['success']
+
+
+@pytest.fixture(autouse=True)
+def clear_vcs_caches():
+    yield
+    # tests recreate connectors and repositories with the same keys, so cached
+    # bindings from one test must not leak into the next.
+    from polaris.vcs import repository_factory
+    repository_factory.clear_caches()
@@ -18,6 +18,7 @@ from polaris.vcs.messaging import publish
 from polaris.utils.exceptions import ProcessingException
 from polaris.repos.db.model import Repository
 from polaris.common.enums import ConnectorType
+from polaris.vcs.integrations.fetch import log_remaining_budget
 
 log = logging.getLogger('polaris.vcs.service.commands')
 
@@ -37,6 +38,7 @@ def sync_repositories(connector_key, tracking_receipt_key=None):
                     connector.key,
                     source_repositories
                 )
+            log_remaining_budget(connector.key)
 
 def sync_repository_forks(connector_key, repository_key, join_this=None):
     with db.orm_session(join_this) as session:
@@ -72,6 +74,7 @@ def sync_pull_requests(repository_key, pull_request_key=None, pull_request_sourc
                 repository_key,
                 repository_provider.fetch_pull_requests_from_source()
             )
+            log_remaining_budget(repository_provider.connector_key)
 
     return []
 
@@ -183,6 +186,20 @@ def test_vcs_connector(connector_key, join_this=None):
             return vcs_connector.test()
 
 
+def invalidate_connector(connector_key):
+    # Drops the cached connector object and any repository bindings that use it, so the next
+    # message for this connector picks up its current credentials and state.
+    log.info(f'Invalidating cached connector {connector_key}')
+    repository_factory.invalidate_connector(connector_key)
+
+
+def invalidate_repositories(repositories):
+    # Drops the cached bindings of repositories that were changed, (eg. by a refresh or an import),
+    # by any process.
+    for repository in repositories:
+        repository_factory.invalidate_repository(repository['connector_key'], repository['source_id'])
+
+
 def get_pull_request_summary(pull_request_key, join_this=None):
     return api.get_pull_request_summary(pull_request_key, join_this)
 
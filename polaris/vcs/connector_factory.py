@@ -15,6 +15,17 @@ from polaris.vcs.integrations.github import GithubRepositoriesConnector
 from polaris.vcs.integrations.atlassian import BitBucketConnector
 from polaris.vcs.integrations.gitlab import GitlabRepositoriesConnector
 from polaris.vcs.integrations.azure import AzureRepositoriesConnector
+from polaris.vcs.integrations.fetch import close_session
+from polaris.utils.config import get_config_provider
+from polaris.vcs.ttl_cache import TTLCache, snapshot
+
+config_provider = get_config_provider()
+
+connectors_cache = TTLCache(
+    max_size=int(config_provider.get('CONNECTOR_CACHE_SIZE', 256)),
+    ttl=int(config_provider.get('CONNECTOR_CACHE_TTL', 300))
+)
+
 
 def get_connector(connector_name=None, connector_key=None, join_this=None):
     with db.orm_session(join_this) as session:
@@ -24,17 +35,41 @@ def get_connector(connector_name=None, connector_key=None, join_this=None):
             else:
                 connector = find_connector_by_name(connector_name, join_this=session)
             if connector:
-                if connector.type == ConnectorType.github.value:
-                    return GithubRepositoriesConnector(connector)
-                elif connector.type == ConnectorType.atlassian.value:
-                    return BitBucketConnector(connector)
-                elif connector.type == ConnectorType.gitlab.value:
-                    return GitlabRepositoriesConnector(connector)
-                elif connector.type == ConnectorType.azure.value:
-                    return AzureRepositoriesConnector(connector)
-                else:
-                    raise ProcessingException(f'No Repositories connector registered for connector type: {connector.type} '
-                                              f'Connector Key was {connector_key}')
-
+                return create_connector(connector, connector_key)
             else:
                 raise ProcessingException(f'Cannot find connector for connector_key {connector_key}')
+
+
+def create_connector(connector, connector_key):
+    if connector.type == ConnectorType.github.value:
+        return GithubRepositoriesConnector(connector)
+    elif connector.type == ConnectorType.atlassian.value:
+        return BitBucketConnector(connector)
+    elif connector.type == ConnectorType.gitlab.value:
+        return GitlabRepositoriesConnector(connector)
+    elif connector.type == ConnectorType.azure.value:
+        return AzureRepositoriesConnector(connector)
+    else:
+        raise ProcessingException(f'No Repositories connector registered for connector type: {connector.type} '
+                                  f'Connector Key was {connector_key}')
+
+
+def get_cached_connector(connector_key):
+    # The cached connector is built over a snapshot of the connector row rather than the ORM instance,
+    # since it is shared by the handler threads. Only use this where the connector is used to talk to
+    # the provider, not to modify the connector.
+    cache_key = str(connector_key)
+    connector = connectors_cache.get(cache_key)
+    if connector is None:
+        with db.orm_session() as session:
+            found = find_connector(connector_key, join_this=session)
+            if found is None:
+                raise ProcessingException(f'Cannot find connector for connector_key {connector_key}')
+            connector = create_connector(snapshot(found), connector_key)
+        connectors_cache.put(cache_key, connector)
+    return connector
+
+
+def invalidate_connector(connector_key):
+    connectors_cache.invalidate(str(connector_key))
+    close_session(connector_key)
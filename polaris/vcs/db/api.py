@@ -12,14 +12,16 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from polaris.common import db
 
-from .impl import commits, repositories, pull_requests
+from .impl import commits, repositories, pull_requests, sync_state_counters, replay_checkpoints
 
 
 # Repositories
-def sync_repositories(organization_key, connector_key, source_repositories):
+def sync_repositories(organization_key, connector_key, source_repositories, use_copy=None):
     try:
         with db.orm_session() as session:
-            return repositories.sync_repositories(session, organization_key, connector_key, source_repositories)
+            return repositories.sync_repositories(
+                session, organization_key, connector_key, source_repositories, use_copy
+            )
     except SQLAlchemyError as exc:
         return db.process_exception("Sync Repositories", exc)
     except Exception as e:
@@ -36,30 +38,44 @@ def import_repositories(organization_key, repository_keys):
         return db.failure_message('Import Repositories', e)
 
 
-def sync_pull_requests(repository_key, source_pull_requests):
+def sync_pull_requests(repository_key, source_pull_requests, use_copy=None):
     try:
         with db.orm_session() as session:
-            return pull_requests.sync_pull_requests(session, repository_key, source_pull_requests)
+            return pull_requests.sync_pull_requests(session, repository_key, source_pull_requests, use_copy)
     except SQLAlchemyError as exc:
         return db.process_exception("Sync Pull Requests", exc)
     except Exception as e:
         return db.failure_message('Sync Pull Requests', e)
 
 
-def get_pull_requests_to_sync_with_source(before=None, days=3, limit=100):
+def sync_pull_requests_for_repositories(source_pull_requests_by_repository, use_copy=None):
     try:
         with db.orm_session() as session:
-            return pull_requests.get_pull_requests_to_sync_with_source(session, before, days, limit)
+            return pull_requests.sync_pull_requests_for_repositories(
+                session, source_pull_requests_by_repository, use_copy
+            )
+    except SQLAlchemyError as exc:
+        return db.process_exception("Sync Pull Requests for Repositories", exc)
+    except Exception as e:
+        return db.failure_message('Sync Pull Requests for Repositories', e)
+
+
+def get_pull_requests_to_sync_with_source(before=None, days=3, limit=100, before_id=None):
+    try:
+        with db.orm_session() as session:
+            return pull_requests.get_pull_requests_to_sync_with_source(session, before, days, limit, before_id=before_id)
     except SQLAlchemyError as exc:
         return db.process_exception("Get Pull Requests to Sync with Source", exc)
     except Exception as e:
         return db.failure_message('Get Pull Requests to Sync with Source', e)
 
 
-def get_pull_requests_to_sync_with_analytics(before=None, days=1, limit=100):
+def get_pull_requests_to_sync_with_analytics(before=None, days=1, limit=100, before_id=None):
     try:
         with db.orm_session() as session:
-            return pull_requests.get_pull_requests_to_sync_with_analytics(session, before=before, days=days, limit=limit)
+            return pull_requests.get_pull_requests_to_sync_with_analytics(
+                session, before=before, days=days, limit=limit, before_id=before_id
+            )
     except SQLAlchemyError as exc:
         return db.process_exception("Get Pull Requests to Sync with Analytics", exc)
     except Exception as e:
@@ -122,7 +138,7 @@ def handle_remote_repository_push(connector_key, repository_source_id):
 # Commits
 def ack_commits_created(commit_keys):
     try:
-        with db.create_session() as session:
+        with db.orm_session() as session:
             return commits.ack_commits_created(session, commit_keys)
     except SQLAlchemyError as exc:
         return db.process_exception("Ack Commits Created", exc)
@@ -132,7 +148,7 @@ def ack_commits_created(commit_keys):
 
 def ack_commits_details_created(commit_keys):
     try:
-        with db.create_session() as session:
+        with db.orm_session() as session:
             return commits.ack_commit_details_created(session, commit_keys)
     except SQLAlchemyError as exc:
         return db.process_exception("Ack Commits Created", exc)
@@ -140,6 +156,16 @@ def ack_commits_details_created(commit_keys):
         return db.failure_message('Ack Commits Created', e)
 
 
+def ack_commits_synced(commits_created_keys, commit_details_created_keys):
+    try:
+        with db.orm_session() as session:
+            return commits.ack_commits_synced(session, commits_created_keys, commit_details_created_keys)
+    except SQLAlchemyError as exc:
+        return db.process_exception("Ack Commits Synced", exc)
+    except Exception as e:
+        return db.failure_message('Ack Commits Synced', e)
+
+
 def ack_pull_request_event(pull_request_summaries):
     try:
         with db.orm_session() as session:
@@ -159,3 +185,59 @@ def get_pull_request_summary(pull_request_key, join_this=None):
         return db.process_exception("Get Pull Request Info", exc)
     except Exception as e:
         return db.failure_message('Get Pull Request Info', e)
+
+
+# Sync state counters
+def install_sync_state_counters():
+    try:
+        with db.orm_session() as session:
+            sync_state_counters.install_sync_state_counters(session)
+        # counters only start tracking once the triggers are committed, so the
+        # initial counts are taken after that.
+        return reconcile_sync_state_counters()
+    except SQLAlchemyError as exc:
+        return db.process_exception("Install Sync State Counters", exc)
+    except Exception as e:
+        return db.failure_message('Install Sync State Counters', e)
+
+
+def reconcile_sync_state_counters(batch_size=500):
+    # Each batch of repositories is reconciled in its own transaction so that the
+    # counter rows are not held locked for the whole run.
+    try:
+        with db.orm_session() as session:
+            repository_ids = sync_state_counters.get_repository_ids(session)
+            removed = sync_state_counters.remove_orphaned_counters(session)
+
+        reconciled = 0
+        corrected = 0
+        for start in range(0, len(repository_ids), batch_size):
+            with db.orm_session() as session:
+                result = sync_state_counters.reconcile_sync_state_counters(
+                    session, repository_ids[start:start + batch_size]
+                )
+            reconciled = reconciled + result['reconciled']
+            corrected = corrected + result['corrected']
+
+        return dict(
+            success=True,
+            reconciled=reconciled,
+            corrected=corrected,
+            removed=removed
+        )
+    except SQLAlchemyError as exc:
+        return db.process_exception("Reconcile Sync State Counters", exc)
+    except Exception as e:
+        return db.failure_message('Reconcile Sync State Counters', e)
+
+
+# Replay checkpoints
+def install_replay_checkpoints():
+    try:
+        with db.orm_session() as session:
+            replay_checkpoints.install_replay_checkpoints(session)
+        return dict(success=True)
+    except SQLAlchemyError as exc:
+        return db.process_exception("Install Replay Checkpoints", exc)
+    except Exception as e:
+        return db.failure_message('Install Replay Checkpoints', e)
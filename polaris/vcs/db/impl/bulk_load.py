@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import io
+import json
+import logging
+from datetime import datetime, date
+from enum import Enum
+
+from polaris.utils.config import get_config_provider
+from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.timestamps import to_utc_naive
+
+config_provider = get_config_provider()
+
+log = logging.getLogger('polaris.vcs.db.impl.bulk_load')
+
+NULL = '\\N'
+
+_escapes = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def copy_enabled(use_copy=None):
+    if use_copy is None:
+        return bool(config_provider.get('BULK_LOAD_WITH_COPY', None))
+    return use_copy
+
+
+def encode_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, datetime):
+        # the columns are timestamp without time zone, which would drop an offset rather than apply it.
+        return to_utc_naive(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).translate(_escapes)
+
+
+class CopyRowReader(io.TextIOBase):
+    """
+    A read-only file like object that renders rows in the COPY text format on demand, so that
+    psycopg2's copy_expert can stream rows from a generator without materializing them first.
+    """
+
+    def __init__(self, columns, first_row, rows):
+        self.columns = columns
+        self.column_set = set(columns)
+        self.rows = rows
+        self.pending = [self.encode_row(first_row)]
+        self.buffer = ''
+        self.row_count = 1
+
+    def readable(self):
+        return True
+
+    def encode_row(self, row):
+        if not self.column_set.issuperset(row.keys()):
+            raise ProcessingException(
+                f'Row has columns {set(row.keys()) - self.column_set} that are not in the copy column list'
+            )
+        return '\t'.join(encode_value(row.get(column)) for column in self.columns) + '\n'
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            if self.pending:
+                self.buffer = self.buffer + self.pending.pop()
+                continue
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer = self.buffer + self.encode_row(row)
+            self.row_count = self.row_count + 1
+
+        if size < 0 or len(self.buffer) <= size:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def copy_rows(session, table, rows):
+    """
+    Loads an iterable of row dicts into table using COPY FROM STDIN. The column list is taken
+    from the keys of the first row; later rows may omit columns (sent as NULL) but may not add any.
+
+    Returns the number of rows copied.
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return 0
+
+    columns = list(first_row.keys())
+    reader = CopyRowReader(columns, first_row, rows)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+
+    dbapi_connection = session.connection().connection
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table.fullname} ({column_list}) FROM STDIN', reader)
+    finally:
+        cursor.close()
+
+    log.debug(f'Copied {reader.row_count} rows into {table.fullname}')
+    return reader.row_count
@@ -9,22 +9,30 @@
 # Author: Krishna Kumar
 
 from polaris.repos.db.schema import commits
-from sqlalchemy import update
+from sqlalchemy import update, any_, cast, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from datetime import datetime
 
 
-def ack_commits_created(session, commit_keys):
-    updated = session.connection.execute(
+def update_synced_at(session, column, commit_keys, synced_at):
+    # The keys are bound as a single array parameter, so the statement text and plan stay the
+    # same however many commits are acked at once.
+    return session.connection().execute(
         update(commits).values(
-            dict(
-                analytics_commit_synced_at=datetime.utcnow()
-            )
+            {column: synced_at}
         ).where(
-            commits.c.key.in_(
-                commit_keys
+            commits.c.key == any_(
+                cast(
+                    bindparam('commit_keys', value=[str(key) for key in commit_keys]),
+                    ARRAY(UUID)
+                )
             )
         )
     ).rowcount
+
+
+def ack_commits_created(session, commit_keys):
+    updated = update_synced_at(session, 'analytics_commit_synced_at', commit_keys, datetime.utcnow())
     return {
         'success': True,
         'updated': updated,
@@ -33,17 +41,7 @@ def ack_commits_created(session, commit_keys):
 
 
 def ack_commit_details_created(session, commit_keys):
-    updated = session.connection.execute(
-        update(commits).values(
-            dict(
-                analytics_details_synced_at=datetime.utcnow()
-            )
-        ).where(
-            commits.c.key.in_(
-                commit_keys
-            )
-        )
-    ).rowcount
+    updated = update_synced_at(session, 'analytics_details_synced_at', commit_keys, datetime.utcnow())
     return {
         'success': True,
         'updated': updated,
@@ -51,4 +49,20 @@ def ack_commit_details_created(session, commit_keys):
     }
 
 
+def ack_commits_synced(session, commits_created_keys, commit_details_created_keys):
+    synced_at = datetime.utcnow()
+    commits_updated = 0
+    if len(commits_created_keys) > 0:
+        commits_updated = update_synced_at(session, 'analytics_commit_synced_at', commits_created_keys, synced_at)
+
+    details_updated = 0
+    if len(commit_details_created_keys) > 0:
+        details_updated = update_synced_at(
+            session, 'analytics_details_synced_at', commit_details_created_keys, synced_at
+        )
 
+    return {
+        'success': True,
+        'commits_updated': commits_updated,
+        'details_updated': details_updated
+    }
@@ -13,12 +13,14 @@ import logging
 from datetime import datetime, timedelta
 from polaris.repos.db.model import Repository, PullRequest, pull_requests, repositories
 from polaris.common import db
-from sqlalchemy import select, and_, or_, Column, Integer, cast, func, Interval, bindparam
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select, and_, or_, Column, Integer, cast, func, Interval, bindparam, tuple_, union_all, DateTime
+from sqlalchemy.dialects.postgresql import insert, ARRAY, UUID
 
 from polaris.repos.db.schema import RepositoryImportState
 
 from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.db.impl import bulk_load
+from polaris.vcs.timestamps import to_utc_naive
 
 log = logging.getLogger('polaris.vcs.db.impl.pull_requests')
 
@@ -56,26 +58,44 @@ def pull_request_summary(pull_request_row, is_new, repository_key, key=None):
     )
 
 
-def sync_pull_requests(session, repository_key, source_pull_requests):
-    if repository_key:
-        repository = Repository.find_by_repository_key(session, repository_key)
-        if repository.import_state != RepositoryImportState.IMPORT_DISABLED:
-            repository_id = repository.id
-            # create a temp table for pull requests and insert source_pull_requests
-            pull_requests_temp = db.temp_table_from(
-                pull_requests,
-                table_name='pull_requests_temp',
-                exclude_columns=[
-                    pull_requests.c.id,
-                    pull_requests.c.source_repository_id,
-                ],
-                extra_columns=[
-                    Column('source_repository_id', Integer, nullable=True),
-                ]
+def create_pull_requests_temp_table(session):
+    pull_requests_temp = db.temp_table_from(
+        pull_requests,
+        table_name='pull_requests_temp',
+        exclude_columns=[
+            pull_requests.c.id,
+            pull_requests.c.source_repository_id,
+        ],
+        extra_columns=[
+            Column('source_repository_id', Integer, nullable=True),
+        ]
+    )
+    pull_requests_temp.create(session.connection(), checkfirst=True)
+    # The temp table lives for the whole transaction, so clear out
+    # anything left over from an earlier sync in the same transaction.
+    session.connection().execute(pull_requests_temp.delete())
+    return pull_requests_temp
+
+
+def load_pull_requests_temp(session, pull_requests_temp, repository_id, source_pull_requests, last_sync, use_copy=False):
+    if use_copy:
+        bulk_load.copy_rows(
+            session,
+            pull_requests_temp,
+            (
+                dict(
+                    repository_id=repository_id,
+                    key=uuid.uuid4(),
+                    last_sync=last_sync,
+                    **source_pr
+                )
+                for source_prs in source_pull_requests
+                for source_pr in source_prs
             )
-            last_sync = datetime.utcnow()
-            pull_requests_temp.create(session.connection(), checkfirst=True)
-            for source_prs in source_pull_requests:
+        )
+    else:
+        for source_prs in source_pull_requests:
+            if len(source_prs) > 0:
                 session.connection().execute(
                     pull_requests_temp.insert([
                         dict(
@@ -88,84 +108,110 @@ def sync_pull_requests(session, repository_key, source_pull_requests):
                     ])
                 )
 
-            # Add source and target repo ids
 
-            session.connection().execute(
-                pull_requests_temp.update().where(
-                    repositories.c.source_id == pull_requests_temp.c.source_repository_source_id,
-                ).values(
-                    source_repository_id=repositories.c.id,
+def sync_pull_requests_temp(session, pull_requests_temp):
+    # Add source and target repo ids
+
+    session.connection().execute(
+        pull_requests_temp.update().where(
+            repositories.c.source_id == pull_requests_temp.c.source_repository_source_id,
+        ).values(
+            source_repository_id=repositories.c.id,
+        )
+    )
+
+    new_and_updated_pull_requests = session.connection().execute(
+        select([*pull_requests_temp.columns, pull_requests.c.key.label('current_key'), \
+                repositories.c.key.label('source_repository_key')]).select_from(
+            pull_requests_temp.outerjoin(
+                pull_requests,
+                and_(
+                    pull_requests_temp.c.repository_id == pull_requests.c.repository_id,
+                    pull_requests_temp.c.source_id == pull_requests.c.source_id
                 )
+            ).join(
+                repositories, pull_requests_temp.c.source_repository_id == repositories.c.id
+            )
+        ).where(
+            or_(
+                pull_requests_temp.c.source_last_updated > pull_requests.c.source_last_updated,
+                pull_requests.c.key == None
             )
+        )
+    ).fetchall()
+
+    # Update pull_requests
+    upsert = insert(
+        pull_requests
+    ).from_select(
+        [column.name for column in pull_requests_temp.columns],
+        select(
+            [pull_requests_temp]
+        ).where(
+                pull_requests_temp.c.key != None,
+        )
+    )
 
-            new_and_updated_pull_requests = session.connection().execute(
-                select([*pull_requests_temp.columns, pull_requests.c.key.label('current_key'), \
-                        repositories.c.key.label('source_repository_key')]).select_from(
-                    pull_requests_temp.outerjoin(
-                        pull_requests,
-                        and_(
-                            pull_requests_temp.c.repository_id == pull_requests.c.repository_id,
-                            pull_requests_temp.c.source_id == pull_requests.c.source_id
-                        )
-                    ).join(
-                        repositories, pull_requests_temp.c.source_repository_id == repositories.c.id
-                    )
-                ).where(
-                    or_(
-                        pull_requests_temp.c.source_last_updated > pull_requests.c.source_last_updated,
-                        pull_requests.c.key == None
-                    )
-                )
-            ).fetchall()
-
-            # Update pull_requests
-            upsert = insert(
-                pull_requests
-            ).from_select(
-                [column.name for column in pull_requests_temp.columns],
-                select(
-                    [pull_requests_temp]
-                ).where(
-                        pull_requests_temp.c.key != None,
-                )
+    session.connection().execute(
+        upsert.on_conflict_do_update(
+            index_elements=['repository_id', 'source_id'],
+            set_=dict(
+                title=upsert.excluded.title,
+                description=upsert.excluded.description,
+                source_created_at=upsert.excluded.source_created_at,
+                source_last_updated=upsert.excluded.source_last_updated,
+                last_sync=upsert.excluded.last_sync,
+                source_state=upsert.excluded.source_state,
+                state=upsert.excluded.state,
+                source_merge_status=upsert.excluded.source_merge_status,
+                source_merged_at=upsert.excluded.source_merged_at,
+                source_closed_at=upsert.excluded.source_closed_at,
+                end_date=upsert.excluded.end_date,
+                deleted_at=upsert.excluded.deleted_at,
             )
+        )
+    )
 
-            session.connection().execute(
-                upsert.on_conflict_do_update(
-                    index_elements=['repository_id', 'source_id'],
-                    set_=dict(
-                        title=upsert.excluded.title,
-                        description=upsert.excluded.description,
-                        source_created_at=upsert.excluded.source_created_at,
-                        source_last_updated=upsert.excluded.source_last_updated,
-                        last_sync=upsert.excluded.last_sync,
-                        source_state=upsert.excluded.source_state,
-                        state=upsert.excluded.state,
-                        source_merge_status=upsert.excluded.source_merge_status,
-                        source_merged_at=upsert.excluded.source_merged_at,
-                        source_closed_at=upsert.excluded.source_closed_at,
-                        end_date=upsert.excluded.end_date,
-                        deleted_at=upsert.excluded.deleted_at,
+    synced_pull_requests = []
+    # NOTE: Had to check for None, as in the case when there are no fetched PRs,
+    # new_and_updated_pull_request has entries with all None values
+    for pr in new_and_updated_pull_requests:
+        if pr.source_id is not None:
+            synced_pull_requests.append(
+                (
+                    pr.repository_id,
+                    pull_request_summary(
+                        pr,
+                        is_new=pr.current_key is None,
+                        repository_key=pr.source_repository_key,
+                        key=pr.key if pr.current_key is None else pr.current_key
                     )
                 )
             )
+    return synced_pull_requests
+
+
+def sync_pull_requests(session, repository_key, source_pull_requests, use_copy=None):
+    if repository_key:
+        repository = Repository.find_by_repository_key(session, repository_key)
+        if repository.import_state != RepositoryImportState.IMPORT_DISABLED:
+            # create a temp table for pull requests and insert source_pull_requests
+            pull_requests_temp = create_pull_requests_temp_table(session)
+            load_pull_requests_temp(
+                session,
+                pull_requests_temp,
+                repository.id,
+                source_pull_requests,
+                datetime.utcnow(),
+                use_copy=bulk_load.copy_enabled(use_copy)
+            )
 
-            synced_pull_requests = []
-            # NOTE: Had to check for None, as in the case when there are no fetched PRs,
-            # new_and_updated_pull_request has entries with all None values
-            for pr in new_and_updated_pull_requests:
-                if pr.source_id is not None:
-                    synced_pull_requests.append(
-                        pull_request_summary(
-                            pr,
-                            is_new=pr.current_key is None,
-                            repository_key=pr.source_repository_key,
-                            key=pr.key if pr.current_key is None else pr.current_key
-                        ),
-                    )
             return dict(
                 success=True,
-                pull_requests=synced_pull_requests
+                pull_requests=[
+                    summary
+                    for _, summary in sync_pull_requests_temp(session, pull_requests_temp)
+                ]
             )
         else:
             log.info(f'Cannot sync pull requests for repository: {repository.name}. It has not been imported')
@@ -174,6 +220,70 @@ def sync_pull_requests(session, repository_key, source_pull_requests):
             )
 
 
+def sync_pull_requests_for_repositories(session, source_pull_requests_by_repository, use_copy=None):
+    # source_pull_requests_by_repository maps a repository key to the pages of source
+    # pull requests for that repository. All repositories are synced through a single
+    # temp table, so the database work is the same for one repository or many.
+    repository_keys = list(source_pull_requests_by_repository.keys())
+    if len(repository_keys) == 0:
+        return dict(
+            success=True,
+            repositories=[],
+            skipped_repositories=[]
+        )
+
+    repositories_by_key = {
+        str(repository.key): repository
+        for repository in session.connection().execute(
+            select([
+                repositories.c.id,
+                repositories.c.key,
+                repositories.c.name,
+                repositories.c.organization_key,
+                repositories.c.import_state
+            ]).where(
+                repositories.c.key.in_(repository_keys)
+            )
+        ).fetchall()
+    }
+
+    pull_requests_temp = create_pull_requests_temp_table(session)
+    last_sync = datetime.utcnow()
+    use_copy = bulk_load.copy_enabled(use_copy)
+
+    synced_repositories = {}
+    skipped_repositories = []
+    for repository_key, source_pull_requests in source_pull_requests_by_repository.items():
+        repository = repositories_by_key.get(str(repository_key))
+        if repository is None or repository.import_state == RepositoryImportState.IMPORT_DISABLED:
+            log.info(f'Cannot sync pull requests for repository: {repository_key}. It has not been imported')
+            skipped_repositories.append(repository_key)
+            continue
+
+        load_pull_requests_temp(
+            session, pull_requests_temp, repository.id, source_pull_requests, last_sync, use_copy=use_copy
+        )
+        synced_repositories[repository.id] = dict(
+            organization_key=repository.organization_key,
+            repository_key=repository_key,
+            created=[],
+            updated=[]
+        )
+
+    for repository_id, summary in sync_pull_requests_temp(session, pull_requests_temp):
+        synced_repository = synced_repositories[repository_id]
+        if summary['is_new']:
+            synced_repository['created'].append(summary)
+        else:
+            synced_repository['updated'].append(summary)
+
+    return dict(
+        success=True,
+        repositories=list(synced_repositories.values()),
+        skipped_repositories=skipped_repositories
+    )
+
+
 def get_pull_request_summary(session, pull_request_key):
     pr = PullRequest.find_by_pull_request_key(session, pull_request_key)
     if pr is not None:
@@ -183,7 +293,69 @@ def get_pull_request_summary(session, pull_request_key):
         raise ProcessingException(f"Could not find pull request with key {pull_request_key}")
 
 
-def get_pull_requests_to_sync_with_analytics(session, before=None, days=1, threshold_minutes=15, limit=100):
+def pull_requests_to_sync_with_analytics_candidates(before, after, limit, before_id=None):
+    # The two kinds of candidate are selected in separate branches so that each one can be read
+    # in source_last_updated order from an index and stop after limit rows, instead of a scan of
+    # the whole table for the OR of the two. The branches are disjoint on analytics_last_updated,
+    # so UNION ALL is enough. Only the columns needed to choose the page are read here.
+    if before_id is not None:
+        # page on (source_last_updated, id) so that pull requests sharing a timestamp
+        # across a page boundary are not skipped.
+        page = tuple_(pull_requests.c.source_last_updated, pull_requests.c.id) < tuple_(before, before_id)
+    else:
+        page = pull_requests.c.source_last_updated < before
+
+    def candidates(*conditions):
+        return select([
+            pull_requests.c.id,
+            pull_requests.c.source_last_updated
+        ]).select_from(
+            pull_requests.join(
+                repositories, pull_requests.c.repository_id == repositories.c.id
+            )
+        ).where(
+            and_(
+                repositories.c.import_state == RepositoryImportState.CHECK_FOR_UPDATES,
+                page,
+                *conditions
+            )
+        ).order_by(
+            pull_requests.c.source_last_updated.desc(),
+            pull_requests.c.id.desc()
+        ).limit(
+            limit
+        )
+
+    branches = union_all(
+        # if it has never been synced and it is in the window
+        # select it always
+        candidates(
+            pull_requests.c.analytics_last_updated == None
+        ).alias('never_synced').select(),
+        # otherwise select the ones ones that have been successfully
+        # synced at least once, but the last analytics_sync was before the latest
+        # source sync, and the last source update is in the window.
+        candidates(
+            pull_requests.c.analytics_last_updated != None,
+            pull_requests.c.source_last_updated >= after,
+            pull_requests.c.source_last_updated > pull_requests.c.analytics_last_updated
+        ).alias('out_of_date').select()
+    ).alias('candidates')
+
+    return select([
+        branches.c.id
+    ]).order_by(
+        # order by source_last_updated, so we can page through the results
+        # if a limit is provided.
+        branches.c.source_last_updated.desc(),
+        branches.c.id.desc()
+    ).limit(
+        limit
+    )
+
+
+def get_pull_requests_to_sync_with_analytics(session, before=None, days=1, threshold_minutes=15, limit=100,
+                                             before_id=None):
     if before is None:
         # by default, we dont sync anything that was updated in the last threshold_minutes minutes
         # this way we dont try and sync things that were very recently updated.
@@ -192,8 +364,22 @@ def get_pull_requests_to_sync_with_analytics(session, before=None, days=1, thres
     # we pick only the items in the window [after, before]
     after = before - timedelta(days=days)
 
+    candidate_ids = [
+        row.id
+        for row in session.connection().execute(
+            pull_requests_to_sync_with_analytics_candidates(before, after, limit, before_id=before_id)
+        ).fetchall()
+    ]
+    if len(candidate_ids) == 0:
+        return dict(
+            success=True,
+            pull_requests=[]
+        )
+
+    # The full rows, descriptions included, are only fetched for the page being published.
     pull_requests_to_sync = [
         dict(
+            id=result.id,
             organization_key=result.organization_key,
             repository_key=result.repository_key,
             pull_request_summary=pull_request_summary(
@@ -213,32 +399,10 @@ def get_pull_requests_to_sync_with_analytics(session, before=None, days=1, thres
                     repositories, pull_requests.c.repository_id == repositories.c.id
                 )
             ).where(
-                or_(
-                    # if it has never been synced and it is in the window
-                    # select it always
-                    and_(
-                        repositories.c.import_state == RepositoryImportState.CHECK_FOR_UPDATES,
-                        pull_requests.c.analytics_last_updated == None,
-                        pull_requests.c.source_last_updated < before
-                    ),
-                    # otherwise select the ones ones that have been successfully
-                    # synced at least once, but the last analytics_sync was before the latest
-                    # source sync, and the last source update is in the window.
-                    and_(
-                      repositories.c.import_state == RepositoryImportState.CHECK_FOR_UPDATES,
-                      pull_requests.c.analytics_last_updated != None,
-                      pull_requests.c.source_last_updated < before,
-                      pull_requests.c.source_last_updated >= after,
-                      pull_requests.c.source_last_updated > pull_requests.c.analytics_last_updated
-                    )
-                )
-
+                pull_requests.c.id.in_(candidate_ids)
             ).order_by(
-                # order by source_last_updated, so we can page through the results
-                # if a limit is provided.
-                pull_requests.c.source_last_updated.desc()
-            ).limit(
-                limit
+                pull_requests.c.source_last_updated.desc(),
+                pull_requests.c.id.desc()
             )
         ).fetchall()
     ]
@@ -249,12 +413,34 @@ def get_pull_requests_to_sync_with_analytics(session, before=None, days=1, thres
     )
 
 
-def get_pull_requests_to_sync_with_source(session, before, days, limit):
-    if before is None:
-        before = datetime.utcnow()
+def get_pull_requests_to_sync_with_source(session, before, days, limit, before_id=None):
+    # Open pull requests that have not been updated at the source in the last `days` days
+    # are candidates for a sync. The cutoff is computed here rather than in the query so that the
+    # predicate is a plain range comparison on source_last_updated.
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    candidates = and_(
+        pull_requests.c.state == 'open',
+        repositories.c.public == False,
+        pull_requests.c.source_last_updated < cutoff
+    )
+    if before is not None:
+        if before_id is not None:
+            # page on (source_last_updated, id) so that pull requests sharing a timestamp
+            # across a page boundary are not skipped.
+            candidates = and_(
+                candidates,
+                tuple_(pull_requests.c.source_last_updated, pull_requests.c.id) < tuple_(before, before_id)
+            )
+        else:
+            candidates = and_(
+                candidates,
+                pull_requests.c.source_last_updated < before
+            )
 
     result = [
         dict(
+            id=record.id,
             organization_key=record.organization_key,
             repository_key=record.repository_key,
             pull_request_key=record.pull_request_key,
@@ -263,6 +449,7 @@ def get_pull_requests_to_sync_with_source(session, before, days, limit):
 
         for record in session.connection().execute(
             select([
+                pull_requests.c.id,
                 pull_requests.c.key.label('pull_request_key'),
                 repositories.c.key.label('repository_key'),
                 repositories.c.organization_key.label('organization_key'),
@@ -273,18 +460,14 @@ def get_pull_requests_to_sync_with_source(session, before, days, limit):
                     repositories, pull_requests.c.repository_id == repositories.c.id
                 )
             ).where(
-                and_(
-                    pull_requests.c.state == 'open',
-                    repositories.c.public == False,
-                    pull_requests.c.source_last_updated < before,
-                    func.extract('epoch', datetime.utcnow() - pull_requests.c.source_last_updated) > days * 24 * 3600
-                )
+                candidates
             ).order_by(
-                pull_requests.c.source_last_updated.desc()
+                pull_requests.c.source_last_updated.desc(),
+                pull_requests.c.id.desc()
             ).limit(
                 limit
             )
-        ).fetchall()
+        )
     ]
     return dict(
         success=True,
@@ -293,32 +476,51 @@ def get_pull_requests_to_sync_with_source(session, before, days, limit):
 
 
 def ack_pull_request_event(session, pull_request_summaries):
-    update_stmt = pull_requests.update().where(
-        and_(
-            pull_requests.c.key == bindparam('pull_request_key'),
-            # we dont want the sync dates to be monotonically non-decreasing so ignore
-            # acks that go back in time
-            or_(
-                pull_requests.c.analytics_last_updated == None,
-                pull_requests.c.analytics_last_updated < bindparam('analytics_last_updated')
-            )
-        )
-    ).values(
-        dict(
-            analytics_last_updated=bindparam('analytics_last_updated')
+    # All acks go to the database in one statement as a pair of arrays. When the same pull request
+    # is acked more than once, only the latest timestamp is applied.
+    acks = [
+        # updated_at for this message is timestamp for
+        # last time this was synced with analytics
+        (str(pr['key']), to_utc_naive(pr['updated_at']))
+        for pr in pull_request_summaries
+        if pr['updated_at'] is not None
+    ]
+    if len(acks) == 0:
+        return dict(
+            success=True,
+            updated=0
         )
-    )
+
+    ack = select([
+        func.unnest(
+            cast(bindparam('keys', value=[key for key, _ in acks]), ARRAY(UUID))
+        ).label('key'),
+        func.unnest(
+            cast(bindparam('analytics_last_updated', value=[updated_at for _, updated_at in acks]), ARRAY(DateTime))
+        ).label('analytics_last_updated')
+    ]).alias('ack')
+
+    latest_acks = select([
+        ack.c.key,
+        func.max(ack.c.analytics_last_updated).label('analytics_last_updated')
+    ]).group_by(
+        ack.c.key
+    ).alias('acks')
+
     updated = session.connection().execute(
-        update_stmt,
-        [
-            dict(
-                pull_request_key=pr['key'],
-                # source_last_updated for this message is timestamp for
-                # last time this was synced with analytics
-                analytics_last_updated=pr['updated_at']
+        pull_requests.update().where(
+            and_(
+                pull_requests.c.key == latest_acks.c.key,
+                # we dont want the sync dates to be monotonically non-decreasing so ignore
+                # acks that go back in time
+                or_(
+                    pull_requests.c.analytics_last_updated == None,
+                    pull_requests.c.analytics_last_updated < latest_acks.c.analytics_last_updated
+                )
             )
-            for pr in pull_request_summaries
-        ]
+        ).values(
+            analytics_last_updated=latest_acks.c.analytics_last_updated
+        )
     ).rowcount
 
     return dict(
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# The progress of the commit replays, one row per repository and replay in repos.replay_checkpoints,
+# so that a replay that is interrupted can resume after the last batch it sent. The table is not part
+# of the repos model and is created by install_replay_checkpoints. A row is removed once its replay
+# completes.
+
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, String, DateTime, PrimaryKeyConstraint, \
+    select, and_, text
+from sqlalchemy.dialects.postgresql import insert
+
+metadata = MetaData(schema='repos')
+
+replay_checkpoints = Table(
+    'replay_checkpoints', metadata,
+    Column('repository_id', BigInteger, nullable=False),
+    Column('replay', String, nullable=False),
+    Column('last_id', BigInteger, nullable=False),
+    Column('batches_sent', Integer, nullable=False),
+    Column('synced', BigInteger, nullable=False),
+    Column('started_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+    PrimaryKeyConstraint('repository_id', 'replay')
+)
+
+install_ddl = [
+    """
+    CREATE TABLE IF NOT EXISTS repos.replay_checkpoints (
+        repository_id BIGINT NOT NULL,
+        replay VARCHAR NOT NULL,
+        last_id BIGINT NOT NULL,
+        batches_sent INTEGER NOT NULL,
+        synced BIGINT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (repository_id, replay)
+    )
+    """
+]
+
+
+def install_replay_checkpoints(session):
+    for statement in install_ddl:
+        session.connection().execute(text(statement))
+
+
+def load_checkpoint(session, repository_id, replay):
+    checkpoint = session.connection().execute(
+        select([
+            replay_checkpoints.c.last_id,
+            replay_checkpoints.c.batches_sent,
+            replay_checkpoints.c.synced,
+            replay_checkpoints.c.started_at,
+            replay_checkpoints.c.updated_at
+        ]).where(
+            and_(
+                replay_checkpoints.c.repository_id == repository_id,
+                replay_checkpoints.c.replay == replay
+            )
+        )
+    ).fetchone()
+    return dict(checkpoint) if checkpoint is not None else None
+
+
+def save_checkpoint(session, repository_id, replay, last_id, batches_sent, synced, started_at):
+    checkpoint = dict(
+        last_id=last_id,
+        batches_sent=batches_sent,
+        synced=synced,
+        started_at=started_at,
+        updated_at=datetime.utcnow()
+    )
+    upsert = insert(replay_checkpoints).values(
+        repository_id=repository_id,
+        replay=replay,
+        **checkpoint
+    )
+    session.connection().execute(
+        upsert.on_conflict_do_update(
+            index_elements=[replay_checkpoints.c.repository_id, replay_checkpoints.c.replay],
+            set_=dict(
+                last_id=upsert.excluded.last_id,
+                batches_sent=upsert.excluded.batches_sent,
+                synced=upsert.excluded.synced,
+                started_at=upsert.excluded.started_at,
+                updated_at=upsert.excluded.updated_at
+            )
+        )
+    )
+    return checkpoint
+
+
+def clear_checkpoint(session, repository_id, replay):
+    return session.connection().execute(
+        replay_checkpoints.delete().where(
+            and_(
+                replay_checkpoints.c.repository_id == repository_id,
+                replay_checkpoints.c.replay == replay
+            )
+        )
+    ).rowcount
@@ -11,6 +11,7 @@ import uuid
 import logging
 
 from datetime import datetime
+from itertools import chain
 
 from sqlalchemy import select, and_, Column, Boolean
 from sqlalchemy.dialects.postgresql import insert
@@ -21,13 +22,18 @@ from polaris.repos.db.schema import RepositoryImportState
 from polaris.utils.exceptions import ProcessingException
 from polaris.utils.collections import find
 from polaris.common.db import row_proxy_to_dict
+from polaris.vcs.db.impl import bulk_load
 
 log = logging.getLogger('polaris.vcs.db.impl.repositories')
 
 
-def sync_repositories(session, organization_key, connector_key, source_repositories):
+def sync_repositories(session, organization_key, connector_key, source_repositories, use_copy=None):
     if organization_key is not None:
-        if len(source_repositories) > 0:
+        # source_repositories may be a generator, so it is checked for a first repository
+        # rather than counted, and streamed into the temp table from there.
+        source_repositories = iter(source_repositories)
+        first_repository = next(source_repositories, None)
+        if first_repository is not None:
             extra_columns = [
                     Column('exists_in_organization', Boolean())
             ]
@@ -49,24 +55,29 @@ def sync_repositories(session, organization_key, connector_key, source_repositor
                 extra_columns=extra_columns
             )
             repositories_temp.create(session.connection(), checkfirst=True)
-            session.connection().execute(
-                repositories_temp.insert([
-                    dict(
-                        key=uuid.uuid4(),
-                        organization_key=organization_key,
-                        connector_key=connector_key,
-                        import_state=RepositoryImportState.IMPORT_DISABLED,
-                        import_ready_state=RepositoryImportState.IMPORT_READY,
-                        update_ready_state=RepositoryImportState.UPDATE_READY,
-                        created_at=datetime.utcnow(),
-                        updated_at=datetime.utcnow(),
-                        source_data={},
-                        exists_in_organization=False,
-                        **source_repo
-                    )
-                    for source_repo in source_repositories
-                ])
+            now = datetime.utcnow()
+            temp_rows = (
+                dict(
+                    key=uuid.uuid4(),
+                    organization_key=organization_key,
+                    connector_key=connector_key,
+                    import_state=RepositoryImportState.IMPORT_DISABLED,
+                    import_ready_state=RepositoryImportState.IMPORT_READY,
+                    update_ready_state=RepositoryImportState.UPDATE_READY,
+                    created_at=now,
+                    updated_at=now,
+                    source_data={},
+                    exists_in_organization=False,
+                    **source_repo
+                )
+                for source_repo in chain([first_repository], source_repositories)
             )
+            if bulk_load.copy_enabled(use_copy):
+                bulk_load.copy_rows(session, repositories_temp, temp_rows)
+            else:
+                session.connection().execute(
+                    repositories_temp.insert(list(temp_rows))
+                )
             # We need to prevent multiple copies of the same repo being imported into the same
             # organization under different connectors. Ideally we would do this via a database constraint, but for legacy reasons,
             # we used to allow this early on, and it is hard to clean up old data without affecting active
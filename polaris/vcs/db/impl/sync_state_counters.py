@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Per repository counts of the commits that are still being processed (sync_state = 0), kept in
+# repos.repository_sync_state_counters so that the sync state summary of a repository is a single
+# row lookup instead of a count over repos.commits.
+#
+# The counters are maintained by statement level triggers on repos.commits. Each statement applies the
+# net change per repository from its transition tables as one upsert, so a bulk insert of commits
+# costs one counter update per repository rather than one per commit. reconcile_sync_state_counters
+# recounts from repos.commits and corrects any drift, and is run periodically by the
+# SyncStateCounterReconcileAgent.
+
+import logging
+
+from sqlalchemy import MetaData, Table, Column, BigInteger, DateTime, text
+
+logger = logging.getLogger('polaris.vcs.db.impl.sync_state_counters')
+
+metadata = MetaData(schema='repos')
+
+repository_sync_state_counters = Table(
+    'repository_sync_state_counters', metadata,
+    Column('repository_id', BigInteger, primary_key=True),
+    Column('commits_in_process', BigInteger, nullable=False, server_default='0'),
+    Column('reconciled_at', DateTime, nullable=True)
+)
+
+# Applies the per repository delta of a statement. Deltas are upserted in repository_id order so
+# that concurrent statements lock the counter rows in the same order.
+apply_deltas = """
+        INSERT INTO repos.repository_sync_state_counters AS counters (repository_id, commits_in_process)
+        SELECT repository_id, sum(delta) FROM ({deltas}) AS deltas
+        GROUP BY repository_id
+        HAVING sum(delta) <> 0
+        ORDER BY repository_id
+        ON CONFLICT (repository_id) DO UPDATE
+        SET commits_in_process = counters.commits_in_process + excluded.commits_in_process;
+"""
+
+added = "SELECT repository_id, 1 AS delta FROM new_commits WHERE sync_state = 0"
+removed = "SELECT repository_id, -1 AS delta FROM old_commits WHERE sync_state = 0"
+
+install_ddl = [
+    """
+    CREATE TABLE IF NOT EXISTS repos.repository_sync_state_counters (
+        repository_id BIGINT PRIMARY KEY,
+        commits_in_process BIGINT NOT NULL DEFAULT 0,
+        reconciled_at TIMESTAMP
+    )
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION repos.update_repository_sync_state_counters() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {apply_deltas.format(deltas=added)}
+        ELSIF TG_OP = 'DELETE' THEN
+            {apply_deltas.format(deltas=removed)}
+        ELSE
+            {apply_deltas.format(deltas=f'{added} UNION ALL {removed}')}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    # Transition tables can not be combined with a column list, so updates of any column fire the
+    # trigger. Statements that do not change sync_state produce no deltas and write nothing.
+    "DROP TRIGGER IF EXISTS commits_sync_state_counters_insert ON repos.commits",
+    """
+    CREATE TRIGGER commits_sync_state_counters_insert
+    AFTER INSERT ON repos.commits
+    REFERENCING NEW TABLE AS new_commits
+    FOR EACH STATEMENT EXECUTE PROCEDURE repos.update_repository_sync_state_counters()
+    """,
+    "DROP TRIGGER IF EXISTS commits_sync_state_counters_update ON repos.commits",
+    """
+    CREATE TRIGGER commits_sync_state_counters_update
+    AFTER UPDATE ON repos.commits
+    REFERENCING OLD TABLE AS old_commits NEW TABLE AS new_commits
+    FOR EACH STATEMENT EXECUTE PROCEDURE repos.update_repository_sync_state_counters()
+    """,
+    "DROP TRIGGER IF EXISTS commits_sync_state_counters_delete ON repos.commits",
+    """
+    CREATE TRIGGER commits_sync_state_counters_delete
+    AFTER DELETE ON repos.commits
+    REFERENCING OLD TABLE AS old_commits
+    FOR EACH STATEMENT EXECUTE PROCEDURE repos.update_repository_sync_state_counters()
+    """
+]
+
+
+def install_sync_state_counters(session):
+    for statement in install_ddl:
+        session.connection().execute(text(statement))
+    # the table may have outlived the repositories it counted.
+    remove_orphaned_counters(session)
+
+
+def get_repository_ids(session):
+    return [
+        row.id
+        for row in session.connection().execute(
+            text("SELECT id FROM repos.repositories ORDER BY id")
+        ).fetchall()
+    ]
+
+
+def reconcile_sync_state_counters(session, repository_ids):
+    """
+    Recounts the commits in process for the given repositories and corrects their counters.
+    The counter rows are locked before counting, so that commits written by transactions that were
+    in flight when the reconciliation started are counted once, either by the recount or by the
+    trigger that fires after the lock is released.
+    """
+    if len(repository_ids) == 0:
+        return dict(success=True, reconciled=0, corrected=0)
+
+    connection = session.connection()
+    connection.execute(
+        text(
+            "INSERT INTO repos.repository_sync_state_counters (repository_id, commits_in_process) "
+            "SELECT unnest(CAST(:repository_ids AS BIGINT[])), 0 "
+            "ON CONFLICT (repository_id) DO NOTHING"
+        ),
+        repository_ids=repository_ids
+    )
+    current = {
+        row.repository_id: row.commits_in_process
+        for row in connection.execute(
+            text(
+                "SELECT repository_id, commits_in_process FROM repos.repository_sync_state_counters "
+                "WHERE repository_id = ANY(CAST(:repository_ids AS BIGINT[])) "
+                "ORDER BY repository_id FOR UPDATE"
+            ),
+            repository_ids=repository_ids
+        ).fetchall()
+    }
+    reconciled = connection.execute(
+        text(
+            """
+            UPDATE repos.repository_sync_state_counters AS counters
+            SET commits_in_process = coalesce(counts.commits_in_process, 0), reconciled_at = now() AT TIME ZONE 'UTC'
+            FROM unnest(CAST(:repository_ids AS BIGINT[])) AS reconciled(repository_id)
+            LEFT JOIN (
+                SELECT repository_id, count(id) AS commits_in_process
+                FROM repos.commits
+                WHERE repository_id = ANY(CAST(:repository_ids AS BIGINT[])) AND sync_state = 0
+                GROUP BY repository_id
+            ) AS counts ON counts.repository_id = reconciled.repository_id
+            WHERE counters.repository_id = reconciled.repository_id
+            RETURNING counters.repository_id, counters.commits_in_process
+            """
+        ),
+        repository_ids=repository_ids
+    ).fetchall()
+
+    corrected = 0
+    for row in reconciled:
+        if current.get(row.repository_id) != row.commits_in_process:
+            logger.info(
+                f'Corrected commits in process for repository {row.repository_id} '
+                f'from {current.get(row.repository_id)} to {row.commits_in_process}'
+            )
+            corrected = corrected + 1
+
+    return dict(
+        success=True,
+        reconciled=len(reconciled),
+        corrected=corrected
+    )
+
+
+def remove_orphaned_counters(session):
+    return session.connection().execute(
+        text(
+            "DELETE FROM repos.repository_sync_state_counters "
+            "WHERE repository_id NOT IN (SELECT id FROM repos.repositories)"
+        )
+    ).rowcount
@@ -71,6 +71,15 @@ def init_connector(app):
     @ac.lifecycle("disabled")
     def lifecycle_disabled(client):
         log.info(f'Connector disabled: {client.baseUrl} ({client.clientKey})')
+        connector_record = load_atlassian_connect_record(client.clientKey)
+        if connector_record:
+            # the message listener caches connectors, so let it know this one is no longer usable.
+            publish.connector_event(
+                connector_key=connector_record.key,
+                connector_type=connector_record.type,
+                product_type=connector_record.product_type,
+                event='disabled'
+            )
 
     @ac.webhook("repo:created")
     def handle_repo_created(client, event):
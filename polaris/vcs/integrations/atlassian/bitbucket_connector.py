@@ -14,6 +14,7 @@ from polaris.common.enums import VcsIntegrationTypes
 from polaris.integrations.atlassian_connect import BitBucketBaseConnector
 from polaris.utils.exceptions import ProcessingException
 from polaris.common.enums import BitbucketPullRequestState
+from polaris.vcs.integrations.fetch import prefetch_pages, get_rate_limiter
 
 log = logging.getLogger('polaris.vcs.bitbucket_connector')
 
@@ -24,6 +25,13 @@ class BitBucketConnector(BitBucketBaseConnector):
         super().__init__(connector)
         self.base_url = f'{connector.base_url}'
         self.atlassian_account_key = connector.atlassian_account_key
+        # read here, not in the page generators, which run on the prefetch thread.
+        self.connector_name = connector.name
+
+    def get(self, *args, **kwargs):
+        # All Bitbucket api calls from this service go through get, so this is where
+        # they are scheduled against the connector's rate limit budget.
+        return get_rate_limiter(self.key).call(super().get, *args, **kwargs)
 
     def test(self):
         fetch_repos_url = f'/2.0/repositories/{{{self.atlassian_account_key}}}'
@@ -70,7 +78,7 @@ class BitBucketConnector(BitBucketBaseConnector):
             else:
                 log.error(
                     f'Bitbucket Fetch repositories failed: '
-                    f'{self.connector.name}: {fetch_repos_url} {response.text} ({response.status_code})'
+                    f'{self.connector_name}: {fetch_repos_url} {response.text} ({response.status_code})'
                 )
                 raise ProcessingException(
                     f'Bitbucket Fetch repositories failed: '
@@ -100,7 +108,7 @@ class BitBucketConnector(BitBucketBaseConnector):
         )
 
     def fetch_repositories_from_source(self, url=None):
-        for repositories in self.fetch_repositories(url):
+        for repositories in prefetch_pages(self.fetch_repositories(url), connector_key=self.key):
             yield [
                 self.map_repository_info(repo)
                 for repo in repositories
@@ -133,6 +141,7 @@ class BitBucketRepository(PolarisBitBucketRepository):
         self.base_url = f'{connector.base_url}'
         self.atlassian_account_key = connector.atlassian_account_key
         self.connector = connector
+        self.connector_key = connector.key
         self.repo_url = f'/2.0/repositories/{{{self.atlassian_account_key}}}/{{{self.source_repo_id.strip("{}")}}}'
 
     def map_pull_request_info(self, pull_request):
@@ -184,7 +193,7 @@ class BitBucketRepository(PolarisBitBucketRepository):
             else:
                 log.error(
                     f'Bitbucket fetch pull requests failed: '
-                    f'{self.connector.name}: {fetch_pull_requests_url} {response.text} ({response.status_code})'
+                    f'{self.connector.connector_name}: {fetch_pull_requests_url} {response.text} ({response.status_code})'
                 )
                 raise ProcessingException(
                     f'Bitbucket fetch pull requests failed: '
@@ -205,7 +214,7 @@ class BitBucketRepository(PolarisBitBucketRepository):
         else:
             log.error(
                 f'Bitbucket fetch pull request failed: '
-                f'{self.connector.name}: {fetch_pull_requests_url} {response.text} ({response.status_code})'
+                f'{self.connector.connector_name}: {fetch_pull_requests_url} {response.text} ({response.status_code})'
             )
             raise ProcessingException(
                 f'Bitbucket fetch pull request failed: '
@@ -214,7 +223,7 @@ class BitBucketRepository(PolarisBitBucketRepository):
 
     def fetch_pull_requests_from_source(self, source_id=None):
         if source_id is None:
-            for pull_requests in self.fetch_pull_requests():
+            for pull_requests in prefetch_pages(self.fetch_pull_requests(), connector_key=self.connector.key):
                 yield [
                     self.map_pull_request_info(pr)
                     for pr in pull_requests
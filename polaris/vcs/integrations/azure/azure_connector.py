@@ -9,7 +9,6 @@
 # Author: Krishna Kumar
 
 import logging
-import requests
 
 from datetime import datetime, timedelta
 
@@ -17,6 +16,7 @@ from polaris.utils.config import get_config_provider
 from polaris.integrations.azure import AzureConnector
 from polaris.utils.exceptions import ProcessingException
 from polaris.common.enums import VcsIntegrationTypes
+from polaris.vcs.integrations.fetch import prefetch_pages, get_session
 
 config_provider = get_config_provider()
 logger = logging.getLogger('polaris.vcs.integrations.azure')
@@ -60,7 +60,7 @@ class AzureRepositoriesConnector(AzureConnector):
     def fetch_repositories(self, continuation_token=None):
         if self.personal_access_token is not None:
             page = f"&continuationToken={continuation_token}" if continuation_token else ""
-            response = requests.get(
+            response = get_session(self.key).get(
                 self.build_org_url(f'git/repositories?includeAllUrls=True{page}'),
                 headers=self.get_standard_headers()
             )
@@ -76,19 +76,10 @@ class AzureRepositoriesConnector(AzureConnector):
         else:
             raise ProcessingException("No access token found for this Azure Connector. Cannot continue.")
 
-    def fetch_repositories_from_source(self):
-        logger.info(
-            f'Refresh Repositories: Fetching repositories for connector {self.name} in organization {self.organization_key}')
+    def fetch_repository_pages(self):
         response = self.fetch_repositories()
-        count = 0
         while True:
-            repos = [
-                self.map_repository_info(repo)
-                for repo in response.get('repos')
-            ]
-            count = count + response.get('count')
-
-            yield repos
+            yield response
             # Note: The pagination mechanism here is untested since there
             # is no documentation for how this api is supposed to paginate its
             # result. The best that can be gleaned from reading the interwebs
@@ -110,6 +101,20 @@ class AzureRepositoriesConnector(AzureConnector):
                 response = self.fetch_repositories(response.get('continuation_token'))
             else:
                 break
+
+    def fetch_repositories_from_source(self):
+        logger.info(
+            f'Refresh Repositories: Fetching repositories for connector {self.name} in organization {self.organization_key}')
+        count = 0
+        for response in prefetch_pages(self.fetch_repository_pages(), connector_key=self.key):
+            repos = [
+                self.map_repository_info(repo)
+                for repo in response.get('repos')
+            ]
+            count = count + response.get('count')
+
+            yield repos
+
         logger.info(
             f"Refresh Repositories: Fetched {count} repositories in total for connector {self.name} in organization {self.organization_key}")
 
@@ -129,7 +134,7 @@ class AzureRepositoriesConnector(AzureConnector):
         )
 
     def register_azure_repository_subscription(self, azure_webhooks_endpoint, event_type, repo_source_id):
-        response = requests.post(
+        response = get_session(self.key).post(
             self.build_org_url(f'hooks/subscriptions'),
             headers=self.get_post_headers(),
             json=dict(
@@ -166,7 +171,7 @@ class AzureRepositoriesConnector(AzureConnector):
         return registered_webhooks
 
     def delete_azure_repository_subscription(self, repo_source_id, subscription):
-        response = requests.delete(
+        response = get_session(self.key).delete(
             self.build_org_url(f"hooks/subscriptions/{subscription.get('subscription_id')}"),
             headers=self.get_standard_headers(),
         )
@@ -200,7 +205,14 @@ class AzureRepository(PolarisAzureRepository):
         self.last_updated = repository.latest_pull_request_update_timestamp \
             if repository.latest_pull_request_update_timestamp is not None \
             else datetime.utcnow() - timedelta(days=INITIAL_IMPORT_DAYS)
+        # Pages are fetched on a prefetch thread, so the values we need from the repository
+        # are read here rather than through the orm instance while fetching.
+        self.repository_name = repository.name
+        self.repository_url = repository.url
+        self.organization_key = repository.organization_key
+        self.properties = dict(repository.properties or {})
         self.connector = connector
+        self.connector_key = connector.key
         self.pull_request_state_map = dict(
             active='open',
             completed='closed',
@@ -243,11 +255,11 @@ class AzureRepository(PolarisAzureRepository):
             target_branch=pull_request.get('targetRefName', "").replace('refs/heads/', ''),
             source_repository_source_id=source_repository_id,
             target_repository_source_id=target_repository_id,
-            web_url=f"{self.repository.url}/pullrequest/{pull_request['pullRequestId']}"
+            web_url=f"{self.repository_url}/pullrequest/{pull_request['pullRequestId']}"
         )
 
     def fetch_pull_requests(self, status, top=50, skip=0, ):
-        response = requests.get(
+        response = get_session(self.connector.key).get(
             self.connector.build_org_url(
                 f'/git/repositories/{self.source_repo_id}/pullrequests'
             ),
@@ -271,17 +283,29 @@ class AzureRepository(PolarisAzureRepository):
         else:
             raise ProcessingException(
                 f'Fetching Pull Requests for status {status} from source api failed: '
-                f' repository {self.repository.name} in organization {self.repository.organization_key}'
+                f' repository {self.repository_name} in organization {self.organization_key}'
                 f' Response Code: {response.status_code} Response Text: {response.text}')
 
+    def fetch_pull_request_pages(self, status):
+        # Pages are requested by $skip, so the offset of the next page is known
+        # before the current page has been mapped, which is what lets us prefetch it.
+        skip = 0
+        while True:
+            response = self.fetch_pull_requests(status=status, skip=skip)
+            yield response
+            if len(response.get('pull_requests')) > 0:
+                skip = skip + len(response.get('pull_requests'))
+            else:
+                break
+
     def fetch_completed_pull_requests(self, days=30):
         logger.info(
-            f'Fetching Completed Pull Requests:  repository {self.repository.name} in organization {self.repository.organization_key}')
+            f'Fetching Completed Pull Requests:  repository {self.repository_name} in organization {self.organization_key}')
 
-        response = self.fetch_pull_requests(status='completed')
         count = 0
         search_window = datetime.utcnow() - timedelta(days=days)
-        while True:
+        responses = prefetch_pages(self.fetch_pull_request_pages(status='completed'), connector_key=self.connector.key)
+        for response in responses:
             pull_requests = [
                 self.map_pull_request_info(pull_request)
                 for pull_request in response.get('pull_requests')
@@ -295,21 +319,21 @@ class AzureRepository(PolarisAzureRepository):
 
             yield pull_requests
 
-            if 0 < response.get('count') == len(pull_requests):
-                response = self.fetch_pull_requests(skip=count, status='completed')
-            else:
+            if not 0 < response.get('count') == len(pull_requests):
+                # the next page was fetched speculatively, but everything on it is
+                # outside the search window.
+                responses.close()
                 break
 
         logger.info(
-            f"{count} completed pull_requests fetched for repository {self.repository.name} in organization {self.repository.organization_key}")
+            f"{count} completed pull_requests fetched for repository {self.repository_name} in organization {self.organization_key}")
 
     def fetch_active_pull_requests(self):
         logger.info(
-            f'Fetching Active Pull Requests:  repository {self.repository.name} in organization {self.repository.organization_key}')
+            f'Fetching Active Pull Requests:  repository {self.repository_name} in organization {self.organization_key}')
 
-        response = self.fetch_pull_requests(status='active')
         count = 0
-        while True:
+        for response in prefetch_pages(self.fetch_pull_request_pages(status='active'), connector_key=self.connector.key):
             pull_requests = [
                 self.map_pull_request_info(pull_request)
                 for pull_request in response.get('pull_requests')
@@ -318,18 +342,13 @@ class AzureRepository(PolarisAzureRepository):
 
             yield pull_requests
 
-            if len(pull_requests) > 0:
-                response = self.fetch_pull_requests(skip=count, status='active')
-            else:
-                break
-
         logger.info(
-            f"{count} active pull_requests fetched for repository {self.repository.name} in organization {self.repository.organization_key}")
+            f"{count} active pull_requests fetched for repository {self.repository_name} in organization {self.organization_key}")
 
     def fetch_pull_request(self, pull_request_source_id):
         logger.info(
-            f'Fetching Pull Request {pull_request_source_id}:  repository {self.repository.name} in organization {self.repository.organization_key}')
-        response = requests.get(
+            f'Fetching Pull Request {pull_request_source_id}:  repository {self.repository_name} in organization {self.organization_key}')
+        response = get_session(self.connector.key).get(
             self.connector.build_org_url(
                 f'/git/repositories/{self.source_repo_id}/pullrequests/{pull_request_source_id}'
             ),
@@ -337,7 +356,7 @@ class AzureRepository(PolarisAzureRepository):
         )
         if response.status_code == 200:
             logger.info(
-                f'Fetched Pull Request {pull_request_source_id}:  repository {self.repository.name} in organization {self.repository.organization_key}'
+                f'Fetched Pull Request {pull_request_source_id}:  repository {self.repository_name} in organization {self.organization_key}'
             )
             pull_request = response.json()
             yield [
@@ -346,13 +365,13 @@ class AzureRepository(PolarisAzureRepository):
         else:
             raise ProcessingException(
                 f'Fetching Pull Request {pull_request_source_id}  from source api failed: '
-                f' repository {self.repository.name} in organization {self.repository.organization_key}'
+                f' repository {self.repository_name} in organization {self.organization_key}'
                 f' Response Code: {response.status_code} Response Text: {response.text}'
             )
 
 
     def fetch_pull_requests_from_source(self, pull_request_source_id=None):
-        search_window = self.repository.properties.get('pull_requests_search_window', 30)
+        search_window = self.properties.get('pull_requests_search_window', 30)
         if pull_request_source_id is None:
             # first fetch all the completed pull requests
             yield from self.fetch_completed_pull_requests(days=search_window)
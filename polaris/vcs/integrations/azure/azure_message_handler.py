@@ -8,19 +8,18 @@
 
 # Author: Krishna Kumar
 
-import json
 import logging
 import re
 from polaris.common import db
 from polaris.repos.db.model import Repository, PullRequest
-from polaris.vcs.messaging import publish
+from polaris.vcs.messaging import publish, payloads, pull_request_events
 from polaris.utils.exceptions import ProcessingException
 
 logger = logging.getLogger('polaris.vcs.integrations.azure.azure_message_handler')
 
 
 def handle_azure_repository_push(connector_key, payload, channel=None):
-    event = json.loads(payload)
+    event = payloads.loads(payload)
     if 'resource' in event:
         resource_url = event.get('resource').get('url')
         match = re.fullmatch(r"^https://.*/repositories/(?P<repo_source_id>.*)/pushes/.*$", resource_url)
@@ -31,8 +30,8 @@ def handle_azure_repository_push(connector_key, payload, channel=None):
             raise ProcessingException(f"Invalid resource_url {resource_url} received for azure repository push")
 
 
-def handle_azure_pull_request_event(connector_key, payload, channel=None):
-    event = json.loads(payload)
+def handle_azure_pull_request_event(connector_key, payload, channel=None, batch=None):
+    event = payloads.loads(payload)
     if 'resource' in event:
         resource_url = event.get('resource').get('url')
         match = re.fullmatch(
@@ -44,11 +43,11 @@ def handle_azure_pull_request_event(connector_key, payload, channel=None):
                 repo_source_id = match['repo_source_id']
                 repo = Repository.find_by_connector_key_source_id(session, connector_key, repo_source_id )
                 if repo is not None:
-                    publish.sync_pull_request(
+                    pull_request_events.request_pull_request_sync(
                         repo.organization_key,
                         repo.key,
-                        pull_request_key=None,
-                        pull_request_source_id=match['pr_source_id']
+                        pull_request_source_id=match['pr_source_id'],
+                        batch=batch
                     )
                 else:
                     raise ProcessingException(f'handle_azure_pull_request: Could not find repo with source id'
@@ -60,10 +59,10 @@ def handle_azure_pull_request_event(connector_key, payload, channel=None):
             raise ProcessingException(f"Invalid resource_url {resource_url} received for azure repository push")
 
 
-def handle_azure_event(connector_key, event_type, payload, channel=None):
+def handle_azure_event(connector_key, event_type, payload, channel=None, batch=None):
     if event_type == 'git.push':
         return handle_azure_repository_push(connector_key, payload, channel)
     elif 'pullrequest' in event_type:
-        return handle_azure_pull_request_event(connector_key, payload, channel)
+        return handle_azure_pull_request_event(connector_key, payload, channel, batch)
     else:
         raise ProcessingException(f"Unrecognized azure event type {event_type}")
\ No newline at end of file
@@ -10,21 +10,36 @@
 
 import logging
 from flask import Blueprint, request
-from polaris.vcs.messaging import publish
+from polaris.vcs.messaging import publish, payloads
 
 logger = logging.getLogger('polaris.vcs.integrations.github.webhook')
 
 webhook = Blueprint('azure_webhooks', __name__)
 
 
+def resolve_event_type(body):
+    # Azure does not send the event type as a header, but eventType is near the top of every
+    # service hook payload, so it can be read without decoding the body.
+    event_type = payloads.sniff_string_field(body, 'eventType')
+    if event_type is None and body:
+        try:
+            req_data = payloads.loads(body)
+        except ValueError:
+            return None
+        if isinstance(req_data, dict):
+            event_type = req_data.get('eventType')
+    return event_type
+
+
 @webhook.route(f"/repository/webhooks/<connector_key>/", methods=('GET', 'POST'))
 def repository_webhook(connector_key):
     logger.info('Received webhook event @repository/webhooks')
-    req_data = request.json
-    if req_data is not None:
-        publish.azure_repository_event(req_data.get('eventType'), connector_key, request.data)
+    body = request.get_data(as_text=True)
+    event_type = resolve_event_type(body)
+    if event_type is not None:
+        publish.azure_repository_event(event_type, connector_key, body)
     else:
-        logger.error(f'Invalid webhook request: {request.text}')
+        logger.error(f'Invalid webhook request: {body}')
 
     return ''
 
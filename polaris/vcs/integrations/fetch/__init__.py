@@ -0,0 +1,4 @@
+from .paging import prefetch_pages, connector_fetch_slot
+from .sessions import get_session, close_session
+from .rate_limits import get_rate_limiter, get_remaining_budget, log_remaining_budget
+from .conditional_cache import conditional_get, get_conditional_cache
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# A cache of the provider pages we have fetched, so that repository listings can be re-requested with
+# ETag/Last-Modified validators and served from the cache when the provider answers 304 Not Modified.
+#
+# The cache is off unless CONNECTOR_HTTP_CACHE_PATH names the sqlite file to keep it in. The file holds
+# the response bodies as they came from the provider, which includes the listings of private repositories,
+# and it is not encrypted. Point it at a volume that is private to the service: the file is created readable
+# by its owner only, but the directory it lives in is left as it is. Entries expire after
+# CONNECTOR_HTTP_CACHE_TTL seconds, and the least recently used entries are removed once there are more than
+# CONNECTOR_HTTP_CACHE_MAX_ENTRIES.
+#
+# Only use conditional_get for urls that are requested again with the same query. A query that changes on
+# every run, (eg. one filtered by the time of the last sync), can never be served from the cache.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from polaris.utils.config import get_config_provider
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.integrations.fetch.conditional_cache')
+
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+DEFAULT_CACHE_MAX_ENTRIES = 10000
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CachedPage:
+    """
+    Stands in for a requests response when the provider tells us a page has not changed, so that
+    the paging code can treat cached and fetched pages the same way.
+    """
+
+    def __init__(self, body, next_url):
+        self.ok = True
+        self.status_code = 200
+        self.text = body
+        self.links = dict(next=dict(url=next_url)) if next_url is not None else {}
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ConditionalRequestCache:
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        self.path = path
+        self.ttl = int(ttl or config_provider.get('CONNECTOR_HTTP_CACHE_TTL', DEFAULT_CACHE_TTL))
+        self.max_entries = int(
+            max_entries or config_provider.get('CONNECTOR_HTTP_CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES)
+        )
+        self.lock = threading.Lock()
+        # create the file readable by the service only before sqlite opens it.
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS conditional_requests ('
+            'connector_key TEXT NOT NULL, '
+            'url TEXT NOT NULL, '
+            'etag TEXT, '
+            'last_modified TEXT, '
+            'body TEXT NOT NULL, '
+            'next_url TEXT, '
+            'updated_at REAL NOT NULL, '
+            'PRIMARY KEY (connector_key, url))'
+        )
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS conditional_requests_updated_at ON conditional_requests (updated_at)'
+        )
+        self.db.commit()
+
+    def get(self, connector_key, url):
+        with self.lock:
+            return self.db.execute(
+                'SELECT etag, last_modified, body, next_url FROM conditional_requests '
+                'WHERE connector_key = ? AND url = ? AND updated_at >= ?',
+                (connector_key, url, time.time() - self.ttl)
+            ).fetchone()
+
+    def touch(self, connector_key, url):
+        # a page that was served from the cache is as good as one that was just fetched.
+        with self.lock:
+            self.db.execute(
+                'UPDATE conditional_requests SET updated_at = ? WHERE connector_key = ? AND url = ?',
+                (time.time(), connector_key, url)
+            )
+            self.db.commit()
+
+    def put(self, connector_key, url, etag, last_modified, body, next_url):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO conditional_requests '
+                '(connector_key, url, etag, last_modified, body, next_url, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (connector_key, url, etag, last_modified, body, next_url, time.time())
+            )
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        # called with the lock held.
+        expired = self.db.execute(
+            'DELETE FROM conditional_requests WHERE updated_at < ?', (time.time() - self.ttl,)
+        ).rowcount
+        overflow = self.db.execute(
+            'DELETE FROM conditional_requests WHERE rowid IN ('
+            'SELECT rowid FROM conditional_requests ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        ).rowcount
+        if expired + overflow > 0:
+            logger.debug(f'Evicted {expired} expired and {overflow} least recently used cached pages')
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT count(*) FROM conditional_requests').fetchone()[0]
+
+    def invalidate(self, connector_key):
+        with self.lock:
+            self.db.execute('DELETE FROM conditional_requests WHERE connector_key = ?', (connector_key,))
+            self.db.commit()
+
+
+def get_conditional_cache():
+    global _cache
+    path = config_provider.get('CONNECTOR_HTTP_CACHE_PATH', None)
+    if path is None:
+        return None
+
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = ConditionalRequestCache(path)
+        return _cache
+
+
+def conditional_get(session, connector_key, url, params=None, headers=None):
+    """
+    GETs a page, sending the ETag/Last-Modified validators from the last time we fetched the same
+    url for this connector. When the provider answers 304 Not Modified, the stored page is returned
+    instead. Without a configured CONNECTOR_HTTP_CACHE_PATH this is a plain session.get.
+    """
+    cache = get_conditional_cache()
+    if cache is None:
+        return session.get(url, params=params, headers=headers)
+
+    connector_key = str(connector_key)
+    cache_url = requests.Request('GET', url, params=params).prepare().url
+    request_headers = dict(headers or {})
+    cached = cache.get(connector_key, cache_url)
+    if cached is not None:
+        etag, last_modified, _, _ = cached
+        if etag is not None:
+            request_headers['If-None-Match'] = etag
+        if last_modified is not None:
+            request_headers['If-Modified-Since'] = last_modified
+
+    response = session.get(url, params=params, headers=request_headers)
+    if response.status_code == 304 and cached is not None:
+        logger.debug(f'Not modified: {cache_url}')
+        cache.touch(connector_key, cache_url)
+        _, _, body, next_url = cached
+        return CachedPage(body, next_url)
+
+    if response.ok:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            next_link = response.links.get('next')
+            cache.put(
+                connector_key,
+                cache_url,
+                etag,
+                last_modified,
+                response.text,
+                next_link['url'] if next_link is not None else None
+            )
+
+    return response
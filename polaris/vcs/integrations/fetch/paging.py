@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+from polaris.utils.config import get_config_provider
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.integrations.fetch.paging')
+
+DEFAULT_FETCH_CONCURRENCY = 4
+DEFAULT_PREFETCH_PAGES = 1
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+_end_of_pages = object()
+
+
+def get_connector_semaphore(connector_key):
+    with _semaphores_lock:
+        semaphore = _semaphores.get(connector_key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                int(config_provider.get('CONNECTOR_FETCH_CONCURRENCY', DEFAULT_FETCH_CONCURRENCY))
+            )
+            _semaphores[connector_key] = semaphore
+        return semaphore
+
+
+@contextmanager
+def connector_fetch_slot(connector_key):
+    """
+    Limits the number of provider requests that are in flight at the same time for a single connector
+    across all the threads in this process.
+    """
+    if connector_key is None:
+        yield
+    else:
+        with get_connector_semaphore(str(connector_key)):
+            yield
+
+
+class _PageFetchError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _fetch_pages(pages, connector_key, buffer, stopped):
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        while not stopped.is_set():
+            with connector_fetch_slot(connector_key):
+                page = next(pages, _end_of_pages)
+            if page is _end_of_pages or not put(page):
+                break
+    except Exception as exc:
+        put(_PageFetchError(exc))
+        return
+    finally:
+        close = getattr(pages, 'close', None)
+        if close is not None:
+            close()
+
+    put(_end_of_pages)
+
+
+def prefetch_pages(pages, connector_key=None, prefetch=None):
+    """
+    Wraps a generator of pages fetched from a provider api so that the next pages are fetched on a
+    background thread while the caller maps and writes the current page. Exceptions raised while
+    fetching are re-raised in the caller when it reaches the page that failed.
+
+    The generator is only advanced while holding the connector's fetch slot, so the per connector
+    concurrency limit applies no matter how many syncs are running.
+
+    The generator runs on the background thread, so it must not touch orm instances that belong to
+    the caller's session, (a lazy load or a refresh of an expired attribute would use the session
+    from the wrong thread). Read whatever the generator needs from them before it is passed in.
+    """
+    if prefetch is None:
+        prefetch = int(config_provider.get('CONNECTOR_PREFETCH_PAGES', DEFAULT_PREFETCH_PAGES))
+
+    pages = iter(pages)
+    if prefetch <= 0:
+        while True:
+            with connector_fetch_slot(connector_key):
+                page = next(pages, _end_of_pages)
+            if page is _end_of_pages:
+                return
+            yield page
+
+    buffer = queue.Queue(maxsize=prefetch)
+    stopped = threading.Event()
+    fetcher = threading.Thread(
+        target=_fetch_pages,
+        args=(pages, connector_key, buffer, stopped),
+        name=f'prefetch-pages-{connector_key}',
+        daemon=True
+    )
+    fetcher.start()
+    try:
+        while True:
+            page = buffer.get()
+            if page is _end_of_pages:
+                break
+            if isinstance(page, _PageFetchError):
+                raise page.exc
+            yield page
+    finally:
+        # The caller may stop early, (eg. once it has seen pages older than the last sync),
+        # in which case we tell the fetcher to drop whatever it is holding and exit.
+        stopped.set()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from polaris.utils.config import get_config_provider
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.integrations.fetch.rate_limits')
+
+DEFAULT_REQUESTS_PER_SECOND = 10
+DEFAULT_BURST = 20
+DEFAULT_MAX_RATE_LIMIT_RETRIES = 5
+# Longest we will wait for a provider budget to reset before giving up.
+MAX_WAIT_SECONDS = 3600
+
+# Header names are checked in order, first match wins. GitHub and Bitbucket use X-RateLimit-*,
+# GitLab uses RateLimit-*, Azure uses X-RateLimit-* plus X-RateLimit-Delay when it is throttling.
+REMAINING_HEADERS = ['X-RateLimit-Remaining', 'RateLimit-Remaining']
+LIMIT_HEADERS = ['X-RateLimit-Limit', 'RateLimit-Limit']
+RESET_HEADERS = ['X-RateLimit-Reset', 'RateLimit-Reset']
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def header_value(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+
+
+def get_max_rate_limit_retries():
+    return int(config_provider.get('CONNECTOR_RATE_LIMIT_RETRIES', DEFAULT_MAX_RATE_LIMIT_RETRIES))
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reset(value, now):
+    # Providers send either an epoch timestamp or a number of seconds until the reset.
+    reset = parse_number(value)
+    if reset is None:
+        return None
+    return reset if reset > 1e9 else now + reset
+
+
+def parse_retry_after(value, now):
+    seconds = parse_number(value)
+    if seconds is not None:
+        return now + seconds
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ConnectorRateLimiter:
+    """
+    A token bucket for the requests made on behalf of a single connector. The bucket refills at a
+    configured rate, and the budget the provider reports in its response headers takes precedence:
+    once the provider budget is exhausted, callers wait for its reset time instead of burning requests
+    on 403/429 responses.
+    """
+
+    def __init__(self, connector_key, requests_per_second=None, burst=None):
+        self.connector_key = connector_key
+        self.requests_per_second = float(
+            requests_per_second or config_provider.get('CONNECTOR_REQUESTS_PER_SECOND', DEFAULT_REQUESTS_PER_SECOND)
+        )
+        self.burst = float(burst or config_provider.get('CONNECTOR_REQUEST_BURST', DEFAULT_BURST))
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+
+        self.remaining = None
+        self.limit = None
+        self.reset_at = None
+        self.blocked_until = None
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.requests_per_second)
+        self.refilled_at = now
+
+    def _provider_wait(self, now):
+        waits = []
+        if self.blocked_until is not None and self.blocked_until > now:
+            waits.append(self.blocked_until - now)
+        if self.remaining is not None and self.remaining <= 0 and self.reset_at is not None and self.reset_at > now:
+            waits.append(self.reset_at - now)
+        return min(max(waits), MAX_WAIT_SECONDS) if waits else 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait = self._provider_wait(time.time())
+                if wait == 0:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens = self.tokens - 1
+                        if self.remaining is not None:
+                            self.remaining = self.remaining - 1
+                        return
+                    wait = (1 - self.tokens) / self.requests_per_second
+                else:
+                    logger.info(
+                        f'Connector {self.connector_key}: provider rate limit reached, waiting {wait:.1f} seconds'
+                    )
+            time.sleep(wait)
+
+    def update_budget(self, remaining=None, limit=None, reset_at=None, blocked_until=None):
+        with self.lock:
+            if remaining is not None:
+                self.remaining = remaining
+            if limit is not None:
+                self.limit = limit
+            if reset_at is not None:
+                self.reset_at = reset_at
+            if blocked_until is not None:
+                self.blocked_until = max(blocked_until, self.blocked_until or 0)
+
+        if remaining is not None and limit:
+            if remaining < 0.1 * limit:
+                logger.info(f'Connector {self.connector_key}: {remaining:.0f} of {limit:.0f} requests remaining')
+            else:
+                logger.debug(f'Connector {self.connector_key}: {remaining:.0f} of {limit:.0f} requests remaining')
+
+    def observe(self, response):
+        now = time.time()
+        headers = response.headers
+        retry_after = headers.get('Retry-After')
+        delay = parse_number(headers.get('X-RateLimit-Delay'))
+        self.update_budget(
+            remaining=parse_number(header_value(headers, REMAINING_HEADERS)),
+            limit=parse_number(header_value(headers, LIMIT_HEADERS)),
+            reset_at=parse_reset(header_value(headers, RESET_HEADERS), now),
+            blocked_until=(
+                parse_retry_after(retry_after, now) if retry_after is not None
+                else now + delay if delay else None
+            )
+        )
+
+    def is_rate_limited(self, response):
+        if response.status_code == 429:
+            return True
+        if response.status_code == 403:
+            return (
+                response.headers.get('Retry-After') is not None or
+                parse_number(header_value(response.headers, REMAINING_HEADERS)) == 0
+            )
+        return False
+
+    def backoff(self, attempt):
+        now = time.time()
+        if self._provider_wait(now) == 0:
+            # Rate limited without any hint of when to come back, so back off on our own.
+            self.update_budget(blocked_until=now + 2 ** attempt)
+
+    def call(self, request, *args, **kwargs):
+        max_retries = get_max_rate_limit_retries()
+        attempt = 0
+        while True:
+            self.acquire()
+            response = request(*args, **kwargs)
+            self.observe(response)
+            if not self.is_rate_limited(response) or attempt >= max_retries:
+                return response
+            attempt = attempt + 1
+            self.backoff(attempt)
+            logger.warning(
+                f'Connector {self.connector_key}: rate limited ({response.status_code}), retry {attempt} of {max_retries}'
+            )
+
+    def get_budget(self):
+        with self.lock:
+            return dict(
+                connector_key=self.connector_key,
+                remaining=self.remaining,
+                limit=self.limit,
+                reset_at=self.reset_at,
+                tokens=self.tokens
+            )
+
+
+def get_rate_limiter(connector_key):
+    connector_key = str(connector_key)
+    with _limiters_lock:
+        limiter = _limiters.get(connector_key)
+        if limiter is None:
+            limiter = ConnectorRateLimiter(connector_key)
+            _limiters[connector_key] = limiter
+        return limiter
+
+
+def get_remaining_budget(connector_key=None):
+    """
+    Returns the last known provider budget for a connector, or for all connectors seen by
+    this process when no key is given.
+    """
+    if connector_key is not None:
+        return get_rate_limiter(connector_key).get_budget()
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.get_budget() for limiter in limiters]
+
+
+def log_remaining_budget(connector_key):
+    budget = get_remaining_budget(connector_key)
+    if budget['remaining'] is not None and budget['limit'] is not None:
+        resets = ''
+        if budget['reset_at'] is not None:
+            resets = f", resets in {max(budget['reset_at'] - time.time(), 0):.0f} seconds"
+        logger.info(
+            f"Connector {budget['connector_key']}: "
+            f"{budget['remaining']:.0f} of {budget['limit']:.0f} requests remaining{resets}"
+        )
+    else:
+        # the provider has not reported a budget, only our own request rate applies.
+        logger.debug(f"Connector {budget['connector_key']}: {budget['tokens']:.1f} request tokens available")
+    return budget
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from polaris.utils.config import get_config_provider
+from .rate_limits import get_rate_limiter
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.integrations.fetch.sessions')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class RateLimitedSession(requests.Session):
+    """
+    A session whose requests are all scheduled through the rate limiter of its connector.
+
+    Each request holds a lease on the session while it is in flight, so that the session is not
+    closed under it: idle eviction skips sessions with requests in flight, and a session that is
+    closed while requests are in flight is only closed once the last of them completes.
+    """
+
+    def __init__(self, connector_key):
+        super().__init__()
+        self.rate_limiter = get_rate_limiter(connector_key)
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.retired = False
+
+    def request(self, method, url, *args, **kwargs):
+        with _sessions_lock:
+            self.leases = self.leases + 1
+        try:
+            return self.rate_limiter.call(super().request, method, url, *args, **kwargs)
+        finally:
+            with _sessions_lock:
+                self.leases = self.leases - 1
+                self.last_used = time.monotonic()
+                close = self.retired and self.leases == 0
+            if close:
+                super().close()
+
+    def retire(self):
+        # called with _sessions_lock held once the session has been removed from _sessions.
+        self.retired = True
+        return self.leases == 0
+
+
+def create_session(connector_key):
+    pool_size = int(config_provider.get('CONNECTOR_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE))
+    retry = Retry(
+        total=int(config_provider.get('CONNECTOR_HTTP_RETRIES', DEFAULT_RETRIES)),
+        backoff_factor=float(config_provider.get('CONNECTOR_HTTP_BACKOFF_FACTOR', DEFAULT_BACKOFF_FACTOR)),
+        status_forcelist=[500, 502, 503, 504],
+        # webhook registration posts are not idempotent, so they are not retried.
+        allowed_methods=frozenset(['GET', 'HEAD', 'DELETE']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = RateLimitedSession(connector_key)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def evict_idle_sessions(idle_timeout=None):
+    if idle_timeout is None:
+        idle_timeout = int(config_provider.get('CONNECTOR_HTTP_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+
+    now = time.monotonic()
+    with _sessions_lock:
+        idle = [
+            connector_key
+            for connector_key, session in _sessions.items()
+            if session.leases == 0 and now - session.last_used > idle_timeout
+        ]
+        evicted = [_sessions.pop(connector_key) for connector_key in idle]
+        for session in evicted:
+            session.retire()
+
+    for session in evicted:
+        session.close()
+    if len(evicted) > 0:
+        logger.info(f'Closed {len(evicted)} idle connector http sessions')
+
+
+def get_session(connector_key):
+    """
+    Returns the pooled http session for a connector. Connections are kept alive and reused
+    across calls for the same connector, and sessions that have not been used for
+    CONNECTOR_HTTP_IDLE_TIMEOUT seconds are closed.
+    """
+    evict_idle_sessions()
+    connector_key = str(connector_key)
+    with _sessions_lock:
+        session = _sessions.get(connector_key)
+        if session is None:
+            session = create_session(connector_key)
+            _sessions[connector_key] = session
+        session.last_used = time.monotonic()
+        return session
+
+
+def close_session(connector_key):
+    with _sessions_lock:
+        session = _sessions.pop(str(connector_key), None)
+        # a session with requests in flight is closed when the last of them completes.
+        close = session is not None and session.retire()
+    if close:
+        session.close()
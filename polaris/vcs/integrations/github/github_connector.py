@@ -10,11 +10,15 @@
 
 import logging
 from datetime import datetime, timedelta
-from github import GithubException
+from types import SimpleNamespace
+from github import GithubException, RateLimitExceededException
 from polaris.utils.config import get_config_provider
 from polaris.integrations.github import GithubConnector
 from polaris.utils.exceptions import ProcessingException
 from polaris.common.enums import VcsIntegrationTypes, GithubPullRequestState
+from polaris.vcs.integrations.fetch import prefetch_pages, get_rate_limiter, get_session, conditional_get, \
+    get_conditional_cache
+from polaris.vcs.integrations.fetch.rate_limits import get_max_rate_limit_retries
 
 logger = logging.getLogger('polaris.vcs.integrations.github')
 config_provider = get_config_provider()
@@ -25,6 +29,7 @@ class GithubRepositoriesConnector(GithubConnector):
     def __init__(self, connector):
         super().__init__(connector)
         self.webhook_events = ['push', 'pull_request']
+        self.reports_rate_limit = True
 
     def map_repository_info(self, repo):
 
@@ -47,9 +52,9 @@ class GithubRepositoriesConnector(GithubConnector):
             ),
         )
 
-    def fetch_repositories(self):
+    def fetch_repositories(self, github=None):
         if self.access_token is not None:
-            github = self.get_github_client()
+            github = github or self.get_github_client()
             if self.github_organization is not None:
                 organization = github.get_organization(self.github_organization)
                 if organization is not None:
@@ -61,14 +66,98 @@ class GithubRepositoriesConnector(GithubConnector):
         else:
             raise ProcessingException("No access token found this Github Connector. Cannot continue.")
 
+    def observe_rate_limit(self, github):
+        # PyGithub makes the http calls itself, so we cannot see the response headers directly,
+        # but the client keeps the last rate limit values the api reported. When it has not seen any
+        # it asks the rate limit api, which is not there on enterprise servers with rate limiting off.
+        if not self.reports_rate_limit:
+            return
+        try:
+            remaining, limit = github.rate_limiting
+        except GithubException:
+            self.reports_rate_limit = False
+            return
+        if limit >= 0:
+            get_rate_limiter(self.key).update_budget(
+                remaining=remaining,
+                limit=limit,
+                reset_at=github.rate_limiting_resettime
+            )
+
+    def fetch_pages(self, github, paginator):
+        rate_limiter = get_rate_limiter(self.key)
+        max_retries = get_max_rate_limit_retries()
+        page_number = 0
+        attempt = 0
+        while True:
+            rate_limiter.acquire()
+            try:
+                page = paginator.get_page(page_number)
+            except RateLimitExceededException as exc:
+                attempt = attempt + 1
+                if attempt > max_retries:
+                    raise
+                logger.warning(f'Github rate limit exceeded for connector {self.name}: {exc}')
+                self.observe_rate_limit(github)
+                rate_limiter.update_budget(remaining=0)
+                rate_limiter.backoff(attempt)
+                continue
+            attempt = 0
+            self.observe_rate_limit(github)
+            if len(page) == 0:
+                break
+            yield page
+            if len(page) < github.per_page:
+                break
+            page_number = page_number + 1
+
+    def fetch_repository_pages_conditionally(self):
+        # PyGithub's paginated lists cannot send If-None-Match, so when the conditional request
+        # cache is enabled we list repositories with the REST api directly. Unchanged pages come back
+        # as 304s, which github does not count against the rate limit.
+        if self.access_token is None:
+            raise ProcessingException("No access token found this Github Connector. Cannot continue.")
+
+        base_url = config_provider.get('GITHUB_API_BASE_URL', 'https://api.github.com')
+        if self.github_organization is not None:
+            url = f'{base_url}/orgs/{self.github_organization}/repos'
+        else:
+            url = f'{base_url}/user/repos'
+        params = dict(per_page=100)
+        while url is not None:
+            response = conditional_get(
+                get_session(self.key),
+                self.key,
+                url,
+                params=params,
+                headers={
+                    "Authorization": f"token {self.access_token}",
+                    "Accept": "application/vnd.github.v3+json"
+                }
+            )
+            if response.ok:
+                # map_repository_info expects PyGithub style attribute access
+                yield [SimpleNamespace(**repo) for repo in response.json()]
+                # the next link carries its own query parameters
+                params = None
+                url = response.links['next']['url'] if 'next' in response.links else None
+            else:
+                raise ProcessingException(
+                    f"Fetch repositories failed {response.text} status: {response.status_code}"
+                )
+
     def fetch_repositories_from_source(self):
         logger.info(f'Refresh Repositories: Fetching repositories for connector {self.name} in organization {self.organization_key}')
-        repos_paginator = self.fetch_repositories()
         count = 0
-        while repos_paginator._couldGrow():
+        if get_conditional_cache() is not None:
+            pages = self.fetch_repository_pages_conditionally()
+        else:
+            github = self.get_github_client()
+            pages = self.fetch_pages(github, self.fetch_repositories(github))
+        for page in prefetch_pages(pages, connector_key=self.key):
             repos = [
                 self.map_repository_info(repo)
-                for repo in repos_paginator._fetchNextPage()
+                for repo in page
                 if not repo.archived
             ]
             count = count + len(repos)
@@ -151,6 +240,7 @@ class GithubRepository(PolarisGithubRepository):
             if repository.latest_pull_request_update_timestamp is not None \
             else datetime.utcnow() - timedelta(days=INITIAL_IMPORT_DAYS)
         self.connector = connector
+        self.connector_key = connector.key
         self.access_token = connector.access_token
         self.pull_request_state_mapping = dict(
             open=GithubPullRequestState.open.value,
@@ -195,26 +285,31 @@ class GithubRepository(PolarisGithubRepository):
 
             if pull_request_source_id is None:
                 # fetch all pull requests
-                yield from self.fetch_all_pull_requests(repo)
+                yield from self.fetch_all_pull_requests(github, repo)
             else:
                 yield [self.map_pull_request_info(repo.get_pull(int(pull_request_source_id)))]
 
-    def fetch_all_pull_requests(self, repo):
+    def fetch_all_pull_requests(self, github, repo):
         prs_iterator = repo.get_pulls(
             state='all',
             sort='updated',
             direction='desc'
         )
         fetched_upto_last_update = False
-        while prs_iterator._couldGrow() and not fetched_upto_last_update:
+        pages = prefetch_pages(self.connector.fetch_pages(github, prs_iterator), connector_key=self.connector.key)
+        for page in pages:
             pull_requests = []
-            for pr in prs_iterator._fetchNextPage():
+            for pr in page:
                 if pr.updated_at < self.last_updated:
                     fetched_upto_last_update = True
                     break
                 else:
                     pull_requests.append(self.map_pull_request_info(pr))
             yield pull_requests
+            if fetched_upto_last_update:
+                # stop the prefetch of pages we are not going to use.
+                pages.close()
+                break
 
     def fetch_repository_forks(self):
         if self.access_token is not None:
@@ -222,10 +317,10 @@ class GithubRepository(PolarisGithubRepository):
             repo = github.get_repo(int(self.repository.source_id))
             try:
                 forks_paginator = repo.get_forks()
-                while forks_paginator._couldGrow():
+                for page in prefetch_pages(self.connector.fetch_pages(github, forks_paginator), connector_key=self.connector.key):
                     repos = [
                         self.connector.map_repository_info(repo)
-                        for repo in forks_paginator._fetchNextPage()
+                        for repo in page
                         if not repo.archived
                     ]
                     yield repos
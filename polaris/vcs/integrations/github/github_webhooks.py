@@ -10,25 +10,37 @@
 
 import logging
 from flask import Blueprint, request
-from polaris.vcs.messaging import publish
+from polaris.vcs.messaging import publish, payloads
 
 logger = logging.getLogger('polaris.vcs.integrations.github.webhook')
 
 webhook = Blueprint('github_webhooks', __name__)
 
 
-@webhook.route(f"/repository/webhooks/<connector_key>/", methods=('GET', 'POST'))
-def repository_webhook(connector_key):
-    logger.info('Received webhook event @repository/webhooks')
-    req_data = request.json
+# X-GitHub-Event values we publish, everything else is acknowledged and dropped.
+routed_events = {'push', 'pull_request'}
+
+
+def resolve_event_type(headers, body):
+    event_type = headers.get('X-GitHub-Event')
+    if event_type is not None:
+        return event_type if event_type in routed_events else None
+
+    # Deliveries without the event header: fall back to looking at the body.
+    req_data = payloads.loads(body) if body else None
     if req_data is not None:
-        event_type = None
-        if req_data.get('ref'):
-            event_type = 'push'
         if req_data.get('pull_request'):
-            event_type = 'pull_request'
+            return 'pull_request'
+        if req_data.get('ref'):
+            return 'push'
+
 
-        if event_type is not None:
-            publish.github_repository_event(event_type, connector_key, request.data)
+@webhook.route(f"/repository/webhooks/<connector_key>/", methods=('GET', 'POST'))
+def repository_webhook(connector_key):
+    logger.info('Received webhook event @repository/webhooks')
+    body = request.get_data(as_text=True)
+    event_type = resolve_event_type(request.headers, body)
+    if event_type is not None:
+        publish.github_repository_event(event_type, connector_key, body)
 
     return ''
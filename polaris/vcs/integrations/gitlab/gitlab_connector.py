@@ -9,12 +9,12 @@
 # Author: Krishna Kumar
 
 import logging
-import requests
 from datetime import datetime, timedelta
 from polaris.integrations.gitlab import GitlabConnector
 from polaris.utils.exceptions import ProcessingException
 from polaris.utils.config import get_config_provider
 from polaris.common.enums import VcsIntegrationTypes, GitlabPullRequestState
+from polaris.vcs.integrations.fetch import prefetch_pages, get_session, conditional_get
 
 config_provider = get_config_provider()
 
@@ -77,7 +77,7 @@ class GitlabRepositoriesConnector(GitlabConnector):
         for event in self.webhook_events:
             post_data[f'{event}'] = True
 
-        response = requests.post(
+        response = get_session(self.key).post(
             add_hook_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"},
             data=post_data
@@ -97,7 +97,7 @@ class GitlabRepositoriesConnector(GitlabConnector):
 
     def get_available_webhooks(self, repo_source_id):
         get_hooks_url = f"{self.base_url}/projects/{repo_source_id}/hooks"
-        response = requests.get(
+        response = get_session(self.key).get(
             get_hooks_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"}
         )
@@ -110,7 +110,7 @@ class GitlabRepositoriesConnector(GitlabConnector):
 
     def delete_repository_webhook(self, repo_source_id, inactive_hook_id):
         delete_hook_url = f"{self.base_url}/projects/{repo_source_id}/hooks/{inactive_hook_id}"
-        response = requests.delete(
+        response = get_session(self.key).delete(
             delete_hook_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"}
         )
@@ -126,7 +126,9 @@ class GitlabRepositoriesConnector(GitlabConnector):
     def fetch_repositories(self, url=None):
         fetch_repos_url = url or f'{self.base_url}/projects'
         while fetch_repos_url is not None:
-            response = requests.get(
+            response = conditional_get(
+                get_session(self.key),
+                self.key,
                 fetch_repos_url,
                 params=dict(membership=True),
                 headers={"Authorization": f"Bearer {self.personal_access_token}"},
@@ -143,7 +145,7 @@ class GitlabRepositoriesConnector(GitlabConnector):
                 )
 
     def fetch_repositories_from_source(self, url=None):
-        for repositories in self.fetch_repositories(url):
+        for repositories in prefetch_pages(self.fetch_repositories(url), connector_key=self.key):
             yield [
                 self.map_repository_info(repo)
                 for repo in repositories
@@ -167,6 +169,7 @@ class GitlabRepository(PolarisGitlabRepository):
         self.source_repo_id = repository.source_id
         self.last_updated = repository.latest_pull_request_update_timestamp
         self.gitlab_connector = connector
+        self.connector_key = connector.key
         self.webhook_secret = self.gitlab_connector.webhook_secret
         self.base_url = f'{self.gitlab_connector.base_url}'
         self.personal_access_token = self.gitlab_connector.personal_access_token
@@ -231,7 +234,8 @@ class GitlabRepository(PolarisGitlabRepository):
             query_params['updated_after'] = self.last_updated.isoformat()
         fetch_pull_requests_url = f'{self.base_url}/projects/{self.source_repo_id}/merge_requests'
         while fetch_pull_requests_url is not None:
-            response = requests.get(
+            # not a conditional request: updated_after moves on every sync, so the url is never the same twice.
+            response = get_session(self.gitlab_connector.key).get(
                 fetch_pull_requests_url,
                 params=query_params,
                 headers={"Authorization": f"Bearer {self.personal_access_token}"},
@@ -250,7 +254,7 @@ class GitlabRepository(PolarisGitlabRepository):
     def get_pull_request(self, source_id):
         fetch_pull_requests_url = f'{self.base_url}/projects/{self.source_repo_id}/merge_requests/{source_id}'
 
-        response = requests.get(
+        response = get_session(self.gitlab_connector.key).get(
             fetch_pull_requests_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"},
         )
@@ -263,7 +267,7 @@ class GitlabRepository(PolarisGitlabRepository):
 
     def fetch_pull_requests_from_source(self, pull_request_source_id=None):
         if pull_request_source_id is None:
-            for pull_requests in self.fetch_pull_requests():
+            for pull_requests in prefetch_pages(self.fetch_pull_requests(), connector_key=self.gitlab_connector.key):
                 yield [
                     self.map_pull_request_info(pr)
                     for pr in pull_requests
@@ -8,63 +8,33 @@
 
 # Author: Krishna Kumar
 
-import json
-
-from polaris.vcs.messaging import publish
-from polaris.common import db
-from polaris.repos.db.model import Repository
-from polaris.vcs import connector_factory
-from polaris.vcs.db import api
+from polaris.vcs.messaging import publish, payloads
+from polaris.vcs import repository_factory
+from polaris.vcs.messaging import pull_request_events
 from polaris.vcs.integrations.gitlab import GitlabRepository
-from polaris.repos.db.schema import RepositoryImportState
 
 def handle_gitlab_repository_push(connector_key, payload, channel=None):
-    event = json.loads(payload)
+    event = payloads.loads(payload)
     repo_source_id = event.get('project_id')
 
     publish.remote_repository_push_event(connector_key, repo_source_id, channel)
 
 
-def handle_gitlab_pull_request_event(connector_key, payload, channel=None):
-    event = json.loads(payload)
+def handle_gitlab_pull_request_event(connector_key, payload, channel=None, batch=None):
+    event = payloads.loads(payload)
     repo_source_id = str(event.get('project')['id'])
-    with db.orm_session() as session:
-        source_repo = Repository.find_by_connector_key_source_id(
-            session,
-            connector_key=connector_key,
-            source_id=repo_source_id)
-        if source_repo:
-            if source_repo.import_state != RepositoryImportState.IMPORT_DISABLED and source_repo.last_imported is not None:
-                connector = connector_factory.get_connector(
-                    connector_key=source_repo.connector_key,
-                    join_this=session
-                )
-                if connector:
-                    gitlab_repo = GitlabRepository(source_repo, connector)
-                    pr_object = event.get('object_attributes')
-                    pull_request_data = gitlab_repo.map_pull_request_info(pr_object)
+    binding = repository_factory.get_repository_binding(connector_key, repo_source_id)
+    if binding:
+        source_repo, connector = binding
+        gitlab_repo = GitlabRepository(source_repo, connector)
+        pr_object = event.get('object_attributes')
+        pull_request_data = gitlab_repo.map_pull_request_info(pr_object)
 
-                    result = api.sync_pull_requests(source_repo.key, [[pull_request_data]])
-                    if result['success']:
-                        synced_prs = result['pull_requests']
-                        if len(synced_prs) > 0:
-                            if synced_prs[0]['is_new']:
-                                publish.pull_request_created_event(
-                                    organization_key=source_repo.organization_key,
-                                    repository_key=source_repo.key,
-                                    pull_request_summaries=synced_prs
-                                )
-                            else:
-                                publish.pull_request_updated_event(
-                                    organization_key=source_repo.organization_key,
-                                    repository_key=source_repo.key,
-                                    pull_request_summaries=synced_prs
-                                )
-                        return synced_prs
+        return pull_request_events.sync_pull_request_event(source_repo, pull_request_data, batch=batch)
 
 
-def handle_gitlab_event(connector_key, event_type, payload, channel=None):
+def handle_gitlab_event(connector_key, event_type, payload, channel=None, batch=None):
     if event_type == 'push':
         return handle_gitlab_repository_push(connector_key, payload, channel)
     if event_type == 'merge_request':
-        return handle_gitlab_pull_request_event(connector_key, payload, channel)
+        return handle_gitlab_pull_request_event(connector_key, payload, channel, batch)
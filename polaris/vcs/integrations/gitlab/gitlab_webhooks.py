@@ -10,19 +10,39 @@
 
 import logging
 from flask import Blueprint, request
-from polaris.vcs.messaging import publish
+from polaris.vcs.messaging import publish, payloads
 
 logger = logging.getLogger('polaris.vcs.integrations.gitlab.webhook')
 
 webhook = Blueprint('gitlab_webhooks', __name__)
 
 
+# X-Gitlab-Event header values mapped to the object_kind of the payload.
+header_event_types = {
+    'Push Hook': 'push',
+    'Tag Push Hook': 'tag_push',
+    'Merge Request Hook': 'merge_request',
+}
+
+
+def resolve_event_type(headers, body):
+    event_type = header_event_types.get(headers.get('X-Gitlab-Event'))
+    if event_type is None:
+        # object_kind is the first field of every gitlab payload, so this rarely needs a full decode.
+        event_type = payloads.sniff_string_field(body, 'object_kind') or payloads.loads(body)['object_kind']
+    return event_type
+
+
+def publish_repository_event(connector_key):
+    body = request.get_data(as_text=True)
+    publish.gitlab_repository_event(resolve_event_type(request.headers, body), connector_key, body)
+
+
 @webhook.route(f"/repository/push/<connector_key>/", methods=('GET', 'POST'))
 def repository_push(connector_key):
     logger.info('Received webhook event @repository/push')
 
-    event_type = request.json['object_kind']
-    publish.gitlab_repository_event(event_type, connector_key, request.data)
+    publish_repository_event(connector_key)
     return ''
 
 
@@ -30,6 +50,5 @@ def repository_push(connector_key):
 def repository_webhook(connector_key):
     logger.info('Received webhook event @repository/webhooks')
 
-    event_type = request.json['object_kind']
-    publish.gitlab_repository_event(event_type, connector_key, request.data)
+    publish_repository_event(connector_key)
     return ''
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import time
+
+logger = logging.getLogger('polaris.vcs.messaging.coalescing')
+
+
+def message_type_of(properties):
+    """
+    The message type a fetched message was published with, from its properties. This is what the
+    subscriber dispatches on, so drained messages are classified by it too rather than by their payload.
+    """
+    if properties is None:
+        return None
+    return getattr(properties, 'type', None) or (getattr(properties, 'headers', None) or {}).get('message_type')
+
+
+class QueueDrain:
+    """
+    Fetches the messages waiting on a queue behind the one being dispatched, so that they can be
+    processed together with it. Messages are fetched with basic_get on the consumer's own channel and
+    thread, and are held unacknowledged until the caller has written their combined work: ack()
+    acknowledges them, requeue() returns them to the queue when the write failed.
+    """
+
+    def __init__(self, channel, queue, max_messages, interval):
+        self.channel = channel
+        self.queue = queue
+        self.max_messages = max_messages
+        self.interval = interval
+        self.delivery_tags = []
+
+    def fill(self, accept, full=None):
+        """
+        Calls accept(message_type, body) for each waiting message until max_messages have been fetched,
+        full() is true, interval seconds have passed or the queue is empty. A message that accept returns
+        False for, or fails on, is returned to the queue and ends the drain; it is then dispatched on its own.
+        """
+        deadline = time.monotonic() + self.interval
+        while len(self.delivery_tags) < self.max_messages and time.monotonic() < deadline:
+            if full is not None and full():
+                break
+            method, properties, body = self.channel.basic_get(queue=self.queue)
+            if method is None:
+                break
+            try:
+                accepted = accept(message_type_of(properties), body)
+            except Exception as exc:
+                logger.warning(f'{self.queue}: returning a message that failed in a batch to the queue: {exc}')
+                accepted = False
+            if not accepted:
+                self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                break
+            self.delivery_tags.append(method.delivery_tag)
+        return len(self.delivery_tags)
+
+    def ack(self):
+        for delivery_tag in self.delivery_tags:
+            self.channel.basic_ack(delivery_tag=delivery_tag)
+        self.delivery_tags = []
+
+    def requeue(self):
+        for delivery_tag in self.delivery_tags:
+            self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        self.delivery_tags = []
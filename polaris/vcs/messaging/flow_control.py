@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import threading
+import time
+
+import pika
+
+from polaris.utils.config import get_config_provider
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.messaging.flow_control')
+
+
+class QueueDepthMonitor:
+    """
+    Reads the depth of a broker queue using a passive queue declare so that
+    bulk publishers can stop sending while downstream consumers catch up.
+
+    If the broker url is not configured or the queue cannot be inspected, the monitor
+    reports no depth and callers proceed without back pressure.
+    """
+
+    def __init__(self, queue_name, max_depth=None, poll_interval=5, broker_url=None):
+        self.queue_name = queue_name
+        self.max_depth = max_depth
+        self.poll_interval = poll_interval
+        self.broker_url = broker_url or config_provider.get('MQ_URL')
+        self.connection = None
+        self.channel = None
+
+    def get_queue_depth(self):
+        if self.broker_url is None:
+            return None
+        try:
+            if self.channel is None or self.channel.is_closed:
+                self.close()
+                self.connection = pika.BlockingConnection(pika.URLParameters(self.broker_url))
+                self.channel = self.connection.channel()
+
+            return self.channel.queue_declare(queue=self.queue_name, passive=True).method.message_count
+        except Exception as exc:
+            logger.warning(f'Could not read depth of queue {self.queue_name}: {exc}')
+            self.close()
+            return None
+
+    def wait_for_capacity(self, should_stop=None):
+        if not self.max_depth:
+            return 0
+
+        waited = 0
+        depth = self.get_queue_depth()
+        while depth is not None and depth >= self.max_depth:
+            if should_stop is not None and should_stop():
+                break
+            logger.info(
+                f'Queue {self.queue_name} has {depth} messages (limit {self.max_depth}). '
+                f'Pausing for {self.poll_interval} seconds'
+            )
+            time.sleep(self.poll_interval)
+            waited = waited + self.poll_interval
+            depth = self.get_queue_depth()
+
+        return waited
+
+    def close(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception as exc:
+            logger.warning(f'Error closing queue monitor connection: {exc}')
+        finally:
+            self.connection = None
+            self.channel = None
+
+
+class RateLimiter:
+    """
+    Limits the combined rate of several senders, which may be on different threads, to rate items
+    per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_slot)
+            self.next_slot = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class FlowController:
+    """
+    Paces a bulk publisher by the state of its downstream consumer. While the consumer queue stays
+    below target_depth and acks keep up, the batch size grows by a fixed step per batch and there is
+    no pause between batches. When the queue backs up or the number of sent but unacked items passes
+    max_lag, the batch size is halved and the pause between batches doubles, up to max_delay.
+
+    max_rate is an optional ceiling on items sent per second, whatever the downstream state. A
+    rate_limiter shared between controllers applies a ceiling to all of them together.
+    """
+
+    def __init__(self, queue_name, batch_size, min_batch_size=None, max_batch_size=None, target_depth=None,
+                 max_lag=None, max_rate=None, max_delay=None, broker_url=None, rate_limiter=None):
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size or max(1, batch_size // 10)
+        self.max_batch_size = max_batch_size or batch_size * 10
+        self.step = max(1, batch_size // 4)
+        self.target_depth = target_depth or int(config_provider.get('FLOW_CONTROL_TARGET_QUEUE_DEPTH', 100))
+        self.max_lag = max_lag
+        self.max_rate = max_rate
+        self.rate_limiter = rate_limiter
+        self.max_delay = max_delay or float(config_provider.get('FLOW_CONTROL_MAX_DELAY', 30))
+        self.delay = 0
+        self.monitor = QueueDepthMonitor(queue_name, broker_url=broker_url)
+
+        self.sent_total = 0
+        self.backoffs = 0
+        self.started_at = time.monotonic()
+        self.last_sent_at = None
+
+    def is_congested(self, depth, lag):
+        return (
+            (depth is not None and depth > self.target_depth) or
+            (lag is not None and self.max_lag is not None and lag > self.max_lag)
+        )
+
+    def sent(self, count, lag=None):
+        """
+        Records a batch of count items and waits until the next batch may be sent. lag is the number
+        of items sent so far that the consumer has not yet acknowledged, if the caller can tell.
+        """
+        now = time.monotonic()
+        self.sent_total = self.sent_total + count
+
+        depth = self.monitor.get_queue_depth()
+        if self.is_congested(depth, lag):
+            self.backoffs = self.backoffs + 1
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.delay = min(self.max_delay, max(2 * self.delay, 1))
+            logger.info(
+                f'Queue {self.monitor.queue_name}: depth {depth}, lag {lag}. '
+                f'Batch size {self.batch_size}, pausing {self.delay:.1f} seconds'
+            )
+        else:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.step)
+            self.delay = self.delay / 2 if self.delay >= 1 else 0
+
+        wait = self.delay
+        if self.max_rate:
+            # never send faster than max_rate items per second.
+            if self.last_sent_at is not None:
+                wait = max(wait, count / self.max_rate - (now - self.last_sent_at))
+        if wait > 0:
+            time.sleep(wait)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(count)
+        self.last_sent_at = time.monotonic()
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.sent_total / elapsed if elapsed > 0 else 0
+
+    def report(self, action):
+        logger.info(
+            f'{action}: sent {self.sent_total} at {self.throughput():.1f}/s '
+            f'with {self.backoffs} backoffs, final batch size {self.batch_size}'
+        )
+
+    def close(self):
+        self.monitor.close()
+
+
+def commit_replay_flow_controller(batch_size, rate_limiter=None):
+    # Commit replays are consumed by analytics from its subscription to the commits topic.
+    max_lag = config_provider.get('COMMIT_REPLAY_MAX_LAG', None)
+    max_rate = config_provider.get('COMMIT_REPLAY_MAX_RATE', None)
+    return FlowController(
+        config_provider.get('COMMITS_ANALYTICS_QUEUE', 'commits_analytics'),
+        batch_size,
+        max_batch_size=int(config_provider.get('COMMIT_REPLAY_MAX_BATCH_SIZE', 10 * batch_size)),
+        max_lag=int(max_lag) if max_lag is not None else None,
+        max_rate=float(max_rate) if max_rate is not None else None,
+        rate_limiter=rate_limiter
+    )
@@ -32,7 +32,8 @@ if __name__ == "__main__":
             VcsTopicSubscriber,
             AnalyticsTopicSubscriber,
             ConnectorsTopicSubscriber,
-            CommitsTopicSubscriber
-
+            CommitsTopicSubscriber,
+            ConnectorCacheSubscriber,
+            RepositoryCacheSubscriber
         ]
     ).start_consuming()
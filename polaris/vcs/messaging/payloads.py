@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Only the head of the payload is searched for top level fields we route on, so that a
+# push with hundreds of commits is not scanned end to end.
+HEAD_SIZE = 4096
+
+_string_field_patterns = {}
+
+
+def loads(payload):
+    """
+    Decodes a webhook payload, using orjson when it is installed. Handlers call this exactly once
+    per event; the webhook endpoints never decode the body.
+    """
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def sniff_string_field(payload, field):
+    """
+    Returns the value of the first string valued field with the given name found in the head of the
+    raw payload, or None. This is used to route events without decoding the body, so it must only
+    be used for fields that appear near the top of the document.
+    """
+    pattern = _string_field_patterns.get(field)
+    if pattern is None:
+        pattern = re.compile(rf'"{re.escape(field)}"\s*:\s*"([^"\\]*)"')
+        _string_field_patterns[field] = pattern
+
+    head = payload[:HEAD_SIZE]
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='ignore')
+    match = pattern.search(head)
+    return match.group(1) if match is not None else None
@@ -7,12 +7,193 @@
 # confidential.
 
 # Author: Krishna Kumar
-from polaris.messaging.messages import RepositoriesImported, PullRequestsUpdated, PullRequestsCreated
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pika
+from pika.exceptions import AMQPError
+
+from polaris.messaging.messages import RepositoriesImported, PullRequestsUpdated, PullRequestsCreated, \
+    CommitHistoryImported, CommitDetailsImported
 from polaris.vcs.messaging.messages import RefreshConnectorRepositories, AtlassianConnectRepositoryEvent, \
     GitlabRepositoryEvent, RemoteRepositoryPushEvent, GithubRepositoryEvent, AzureRepositoryEvent, SyncPullRequest
-from polaris.messaging.utils import publish
-from polaris.messaging.topics import ConnectorsTopic, VcsTopic
+from polaris.messaging import utils as messaging_utils
+from polaris.messaging.topics import ConnectorsTopic, VcsTopic, CommitsTopic
 from polaris.integrations.publish import connector_event
+from polaris.utils.config import get_config_provider
+from polaris.utils.exceptions import ProcessingException
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.messaging.publish')
+
+_batches = threading.local()
+
+
+class PublishBatch:
+    """
+    Publishes on a single broker channel in transaction mode, so that a run of messages costs one
+    round trip to the broker at commit time instead of one per message. The batch is committed
+    once it holds size messages, and when the batch context that uses it exits.
+
+    interval is only checked as messages are added: a message added interval seconds or more after
+    the first one in the batch commits it. It does not commit a batch that receives no more messages,
+    nothing does that before the context exits, so a batch is best kept to the unit of work it
+    publishes for (a message, a task). No interval is applied unless one is given or configured.
+
+    A batch belongs to the thread that opened it, since pika channels are not thread safe, which is
+    why there is no timer to commit it from another thread.
+    """
+
+    def __init__(self, size=None, interval=None, broker_url=None):
+        self.size = int(size or config_provider.get('PUBLISH_BATCH_SIZE', 500))
+        interval = interval or config_provider.get('PUBLISH_BATCH_INTERVAL', None)
+        self.interval = float(interval) if interval is not None else None
+        self.broker_url = broker_url or config_provider.get('MQ_URL')
+        self.connection = None
+        self.channel = None
+        self.pending = 0
+        self.first_published_at = None
+        self.published = 0
+        self.batches = 0
+
+    def get_channel(self):
+        if self.broker_url is None:
+            return None
+        if self.channel is not None and self.pending == 0:
+            # A long lived batch may sit idle between uses; service heartbeats so that a connection
+            # dropped by the broker is replaced here rather than failing the next publish.
+            try:
+                self.connection.process_data_events(time_limit=0)
+            except AMQPError as exc:
+                logger.warning(f'Publish batch connection lost, reconnecting: {exc}')
+                self.close()
+        if self.channel is None or self.channel.is_closed:
+            self.close()
+            self.connection = pika.BlockingConnection(pika.URLParameters(self.broker_url))
+            self.channel = self.connection.channel()
+            self.channel.tx_select()
+        return self.channel
+
+    def add(self):
+        if self.pending == 0:
+            self.first_published_at = time.monotonic()
+        self.pending = self.pending + 1
+        if self.pending >= self.size or \
+                (self.interval is not None and time.monotonic() - self.first_published_at >= self.interval):
+            self.flush()
+
+    def flush(self):
+        if self.pending == 0:
+            return 0
+        count = self.pending
+        if self.channel is not None:
+            self.channel.tx_commit()
+        latency = time.monotonic() - self.first_published_at
+        self.pending = 0
+        self.published = self.published + count
+        self.batches = self.batches + 1
+        logger.info(f'Published batch of {count} messages in {1000 * latency:.1f} ms')
+        return count
+
+    def close(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception as exc:
+            logger.warning(f'Error closing publish batch connection: {exc}')
+        finally:
+            self.connection = None
+            self.channel = None
+
+
+class ThreadBatches:
+    """
+    Keeps one PublishBatch, and so one broker connection, for each thread that asks for one, open
+    until close. Worker threads in a pool reuse their connection across tasks instead of connecting
+    for each one.
+
+    Publishing from more than one thread needs a connection per thread, so this requires MQ_URL:
+    without it the helpers would fall back to the process wide channel.
+    """
+
+    def __init__(self, size=None, interval=None, broker_url=None):
+        self.size = size
+        self.interval = interval
+        self.broker_url = broker_url or config_provider.get('MQ_URL')
+        if self.broker_url is None:
+            raise ProcessingException('MQ_URL must be set to publish from worker threads')
+        self.local = threading.local()
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        current = getattr(self.local, 'batch', None)
+        if current is None:
+            current = PublishBatch(self.size, self.interval, broker_url=self.broker_url)
+            self.local.batch = current
+            with self.lock:
+                self.batches.append(current)
+        return current
+
+    def close(self):
+        # called once the worker threads are done, so no batch is in use any more.
+        with self.lock:
+            batches, self.batches = self.batches, []
+        for current in batches:
+            current.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def has_broker_url():
+    return config_provider.get('MQ_URL') is not None
+
+
+@contextmanager
+def batch(size=None, interval=None, publish_batch=None):
+    """
+    Batches the messages published by the helpers in this module on the current thread. Nested
+    batches join the outermost one. Messages published with an explicit channel are not batched.
+
+    publish_batch is a batch owned by the caller, for instance one from ThreadBatches. It is
+    committed on exit but left open for reuse.
+    """
+    current = getattr(_batches, 'current', None)
+    if current is not None:
+        yield current
+        return
+
+    owned = publish_batch is None
+    current = publish_batch if publish_batch is not None else PublishBatch(size, interval)
+    _batches.current = current
+    published, batches = current.published, current.batches
+    try:
+        yield current
+        current.flush()
+        if current.batches > batches:
+            logger.info(
+                f'Published {current.published - published} messages in {current.batches - batches} batches'
+            )
+    finally:
+        _batches.current = None
+        if owned:
+            current.close()
+
+
+def publish(topic, message, channel=None):
+    current = getattr(_batches, 'current', None)
+    if channel is not None or current is None:
+        messaging_utils.publish(topic, message, channel=channel)
+    else:
+        messaging_utils.publish(topic, message, channel=current.get_channel())
+        current.add()
 
 
 def refresh_connector_repositories(connector_key, tracking_receipt=None, channel=None):
@@ -165,6 +346,28 @@ def sync_pull_request(organization_key, repository_key, pull_request_key=None, p
     )
 
 
+def commit_history_imported(payload, channel=None):
+    message = CommitHistoryImported(
+        send=payload
+    )
+    publish(
+        CommitsTopic,
+        message,
+        channel=channel
+    )
+    return message
+
+
+def commit_details_imported(payload, channel=None):
+    message = CommitDetailsImported(
+        send=payload
+    )
+    publish(
+        CommitsTopic,
+        message,
+        channel=channel
+    )
+    return message
 
 
 # This shim is here only to explictly mark connector event as a referenced symbol.
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import json
+import logging
+
+from polaris.utils.config import get_config_provider
+from polaris.vcs.db import api
+from polaris.vcs.messaging import publish
+from polaris.vcs.timestamps import is_later
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.messaging.pull_request_events')
+
+
+def publish_synced_pull_requests(organization_key, repository_key, synced_pull_requests, channel=None):
+    created = [pr for pr in synced_pull_requests if pr['is_new']]
+    updated = [pr for pr in synced_pull_requests if not pr['is_new']]
+    if len(created) > 0:
+        publish.pull_request_created_event(
+            organization_key=organization_key,
+            repository_key=repository_key,
+            pull_request_summaries=created,
+            channel=channel
+        )
+    if len(updated) > 0:
+        publish.pull_request_updated_event(
+            organization_key=organization_key,
+            repository_key=repository_key,
+            pull_request_summaries=updated,
+            channel=channel
+        )
+
+
+def pull_request_summary_groups(pull_requests, max_summaries=None, max_bytes=None):
+    """
+    Groups (organization_key, repository_key, pull_request_summary) tuples by organization, repository
+    and whether the pull request is new, in the order the groups are first seen. Each group is split into
+    chunks of at most max_summaries summaries and, going by their json size, at most max_bytes bytes.
+    Yields (organization_key, repository_key, is_new, pull_request_summaries) for each chunk.
+    """
+    max_summaries = int(max_summaries or config_provider.get('PULL_REQUEST_SUMMARIES_PER_MESSAGE', 100))
+    max_bytes = int(max_bytes or config_provider.get('PULL_REQUEST_SUMMARIES_MAX_MESSAGE_BYTES', 256 * 1024))
+
+    groups = {}
+    for organization_key, repository_key, pull_request_summary in pull_requests:
+        groups.setdefault(
+            (organization_key, repository_key, pull_request_summary['is_new']), []
+        ).append(pull_request_summary)
+
+    for (organization_key, repository_key, is_new), summaries in groups.items():
+        chunk = []
+        chunk_bytes = 0
+        for pull_request_summary in summaries:
+            summary_bytes = len(json.dumps(pull_request_summary, default=str))
+            if len(chunk) > 0 and (len(chunk) >= max_summaries or chunk_bytes + summary_bytes > max_bytes):
+                yield organization_key, repository_key, is_new, chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(pull_request_summary)
+            chunk_bytes = chunk_bytes + summary_bytes
+        if len(chunk) > 0:
+            yield organization_key, repository_key, is_new, chunk
+
+
+def publish_pull_request_summaries(pull_requests, max_summaries=None, max_bytes=None, channel=None):
+    """
+    Publishes one PullRequestsCreated or PullRequestsUpdated message for each chunk of
+    pull_request_summary_groups and returns the number of messages published.
+    """
+    published = 0
+    for organization_key, repository_key, is_new, summaries in pull_request_summary_groups(
+            pull_requests, max_summaries, max_bytes
+    ):
+        publish_event = publish.pull_request_created_event if is_new else publish.pull_request_updated_event
+        publish_event(
+            organization_key=organization_key,
+            repository_key=repository_key,
+            pull_request_summaries=summaries,
+            channel=channel
+        )
+        published = published + 1
+    return published
+
+
+def is_newer_pull_request(current, new):
+    _, _, current_pr = current
+    _, _, new_pr = new
+    # Events can arrive out of order, so keep whichever payload the provider updated last.
+    return is_later(new_pr.get('source_last_updated'), current_pr.get('source_last_updated'))
+
+
+def sync_pull_request_events(pull_request_events, channel=None):
+    """
+    Syncs (organization_key, repository_key, pull_request_data) tuples in one batch across repositories
+    and publishes the resulting PullRequestsCreated/PullRequestsUpdated messages.
+    """
+    pull_requests_by_repository = {}
+    for organization_key, repository_key, pull_request in pull_request_events:
+        pull_requests_by_repository.setdefault(str(repository_key), []).append(pull_request)
+
+    result = api.sync_pull_requests_for_repositories({
+        repository_key: [pull_requests]
+        for repository_key, pull_requests in pull_requests_by_repository.items()
+    })
+    if result['success']:
+        for synced in result['repositories']:
+            publish_synced_pull_requests(
+                synced['organization_key'],
+                synced['repository_key'],
+                [*synced['created'], *synced['updated']],
+                channel
+            )
+    return result
+
+
+class PullRequestEventBatch:
+    """
+    Collects the pull requests changed by a run of webhook events, keeping only the newest payload for
+    each one, so that they are synced together when the batch is flushed. Providers that only tell us
+    which pull request changed are synced from the source api, so for those the sync requests are
+    collected instead, one per pull request.
+
+    The batch belongs to the subscriber dispatching the events and is flushed on its thread.
+    """
+
+    def __init__(self):
+        self.pull_requests = {}
+        self.sync_requests = {}
+        self.received = 0
+
+    @property
+    def size(self):
+        return len(self.pull_requests) + len(self.sync_requests)
+
+    def add_pull_request(self, source_repo, pull_request_data):
+        self.received = self.received + 1
+        key = (str(source_repo.key), str(pull_request_data['source_id']))
+        event = (source_repo.organization_key, source_repo.key, pull_request_data)
+        current = self.pull_requests.get(key)
+        if current is None or is_newer_pull_request(current, event):
+            self.pull_requests[key] = event
+
+    def add_sync_request(self, organization_key, repository_key, pull_request_source_id):
+        self.received = self.received + 1
+        self.sync_requests[(str(repository_key), str(pull_request_source_id))] = (
+            organization_key, repository_key, pull_request_source_id
+        )
+
+    def flush(self, channel=None):
+        if len(self.pull_requests) > 0:
+            result = sync_pull_request_events(self.pull_requests.values(), channel)
+            if not result['success']:
+                return result
+
+        for organization_key, repository_key, pull_request_source_id in self.sync_requests.values():
+            publish.sync_pull_request(
+                organization_key,
+                repository_key,
+                pull_request_key=None,
+                pull_request_source_id=pull_request_source_id,
+                channel=channel
+            )
+        logger.info(f'Synced {self.size} pull requests coalesced from {self.received} events')
+        return dict(success=True, pull_requests=len(self.pull_requests), sync_requests=len(self.sync_requests))
+
+
+def sync_pull_request_event(source_repo, pull_request_data, channel=None, batch=None):
+    """
+    Syncs a pull request received in a webhook event and publishes the resulting
+    PullRequestsCreated/PullRequestsUpdated messages.
+
+    When a PullRequestEventBatch is passed, the event is added to it instead and synced when the batch is
+    flushed. Returns the synced pull request summaries, or None if the event was batched.
+    """
+    if batch is not None:
+        batch.add_pull_request(source_repo, pull_request_data)
+        return None
+
+    result = api.sync_pull_requests(source_repo.key, [[pull_request_data]])
+    if result['success']:
+        synced_prs = result['pull_requests']
+        publish_synced_pull_requests(source_repo.organization_key, source_repo.key, synced_prs, channel)
+        return synced_prs
+
+
+def request_pull_request_sync(organization_key, repository_key, pull_request_source_id, channel=None, batch=None):
+    if batch is not None:
+        batch.add_sync_request(organization_key, repository_key, pull_request_source_id)
+    else:
+        publish.sync_pull_request(
+            organization_key,
+            repository_key,
+            pull_request_key=None,
+            pull_request_source_id=pull_request_source_id,
+            channel=channel
+        )
@@ -8,20 +8,124 @@
 
 # Author: Krishna Kumar
 
+import json
 import logging
+import time
 
 from polaris.messaging.topics import TopicSubscriber, AnalyticsTopic
 from polaris.messaging.messages import CommitsCreated, CommitDetailsCreated, PullRequestsCreated, PullRequestsUpdated
 from polaris.messaging.utils import raise_on_failure
+from polaris.utils.config import get_config_provider
 from polaris.vcs.db import api
+from polaris.vcs.messaging.coalescing import QueueDrain
+from polaris.vcs.timestamps import is_later
 
 logger = logging.getLogger('polaris.vcs.messaging.analytics_topic_subscriber')
 
+config_provider = get_config_provider()
+
+subscriber_queue = 'analytics_vcs'
+
+
+commit_ack_types = [CommitsCreated.message_type, CommitDetailsCreated.message_type]
+
+pull_request_event_types = [PullRequestsCreated.message_type, PullRequestsUpdated.message_type]
+
+
+class PullRequestAckBatch:
+    """
+    Merges the acks of a PullRequestsCreated/PullRequestsUpdated message with those of the pull request
+    messages waiting behind it on the queue, keeping the latest updated_at for each pull request, so that
+    they are written in one statement. Acks are idempotent and only move analytics_last_updated forward,
+    so merging them does not change the outcome.
+    """
+
+    def __init__(self):
+        self.acks = {}
+
+    def add(self, pull_request_summaries):
+        for pull_request_summary in pull_request_summaries:
+            updated_at = pull_request_summary['updated_at']
+            if updated_at is None:
+                continue
+            key = str(pull_request_summary['key'])
+            current = self.acks.get(key)
+            if current is None or is_later(updated_at, current):
+                self.acks[key] = updated_at
+
+    def write(self):
+        return api.ack_pull_request_event([
+            dict(key=key, updated_at=updated_at)
+            for key, updated_at in self.acks.items()
+        ])
+
+
+class CommitAckBatch:
+    """
+    Merges the commit keys of a CommitsCreated/CommitDetailsCreated message with those of the commit
+    ack messages waiting behind it on the queue, so that they are written in one transaction.
+
+    Waiting messages are fetched with basic_get and acked only after the transaction commits; if the
+    write fails they are returned to the queue. Messages are classified by the message type they were
+    published with, and fetching stops at the first message of any other type, which is returned to the
+    queue unprocessed.
+    """
+
+    def __init__(self, channel, queue, batch_size, interval):
+        self.batch_size = batch_size
+        self.drain = QueueDrain(channel, queue, max_messages=batch_size, interval=interval)
+        self.commits_created_keys = []
+        self.commit_details_created_keys = []
+
+    def add(self, message_type, payload):
+        if message_type == CommitsCreated.message_type:
+            self.commits_created_keys.extend(commit['key'] for commit in payload['new_commits'])
+        elif message_type == CommitDetailsCreated.message_type:
+            self.commit_details_created_keys.extend(commit['key'] for commit in payload['commit_details'])
+        else:
+            return False
+        return True
+
+    @property
+    def size(self):
+        return len(self.commits_created_keys) + len(self.commit_details_created_keys)
+
+    def accept(self, message_type, body):
+        if message_type not in commit_ack_types:
+            return False
+        return self.add(message_type, json.loads(body))
+
+    def fill(self):
+        return self.drain.fill(self.accept, full=lambda: self.size >= self.batch_size)
+
+    def write(self):
+        start = time.monotonic()
+        result = api.ack_commits_synced(self.commits_created_keys, self.commit_details_created_keys)
+        if result['success']:
+            messages = len(self.drain.delivery_tags) + 1
+            self.drain.ack()
+            logger.info(
+                f'Acked {self.size} commits from {messages} messages '
+                f'in {1000 * (time.monotonic() - start):.1f} ms'
+            )
+        else:
+            self.drain.requeue()
+        return result
+
+
 class AnalyticsTopicSubscriber(TopicSubscriber):
     def __init__(self, channel, publisher=None):
+        self.commit_ack_batch_size = int(config_provider.get('COMMIT_ACK_BATCH_SIZE', 1))
+        self.commit_ack_batch_interval = float(config_provider.get('COMMIT_ACK_BATCH_INTERVAL', 1.0))
+        # When the window is set, the acks of the pull request messages waiting on the queue are fetched
+        # for up to this many seconds and written together with those of the message being dispatched.
+        self.pull_request_ack_coalesce_window = float(config_provider.get('PULL_REQUEST_ACK_COALESCE_WINDOW', 0))
+        self.pull_request_ack_coalesce_max_messages = int(
+            config_provider.get('PULL_REQUEST_ACK_COALESCE_MAX_MESSAGES', 100)
+        )
         super().__init__(
             topic=AnalyticsTopic(channel, create=True),
-            subscriber_queue='analytics_vcs',
+            subscriber_queue=subscriber_queue,
             message_classes=[
                 CommitsCreated, CommitDetailsCreated,
                 PullRequestsCreated, PullRequestsUpdated
@@ -31,15 +135,34 @@ class AnalyticsTopicSubscriber(TopicSubscriber):
         )
 
     def dispatch(self, channel, message):
-        if CommitsCreated.message_type == message.message_type:
+        if self.commit_ack_batch_size > 1 and message.message_type in commit_ack_types:
+            return self.process_commit_acks(channel, message)
+
+        elif CommitsCreated.message_type == message.message_type:
             return self.process_commits_created(message)
 
         elif CommitDetailsCreated.message_type == message.message_type:
             return self.process_commit_details_created(message)
 
-        elif message.message_type in [PullRequestsCreated.message_type, PullRequestsUpdated.message_type]:
+        elif self.pull_request_ack_coalesce_window > 0 and message.message_type in pull_request_event_types:
+            return self.process_pull_request_acks(channel, message)
+
+        elif message.message_type in pull_request_event_types:
             return self.process_pull_request_event(message)
 
+    def process_commit_acks(self, channel, message):
+        batch = CommitAckBatch(
+            channel,
+            subscriber_queue,
+            self.commit_ack_batch_size,
+            self.commit_ack_batch_interval
+        )
+        batch.add(message.message_type, message.dict)
+        batch.fill()
+
+        # the message being dispatched is acked by the consumer once this returns.
+        return raise_on_failure(message, batch.write())
+
     @staticmethod
     def process_commits_created(message):
         commits_created = message.dict
@@ -62,6 +185,34 @@ class AnalyticsTopicSubscriber(TopicSubscriber):
             ])
         )
 
+    def process_pull_request_acks(self, channel, message):
+        logger.info(f"Processing Pull Request Ack Event: {message.message_type}")
+
+        batch = PullRequestAckBatch()
+        batch.add(message['pull_request_summaries'])
+        drain = QueueDrain(
+            channel,
+            subscriber_queue,
+            self.pull_request_ack_coalesce_max_messages,
+            self.pull_request_ack_coalesce_window
+        )
+
+        def accept(message_type, body):
+            if message_type not in pull_request_event_types:
+                return False
+            batch.add(json.loads(body)['pull_request_summaries'])
+            return True
+
+        drain.fill(accept)
+        result = batch.write()
+        # the waiting messages are acked only once their acks are written; the message being dispatched
+        # is acked by the consumer once this returns.
+        if result['success']:
+            drain.ack()
+        else:
+            drain.requeue()
+        return raise_on_failure(message, result)
+
     @staticmethod
     def process_pull_request_event(message):
         logger.info(f"Processing Pull Request Ack Event: {message.message_type}")
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Every message listener process keeps its own cache of connectors and repository bindings, but the
+# subscriber queues are shared, so a message on one of them reaches only one of the processes. The
+# subscribers here each consume from an exclusive queue named for the process, which the broker deletes
+# when the process disconnects, so every process gets its own copy of the messages that make its
+# cached connectors and repositories stale.
+
+import logging
+import uuid
+
+from polaris.messaging.topics import TopicSubscriber, ConnectorsTopic, VcsTopic
+from polaris.messaging.messages import ConnectorEvent, RepositoryUpdated, RepositoriesImported
+from polaris.vcs import commands
+
+logger = logging.getLogger('polaris.vcs.messaging.cache_subscribers')
+
+
+def process_queue(name):
+    return f'{name}_{uuid.uuid4().hex}'
+
+
+class ConnectorCacheSubscriber(TopicSubscriber):
+    def __init__(self, channel, publisher=None):
+        super().__init__(
+            topic=ConnectorsTopic(channel, create=True),
+            subscriber_queue=process_queue('connectors_vcs_cache'),
+            message_classes=[
+                ConnectorEvent
+            ],
+            publisher=publisher,
+            exclusive=True
+        )
+
+    def dispatch(self, channel, message):
+        if ConnectorEvent.message_type == message.message_type:
+            return self.process_connector_event(message)
+
+    @staticmethod
+    def process_connector_event(message):
+        connector_key = message['connector_key']
+        logger.info(
+            f"Processing  {message.message_type}: "
+            f" Connector Key : {connector_key} Event: {message.get('event')}"
+        )
+        commands.invalidate_connector(connector_key)
+
+
+class RepositoryCacheSubscriber(TopicSubscriber):
+    def __init__(self, channel, publisher=None):
+        super().__init__(
+            topic=VcsTopic(channel, create=True),
+            subscriber_queue=process_queue('vcs_repository_cache'),
+            message_classes=[
+                RepositoryUpdated,
+                RepositoriesImported
+            ],
+            publisher=publisher,
+            exclusive=True
+        )
+
+    def dispatch(self, channel, message):
+        if RepositoryUpdated.message_type == message.message_type:
+            return self.process_repositories_changed(message, [message['repository']])
+        elif RepositoriesImported.message_type == message.message_type:
+            return self.process_repositories_changed(message, message['imported_repositories'])
+
+    @staticmethod
+    def process_repositories_changed(message, repositories):
+        logger.info(
+            f"Processing  {message.message_type}: "
+            f" Organization Key : {message['organization_key']} Repositories: {len(repositories)}"
+        )
+        commands.invalidate_repositories(repositories)
@@ -17,8 +17,11 @@ from polaris.vcs.messaging.messages import AtlassianConnectRepositoryEvent, Gitl
 from polaris.messaging.messages import PullRequestsCreated, PullRequestsUpdated, RepositoriesImported
 
 from polaris.vcs.messaging import publish
-from polaris.messaging.utils import raise_message_processing_error
+from polaris.messaging.utils import raise_message_processing_error, raise_on_failure
+from polaris.utils.config import get_config_provider
 from polaris.vcs import commands
+from polaris.vcs.messaging.coalescing import QueueDrain
+from polaris.vcs.messaging.pull_request_events import PullRequestEventBatch
 from polaris.vcs.integrations.atlassian import bitbucket_message_handler
 from polaris.vcs.integrations.gitlab import gitlab_message_handler
 from polaris.vcs.integrations.github import github_message_handler
@@ -27,12 +30,75 @@ from polaris.vcs.integrations.azure import azure_message_handler
 
 logger = logging.getLogger('polaris.vcs.messaging.vcs_topic_subscriber')
 
+config_provider = get_config_provider()
+
+subscriber_queue = 'vcs_vcs'
+
+repository_event_types = [
+    AtlassianConnectRepositoryEvent.message_type,
+    GitlabRepositoryEvent.message_type,
+    GithubRepositoryEvent.message_type,
+    AzureRepositoryEvent.message_type
+]
+
+
+def handle_repository_event(message_type, event, batch=None):
+    """
+    Hands a provider webhook event to the message handler for the provider. event is either the
+    message being dispatched or the payload of a message fetched from the queue.
+    """
+    if AtlassianConnectRepositoryEvent.message_type == message_type:
+        return bitbucket_message_handler.handle_atlassian_connect_repository_event(
+            event['atlassian_connector_key'],
+            event['atlassian_event_type'],
+            event['atlassian_event'],
+            batch=batch
+        )
+    elif GitlabRepositoryEvent.message_type == message_type:
+        return gitlab_message_handler.handle_gitlab_event(
+            event['connector_key'],
+            event['event_type'],
+            event['payload'],
+            batch=batch
+        )
+    elif GithubRepositoryEvent.message_type == message_type:
+        return github_message_handler.handle_github_event(
+            event['connector_key'],
+            event['event_type'],
+            event['payload'],
+            batch=batch
+        )
+    elif AzureRepositoryEvent.message_type == message_type:
+        return azure_message_handler.handle_azure_event(
+            event['connector_key'],
+            event['event_type'],
+            event['payload'],
+            batch=batch
+        )
+
 
 class VcsTopicSubscriber(TopicSubscriber):
     def __init__(self, channel, publisher=None):
+        # When the window is set, the pull request events waiting on the queue behind a repository event
+        # are fetched for up to this many seconds and synced together with it, keeping only the newest
+        # payload for each pull request.
+        self.pull_request_event_coalesce_window = float(
+            config_provider.get('PULL_REQUEST_EVENT_COALESCE_WINDOW', 0)
+        )
+        self.pull_request_event_coalesce_max_messages = int(
+            config_provider.get('PULL_REQUEST_EVENT_COALESCE_MAX_MESSAGES', 100)
+        )
+        # When the window is set, the push events waiting on the queue behind a push are fetched for up
+        # to this many seconds, and each repository they push to gets a single import state transition.
+        self.repository_push_debounce_window = float(
+            config_provider.get('REPOSITORY_PUSH_DEBOUNCE_WINDOW', 0)
+        )
+        self.repository_push_debounce_max_messages = int(
+            config_provider.get('REPOSITORY_PUSH_DEBOUNCE_MAX_MESSAGES', 100)
+        )
         super().__init__(
             topic=VcsTopic(channel, create=True),
-            subscriber_queue='vcs_vcs',
+            subscriber_queue=subscriber_queue,
             message_classes=[
                 AtlassianConnectRepositoryEvent,
                 GitlabRepositoryEvent,
@@ -48,7 +114,10 @@ class VcsTopicSubscriber(TopicSubscriber):
         )
 
     def dispatch(self, channel, message):
-        if AtlassianConnectRepositoryEvent.message_type == message.message_type:
+        if self.pull_request_event_coalesce_window > 0 and message.message_type in repository_event_types:
+            return self.process_repository_events(channel, message)
+
+        elif AtlassianConnectRepositoryEvent.message_type == message.message_type:
             return self.process_atlassian_connect_repository_event(message)
         elif GitlabRepositoryEvent.message_type == message.message_type:
             return self.process_gitlab_repository_event(message)
@@ -57,82 +126,94 @@ class VcsTopicSubscriber(TopicSubscriber):
         elif AzureRepositoryEvent.message_type == message.message_type:
             return self.process_azure_repository_event(message)
         elif RemoteRepositoryPushEvent.message_type == message.message_type:
+            if self.repository_push_debounce_window > 0:
+                return self.process_remote_repository_push_events(channel, message)
             return self.process_remote_repository_push_event(message)
         elif RepositoriesImported.message_type == message.message_type:
             return self.process_repositories_imported_event(message)
         elif message.message_type in [SyncPullRequest.message_type, SyncPullRequests.message_type]:
             return self.process_sync_pull_requests(message)
 
+    def process_repository_events(self, channel, message):
+        # Runs on the consumer thread, so the sync and its messages go out on this thread's own
+        # connections. The waiting messages are acked only once the batch is synced and its messages
+        # published; the message being dispatched is acked by the consumer once this returns.
+        batch = PullRequestEventBatch()
+        drain = QueueDrain(
+            channel,
+            subscriber_queue,
+            self.pull_request_event_coalesce_max_messages,
+            self.pull_request_event_coalesce_window
+        )
+
+        def accept(message_type, body):
+            if message_type not in repository_event_types:
+                return False
+            handle_repository_event(message_type, json.loads(body), batch)
+            return True
+
+        try:
+            with publish.batch():
+                self.process_repository_event(message, batch)
+                drain.fill(accept)
+                result = raise_on_failure(message, batch.flush())
+        except Exception:
+            drain.requeue()
+            raise
+
+        drain.ack()
+        return result
+
+    def process_repository_event(self, message, batch=None):
+        if AtlassianConnectRepositoryEvent.message_type == message.message_type:
+            return self.process_atlassian_connect_repository_event(message, batch)
+        elif GitlabRepositoryEvent.message_type == message.message_type:
+            return self.process_gitlab_repository_event(message, batch)
+        elif GithubRepositoryEvent.message_type == message.message_type:
+            return self.process_github_repository_event(message, batch)
+        elif AzureRepositoryEvent.message_type == message.message_type:
+            return self.process_azure_repository_event(message, batch)
+
     @staticmethod
-    def process_atlassian_connect_repository_event(message):
+    def process_atlassian_connect_repository_event(message, batch=None):
         connector_key = message['atlassian_connector_key']
-        event_type = message['atlassian_event_type']
-        event = message['atlassian_event']
 
         logger.info(
             f"Processing  {message.message_type}: "
             f" Connector Key : {connector_key}"
         )
         try:
-            return bitbucket_message_handler.handle_atlassian_connect_repository_event(
-                connector_key,
-                event_type,
-                event
-            )
+            return handle_repository_event(message.message_type, message, batch)
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process repository event', str(exc))
 
     @staticmethod
-    def process_gitlab_repository_event(message):
-        connector_key = message['connector_key']
-        event_type = message['event_type']
-        payload = message['payload']
-
+    def process_gitlab_repository_event(message, batch=None):
         logger.info(
             f"Processing  gitlab event {message.message_type}: "
         )
         try:
-            return gitlab_message_handler.handle_gitlab_event(
-                connector_key,
-                event_type,
-                payload
-            )
+            return handle_repository_event(message.message_type, message, batch)
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process gitlab repository event', str(exc))
 
     @staticmethod
-    def process_azure_repository_event(message):
-        connector_key = message['connector_key']
-        event_type = message['event_type']
-        payload = message['payload']
-
+    def process_azure_repository_event(message, batch=None):
         logger.info(
             f"Processing  azure event {message.message_type}: "
         )
         try:
-            return azure_message_handler.handle_azure_event(
-                connector_key,
-                event_type,
-                payload
-            )
+            return handle_repository_event(message.message_type, message, batch)
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process azure repository event', str(exc))
 
     @staticmethod
-    def process_github_repository_event(message):
-        connector_key = message['connector_key']
-        event_type = message['event_type']
-        payload = message['payload']
-
+    def process_github_repository_event(message, batch=None):
         logger.info(
             f"Processing  github event {message.message_type}: "
         )
         try:
-            return github_message_handler.handle_github_event(
-                connector_key,
-                event_type,
-                payload
-            )
+            return handle_repository_event(message.message_type, message, batch)
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process github repository event', str(exc))
 
@@ -149,6 +230,47 @@ class VcsTopicSubscriber(TopicSubscriber):
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process repository push event', str(exc))
 
+    def process_remote_repository_push_events(self, channel, message):
+        # The pushes waiting on the queue behind this one are fetched and held unacked while the push is
+        # processed. Each repository they push to, including this one, then gets one more import state
+        # transition, so that a push made while the first transition ran is not lost. The waiting pushes
+        # are acked only once all the transitions have succeeded, and are returned to the queue otherwise.
+        result = self.process_remote_repository_push_event(message)
+
+        pushes = {}
+        drain = QueueDrain(
+            channel,
+            subscriber_queue,
+            self.repository_push_debounce_max_messages,
+            self.repository_push_debounce_window
+        )
+
+        def accept(message_type, body):
+            if message_type != RemoteRepositoryPushEvent.message_type:
+                return False
+            push = json.loads(body)
+            pushes.setdefault(
+                (str(push['connector_key']), str(push['repository_source_id'])),
+                (push['connector_key'], push['repository_source_id'])
+            )
+            return True
+
+        try:
+            absorbed = drain.fill(accept)
+            for connector_key, repository_source_id in pushes.values():
+                raise_on_failure(
+                    message,
+                    commands.handle_remote_repository_push(connector_key, repository_source_id)
+                )
+        except Exception:
+            drain.requeue()
+            raise
+
+        drain.ack()
+        if absorbed > 0:
+            logger.info(f'Absorbed {absorbed} repository push events for {len(pushes)} repositories')
+        return result
+
     def process_repositories_imported_event(self, message):
         organization_key = message['organization_key']
         repositories = message['imported_repositories']
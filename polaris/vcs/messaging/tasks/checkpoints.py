@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Replay checkpoints are kept per repository and replay in repos.replay_checkpoints, see
+# polaris.vcs.db.impl.replay_checkpoints. Each one is read and written in a session of its own, so
+# that it commits independently of the long running session the replay reads commits in.
+
+from polaris.common import db
+from polaris.vcs.db.impl import replay_checkpoints
+
+
+def load_checkpoint(repository_id, replay):
+    with db.orm_session() as session:
+        return replay_checkpoints.load_checkpoint(session, repository_id, replay)
+
+
+def save_checkpoint(repository_id, replay, last_id, batches_sent, synced, started_at):
+    with db.orm_session() as session:
+        return replay_checkpoints.save_checkpoint(
+            session, repository_id, replay, last_id, batches_sent, synced, started_at
+        )
+
+
+def clear_checkpoint(repository_id, replay):
+    with db.orm_session() as session:
+        return replay_checkpoints.clear_checkpoint(session, repository_id, replay)
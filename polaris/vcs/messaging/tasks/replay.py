@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from polaris.common import db
+from polaris.repos.db.model import Repository, Organization
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.flow_control import RateLimiter
+
+logger = logging.getLogger('polaris.vcs.messaging.tasks.replay')
+
+
+class ReplayProgress:
+
+    def __init__(self, action, repositories):
+        self.action = action
+        self.repositories = repositories
+        self.completed = 0
+        self.failed = 0
+        self.commits = 0
+        self.errors = {}
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def repository_done(self, repository_name, commits=0, exception=None):
+        with self.lock:
+            self.completed = self.completed + 1
+            if exception is not None:
+                self.failed = self.failed + 1
+                self.errors[repository_name] = str(exception)
+            else:
+                self.commits = self.commits + commits
+            elapsed = time.monotonic() - self.started_at
+            completed, commits = self.completed, self.commits
+
+        if exception is not None:
+            logger.error(f'{self.action}: [{completed}/{self.repositories}] {repository_name} failed: {exception}')
+        else:
+            logger.info(
+                f'{self.action}: [{completed}/{self.repositories}] {repository_name}: {commits} commits '
+                f'so far at {commits / elapsed if elapsed > 0 else 0:.1f} commits/s'
+            )
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started_at
+        return dict(
+            repositories=self.repositories,
+            failed=self.failed,
+            errors=dict(self.errors),
+            commits=self.commits,
+            elapsed=elapsed,
+            throughput=self.commits / elapsed if elapsed > 0 else 0
+        )
+
+
+def replay_organization(organization_key, send_for_repository, action, batch_size, workers=1, max_rate=None,
+                        resume=False, repository_kwargs=None):
+    """
+    Runs send_for_repository for every repository in the organization, see replay_repositories.
+    """
+    with db.orm_session() as session:
+        organization = Organization.find_by_organization_key(session, organization_key)
+        organization_name = organization.name
+        repositories = [
+            (repository.key, repository.name)
+            for repository in Repository.find_by_organization_key(session, organization_key)
+        ]
+
+    return replay_repositories(
+        organization_key,
+        repositories,
+        send_for_repository,
+        action=f'{action} for organization {organization_name}',
+        batch_size=batch_size,
+        workers=workers,
+        max_rate=max_rate,
+        resume=resume,
+        repository_kwargs=repository_kwargs
+    )
+
+
+def replay_repositories(organization_key, repositories, send_for_repository, action, batch_size, workers=1,
+                        max_rate=None, resume=False, repository_kwargs=None):
+    """
+    Runs send_for_repository for each (repository_key, repository_name) in repositories, on a pool of
+    worker threads when workers > 1. Each repository is replayed in its own session, and each worker
+    publishes on a broker connection of its own. max_rate is a ceiling on the commits per second sent
+    by all workers together. With resume, each repository continues from its replay checkpoint.
+    repository_kwargs are passed through to every send_for_repository call, for state the workers share
+    across repositories.
+
+    A failed repository does not stop the others; the summary counts the failures and has the error
+    for each of them.
+    """
+    rate_limiter = RateLimiter(max_rate) if max_rate else None
+    progress = ReplayProgress(action, len(repositories))
+    logger.info(f'{action}: replaying {len(repositories)} repositories with {workers} workers')
+
+    def replay_repository(repository_key):
+        return send_for_repository(
+            repository_key=repository_key,
+            organization_key=organization_key,
+            batch_size=batch_size,
+            rate_limiter=rate_limiter,
+            resume=resume,
+            **(repository_kwargs or {})
+        )
+
+    if workers > 1:
+        # pika channels are not thread safe, so each worker gets a batch, and a connection, of its own.
+        # A batch of one commits every message as it is published, which the flow control depends on.
+        with publish.ThreadBatches(size=1) as batches:
+
+            def replay_on_worker(repository_key):
+                with publish.batch(publish_batch=batches.get()):
+                    return replay_repository(repository_key)
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='replay') as pool:
+                replays = {
+                    pool.submit(replay_on_worker, repository_key): repository_name
+                    for repository_key, repository_name in repositories
+                }
+                for replay in as_completed(replays):
+                    try:
+                        progress.repository_done(replays[replay], commits=replay.result())
+                    except Exception as exc:
+                        progress.repository_done(replays[replay], exception=exc)
+    else:
+        for repository_key, repository_name in repositories:
+            try:
+                progress.repository_done(repository_name, commits=replay_repository(repository_key))
+            except Exception as exc:
+                progress.repository_done(repository_name, exception=exc)
+
+    summary = progress.summary()
+    logger.info(
+        f"{action}: {summary['commits']} commits from {summary['repositories']} repositories "
+        f"({summary['failed']} failed) in {summary['elapsed']:.1f}s, {summary['throughput']:.1f} commits/s"
+    )
+    return summary
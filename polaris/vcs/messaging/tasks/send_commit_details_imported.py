@@ -11,46 +11,121 @@
 
 import logging
 import argh
-import time
+from datetime import datetime
 
-from sqlalchemy import select, func, and_, bindparam
+from sqlalchemy import select, func, and_, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from polaris.common import db
 from polaris.utils.logging import config_logging
+from polaris.utils.config import get_config_provider
 from polaris.utils.timer import Timer
 
-from polaris.repos.db.model import Repository, Organization
-from polaris.repos.intake.service.messaging import publish
+from polaris.repos.db.model import Repository
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.flow_control import commit_replay_flow_controller
+from polaris.vcs.messaging.tasks import replay, checkpoints
 
 from polaris.repos.db.schema import commits, source_file_versions, source_files
 
 logger = logging.getLogger('polaris.repos.intake.service.resync_commits')
 
+config_provider = get_config_provider()
+
+
+def commit_detail_rows_query(commit_ids):
+    # one row per changed file, with the commit columns repeated on each row.
+    return select([
+        commits.c.id,
+        commits.c.key,
+        commits.c.source_commit_id,
+        commits.c.parents,
+        commits.c.stats,
+        source_file_versions.c.action,
+        source_file_versions.c.version_info,
+        source_files.c.key.label('source_file_key'),
+        source_files.c.name,
+        source_files.c.path,
+        source_files.c.file_type,
+        source_files.c.is_deleted,
+        source_files.c.version_count
+    ]).select_from(
+        commits.outerjoin(
+            source_file_versions, source_file_versions.c.commit_id == commits.c.id
+        ).outerjoin(
+            source_files, source_file_versions.c.source_file_id == source_files.c.id
+        )
+    ).where(
+        commits.c.id.in_(commit_ids)
+    ).order_by(
+        # files in the same order as the json_agg in commit_details_json_query, so both give the same payload
+        commits.c.id,
+        source_files.c.key
+    )
+
+
+def commit_details_json_query(commit_ids):
+    # one row per commit, with its source files aggregated into a json array by the database.
+    source_file_list = func.json_agg(
+        aggregate_order_by(
+            func.json_build_object(
+                'key', source_files.c.key,
+                'name', source_files.c.name,
+                'path', source_files.c.path,
+                'file_type', func.coalesce(source_files.c.file_type, ' '),
+                'is_deleted', source_files.c.is_deleted,
+                'stats', source_file_versions.c.version_info,
+                'action', source_file_versions.c.action,
+                'version_count', source_files.c.version_count
+            ),
+            source_files.c.key
+        )
+    ).filter(
+        source_files.c.key != None
+    )
+    return select([
+        commits.c.id,
+        commits.c.key,
+        commits.c.source_commit_id,
+        commits.c.parents,
+        commits.c.stats,
+        func.coalesce(source_file_list, literal_column("'[]'::json")).label('source_files')
+    ]).select_from(
+        commits.outerjoin(
+            source_file_versions, source_file_versions.c.commit_id == commits.c.id
+        ).outerjoin(
+            source_files, source_file_versions.c.source_file_id == source_files.c.id
+        )
+    ).where(
+        commits.c.id.in_(commit_ids)
+    ).group_by(
+        # the other commit columns are functionally dependent on the primary key
+        commits.c.id
+    ).order_by(commits.c.id)
+
+
+def get_commit_details_aggregated(session, commits_batch):
+    return [
+        dict(
+            key=commit_detail.key,
+            source_commit_id=commit_detail.source_commit_id,
+            stats=commit_detail.stats,
+            parents=commit_detail.parents,
+            source_files=commit_detail.source_files
+        )
+        for commit_detail in session.connection().execute(
+            commit_details_json_query([commit.id for commit in commits_batch])
+        )
+    ]
+
+
+def get_commit_details(session, commits_batch, aggregate_files=None):
+    if aggregate_files is None:
+        aggregate_files = bool(config_provider.get('COMMIT_DETAILS_AGGREGATE_FILES', None))
+    if aggregate_files:
+        return get_commit_details_aggregated(session, commits_batch)
 
-def get_commit_details(session, commits_batch):
     commit_detail_rows = session.connection().execute(
-        select([
-            commits.c.id,
-            commits.c.key,
-            commits.c.source_commit_id,
-            commits.c.parents,
-            commits.c.stats,
-            source_file_versions.c.action,
-            source_file_versions.c.version_info,
-            source_files.c.key.label('source_file_key'),
-            source_files.c.name,
-            source_files.c.path,
-            source_files.c.file_type,
-            source_files.c.is_deleted,
-            source_files.c.version_count
-        ]).select_from(
-            commits.outerjoin(
-                source_file_versions, source_file_versions.c.commit_id == commits.c.id
-            ).outerjoin(
-                source_files, source_file_versions.c.source_file_id == source_files.c.id
-            )
-        ).where(
-            commits.c.id.in_([commit.id for commit in commits_batch])
-        ).order_by(commits.c.id)
+        commit_detail_rows_query([commit.id for commit in commits_batch])
     ).fetchall()
 
     current_commit_id = None
@@ -83,7 +158,23 @@ def get_commit_details(session, commits_batch):
     return commit_details_batch
 
 
-def send_for_repository(repository_key, repository=None, organization_key=None, batch_size=None, session=None):
+def get_ack_lag(session, repository, max_id):
+    # commits we have sent that analytics has not acked yet
+    return session.connection().execute(
+        select([
+            func.count(commits.c.id)
+        ]).where(
+            and_(
+                commits.c.repository_id == repository.id,
+                commits.c.analytics_details_synced_at == None,
+                commits.c.id <= max_id
+            )
+        )
+    ).scalar()
+
+
+def send_for_repository(repository_key, repository=None, organization_key=None, batch_size=None, session=None,
+                        rate_limiter=None, resume=False):
     with db.orm_session(session) as session:
         if repository is None:
             repository = Repository.find_by_repository_key(session, repository_key)
@@ -98,91 +189,111 @@ def send_for_repository(repository_key, repository=None, organization_key=None,
             if batch_size is None:
                 batch_size = 1000
 
-            total = session.connection().execute(
-                select([
-                    func.count(commits.c.id)
-                ]).where(
-                    and_(
-                        commits.c.repository_id == repository.id,
-                        commits.c.sync_state == 1,
-                        commits.c.analytics_details_synced_at == None
-                    )
+            checkpoint = checkpoints.load_checkpoint(repository.id, 'commit_details') if resume else None
+            if checkpoint is not None:
+                # everything up to the checkpoint has been sent, so there is no need to count it again.
+                total = None
+                logger.info(
+                    f"Resuming from commit id {checkpoint['last_id']} after {checkpoint['batches_sent']} batches"
                 )
-            ).scalar()
-            if total > 0:
-                logger.info(f"{total} commits to sync")
-
-            synced = 0
-            max_id = 0
-            while synced < total:
-                commits_batch = session.connection().execute(
+            else:
+                total = session.connection().execute(
                     select([
-                        commits.c.id
+                        func.count(commits.c.id)
                     ]).where(
                         and_(
                             commits.c.repository_id == repository.id,
                             commits.c.sync_state == 1,
-                            commits.c.analytics_details_synced_at == None,
-                            commits.c.id > bindparam('max_id')
-                        )
-                    ).order_by(
-                        commits.c.id
-                    ).limit(
-                        batch_size
-                    ),
-                    dict(max_id=max_id)
-                    ).fetchall()
-
-                if len(commits_batch) > 0:
-                    max_id = commits_batch[len(commits_batch)-1].id
-
-                commit_details_batch = get_commit_details(session, commits_batch)
-                synced = synced + len(commit_details_batch)
-
-                if len(commit_details_batch) > 0:
-
-                    publish.publish_commit_details_imported(
-                        dict(
-                            organization_key=organization_key,
-                            repository_name=repository.name,
-                            repository_key=repository.key,
-                            commit_details=commit_details_batch
+                            commits.c.analytics_details_synced_at == None
                         )
                     )
-                    time.sleep(1)
-                else:
-                    break
+                ).scalar()
+                if total > 0:
+                    logger.info(f"{total} commits to sync")
+                checkpoint = dict(last_id=0, batches_sent=0, synced=0, started_at=datetime.utcnow())
 
-            logger.info(f'Synced {synced} commit details for repository {repository.name}')
-        return total
+            batch = checkpoint['batches_sent']
+            synced = 0
+            max_id = checkpoint['last_id']
+            flow_controller = commit_replay_flow_controller(batch_size, rate_limiter)
+            try:
+                while total is None or synced < total:
+                    commits_batch = session.connection().execute(
+                        select([
+                            commits.c.id
+                        ]).where(
+                            and_(
+                                commits.c.repository_id == repository.id,
+                                commits.c.sync_state == 1,
+                                commits.c.analytics_details_synced_at == None,
+                                commits.c.id > bindparam('max_id')
+                            )
+                        ).order_by(
+                            commits.c.id
+                        ).limit(
+                            flow_controller.batch_size
+                        ),
+                        dict(max_id=max_id)
+                        ).fetchall()
 
+                    if len(commits_batch) > 0:
+                        max_id = commits_batch[len(commits_batch)-1].id
+
+                    commit_details_batch = get_commit_details(session, commits_batch)
+                    synced = synced + len(commit_details_batch)
+
+                    if len(commit_details_batch) > 0:
+
+                        publish.commit_details_imported(
+                            dict(
+                                organization_key=organization_key,
+                                repository_name=repository.name,
+                                repository_key=repository.key,
+                                commit_details=commit_details_batch
+                            )
+                        )
+                        checkpoints.save_checkpoint(
+                            repository.id,
+                            'commit_details',
+                            last_id=max_id,
+                            batches_sent=batch + 1,
+                            synced=checkpoint['synced'] + synced,
+                            started_at=checkpoint['started_at']
+                        )
+                        flow_controller.sent(
+                            len(commit_details_batch),
+                            lag=get_ack_lag(session, repository, max_id) if flow_controller.max_lag else None
+                        )
+                        batch = batch + 1
+                    else:
+                        break
+            finally:
+                flow_controller.close()
+            flow_controller.report(f'Send commit details for repository {repository.name}')
+            if batch > checkpoint['batches_sent'] or checkpoint['last_id'] > 0:
+                checkpoints.clear_checkpoint(repository.id, 'commit_details')
+
+            logger.info(f'Synced {synced} commit details for repository {repository.name}')
+        return total if total is not None else synced
 
-def send_for_organization(organization_key, batch_size):
-    with db.orm_session() as session:
-        organization = Organization.find_by_organization_key(session, organization_key)
-        with Timer(
-                action=f"send commit details for organization {organization.name}",
-                use_logger=logger,
-                loglevel=logging.INFO
-        ):
-            total = 0
-            repositories = Repository.find_by_organization_key(session, organization_key)
-            for repository in repositories:
-                total = total + send_for_repository(
-                    repository_key=repository.key,
-                    repository=repository,
-                    organization_key=organization.organization_key,
-                    batch_size=batch_size,
-                    session=session
-                )
 
-            logger.info(f"{total} commits synced for organization {organization.name} ")
+def send_for_organization(organization_key, batch_size, workers=1, max_rate=None, resume=False):
+    return replay.replay_organization(
+        organization_key,
+        send_for_repository,
+        action='Send commit details',
+        batch_size=batch_size,
+        workers=workers,
+        max_rate=max_rate,
+        resume=resume
+    )
 
 
-def commit_details_imported(organization_key=None, repository_key=None, batch_size=100):
+def commit_details_imported(organization_key=None, repository_key=None, batch_size=100, workers=1, max_rate=None,
+        resume=False):
     if repository_key is not None:
-        send_for_repository(repository_key, batch_size=batch_size)
+        send_for_repository(repository_key, batch_size=batch_size, resume=resume)
     elif organization_key is not None:
-        send_for_organization(organization_key, batch_size)
+        send_for_organization(organization_key, batch_size, workers, float(max_rate) if max_rate else None, resume)
     else:
         raise Exception("At least one of organization_key or repository_key must be specified")
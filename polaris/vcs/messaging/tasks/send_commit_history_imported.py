@@ -10,48 +10,154 @@
 
 
 import logging
+import sys
+import threading
 import argh
-import time
+from datetime import datetime
 
-from sqlalchemy import select, func, and_, bindparam
+from sqlalchemy import select, func, and_, bindparam, union
 from polaris.common import db
 from polaris.utils.logging import config_logging
 from polaris.utils.timer import Timer
+from polaris.utils.exceptions import ProcessingException
 
-from polaris.repos.db.model import Repository, Organization
-from polaris.repos.intake.service.messaging import publish
+from polaris.repos.db.model import Repository
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.flow_control import commit_replay_flow_controller
+from polaris.vcs.messaging.tasks import replay, checkpoints
 
 from polaris.repos.db.schema import commits, contributor_aliases
 
 logger = logging.getLogger('polaris.repos.intake.service.resync_commits')
 
-def resolve_new_aliases(commit_batch, contributor_aliases_cache):
-    new_aliases = []
-    for commit in commit_batch:
-        if commit.committer_alias_key not in contributor_aliases_cache:
-            contributor_aliases_cache.add(commit.committer_alias_key)
-            new_aliases.append(
-                dict(
-                    name=commit.committer_name,
-                    alias=commit.committer_alias,
-                    key=commit.committer_alias_key
-                )
+class ContributorAliasCache:
+    """
+    The contributor aliases referenced by the commits being replayed, keyed by alias id, and the
+    alias keys already sent in new_contributors. One cache is shared by all the repositories of an
+    organization replay, so each contributor is sent once per replay rather than once per repository.
+    An alias is only recorded as sent by mark_sent, once the batch that carries it has been published,
+    so an alias in a batch that fails to publish is sent again with the next batch that references it.
+    Alias strings are interned so that each distinct value is held once however often it is referenced.
+    """
+
+    def __init__(self):
+        self.aliases = {}
+        self.sent = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def alias_query(alias_ids):
+        return select([
+            contributor_aliases.c.id,
+            contributor_aliases.c.alias,
+            contributor_aliases.c.display_name,
+            contributor_aliases.c.key
+        ]).where(
+            contributor_aliases.c.id.in_(alias_ids)
+        )
+
+    def add_aliases(self, rows):
+        for row in rows:
+            self.aliases[row.id] = (
+                sys.intern(row.alias) if row.alias is not None else None,
+                sys.intern(row.display_name) if row.display_name is not None else None,
+                sys.intern(str(row.key))
             )
 
-        if commit.author_alias_key not in contributor_aliases_cache:
-            contributor_aliases_cache.add(commit.author_alias_key)
-            new_aliases.append(
-                dict(
-                    name=commit.author_name,
-                    alias=commit.author_alias,
-                    key=commit.author_alias_key
+    def preload(self, session, repository_ids):
+        # one query for the aliases of every commit that is waiting to be replayed.
+        unsynced = and_(
+            commits.c.repository_id.in_(repository_ids),
+            commits.c.analytics_commit_synced_at == None
+        )
+        rows = session.connection().execute(
+            self.alias_query(
+                union(
+                    select([commits.c.committer_alias_id]).where(unsynced),
+                    select([commits.c.author_alias_id]).where(unsynced)
                 )
             )
+        ).fetchall()
+        with self.lock:
+            self.add_aliases(rows)
+        logger.info(f'Preloaded {len(rows)} contributor aliases')
+        return self
+
+    def load_missing(self, session, alias_ids):
+        missing = {alias_id for alias_id in alias_ids if alias_id not in self.aliases}
+        if len(missing) > 0:
+            rows = session.connection().execute(self.alias_query(list(missing))).fetchall()
+            with self.lock:
+                self.add_aliases(rows)
+
+    def get_alias(self, commit, alias_id):
+        alias = self.aliases.get(alias_id)
+        if alias is None:
+            raise ProcessingException(
+                f'Contributor alias {alias_id} referenced by commit {commit.key} was not found'
+            )
+        return alias
+
+    def resolve_batch(self, session, commit_batch):
+        """
+        Returns the commit batch with the alias details of the committer and author added to each
+        commit, and the aliases in the batch that have not been sent before.
+        """
+        self.load_missing(
+            session,
+            [commit.committer_alias_id for commit in commit_batch] +
+            [commit.author_alias_id for commit in commit_batch]
+        )
+        resolved = []
+        new_aliases = []
+        new_keys = set()
+        with self.lock:
+            for commit in commit_batch:
+                committer_alias, committer_name, committer_alias_key = self.get_alias(commit, commit.committer_alias_id)
+                author_alias, author_name, author_alias_key = self.get_alias(commit, commit.author_alias_id)
+                resolved.append(
+                    dict(
+                        commit,
+                        committer_alias=committer_alias,
+                        committer_name=committer_name,
+                        committer_alias_key=committer_alias_key,
+                        author_alias=author_alias,
+                        author_name=author_name,
+                        author_alias_key=author_alias_key
+                    )
+                )
+                for name, alias, key in [
+                    (committer_name, committer_alias, committer_alias_key),
+                    (author_name, author_alias, author_alias_key)
+                ]:
+                    if key not in self.sent and key not in new_keys:
+                        new_keys.add(key)
+                        new_aliases.append(dict(name=name, alias=alias, key=key))
+
+        return resolved, new_aliases
+
+    def mark_sent(self, new_aliases):
+        with self.lock:
+            self.sent.update(alias['key'] for alias in new_aliases)
 
-    return new_aliases
+
+def get_ack_lag(session, repository, max_id):
+    # commits we have sent that analytics has not acked yet
+    return session.connection().execute(
+        select([
+            func.count(commits.c.id)
+        ]).where(
+            and_(
+                commits.c.repository_id == repository.id,
+                commits.c.analytics_commit_synced_at == None,
+                commits.c.id <= max_id
+            )
+        )
+    ).scalar()
 
 
-def send_for_repository(repository_key, repository=None, organization_key=None, batch_size=None, session=None):
+def send_for_repository(repository_key, repository=None, organization_key=None, batch_size=None, session=None,
+                        rate_limiter=None, resume=False, alias_cache=None):
     with db.orm_session(session) as session:
         if repository is None:
             repository = Repository.find_by_repository_key(session, repository_key)
@@ -66,112 +172,128 @@ def send_for_repository(repository_key, repository=None, organization_key=None,
             if batch_size is None:
                 batch_size = 1000
 
-            total = session.connection().execute(
-                select([
-                    func.count(commits.c.id)
-                ]).where(
-                    and_(
-                        commits.c.repository_id == repository.id,
-                        commits.c.analytics_commit_synced_at == None
-                    )
+            checkpoint = checkpoints.load_checkpoint(repository.id, 'commit_history') if resume else None
+            if checkpoint is not None:
+                # everything up to the checkpoint has been sent, so there is no need to count it again.
+                total = None
+                logger.info(
+                    f"Resuming from commit id {checkpoint['last_id']} after {checkpoint['batches_sent']} batches"
                 )
-            ).scalar()
-            if total > 0:
-                logger.info(f"{total} commits to sync")
-
-            committers = contributor_aliases.alias('committer')
-            authors = contributor_aliases.alias('author')
+            else:
+                total = session.connection().execute(
+                    select([
+                        func.count(commits.c.id)
+                    ]).where(
+                        and_(
+                            commits.c.repository_id == repository.id,
+                            commits.c.analytics_commit_synced_at == None
+                        )
+                    )
+                ).scalar()
+                if total > 0:
+                    logger.info(f"{total} commits to sync")
+                checkpoint = dict(last_id=0, batches_sent=0, synced=0, started_at=datetime.utcnow())
 
-            contributor_alias_cache = set()
+            if alias_cache is None:
+                alias_cache = ContributorAliasCache().preload(session, [repository.id])
 
-            batch = 0
+            batch = checkpoint['batches_sent']
             synced = 0
-            max_id = 0
-            while synced < total:
-                commit_batch = session.connection().execute(
-                    select([
-                        *commits.columns,
-                        committers.c.alias.label('committer_alias'),
-                        committers.c.display_name.label('committer_name'),
-                        committers.c.key.label('committer_alias_key'),
-                        authors.c.alias.label('author_alias'),
-                        authors.c.display_name.label('author_name'),
-                        authors.c.key.label('author_alias_key')
-                    ]).select_from(
-                        commits.join(
-                            committers, committers.c.id == commits.c.committer_alias_id
-                        ).join(
-                            authors, authors.c.id == commits.c.author_alias_id
+            max_id = checkpoint['last_id']
+            flow_controller = commit_replay_flow_controller(batch_size, rate_limiter)
+            try:
+                while total is None or synced < total:
+                    commit_batch = session.connection().execute(
+                        select([
+                            *commits.columns
+                        ]).where(
+                            and_(
+                                commits.c.repository_id == repository.id,
+                                commits.c.analytics_commit_synced_at == None,
+                                commits.c.committer_alias_id != None,
+                                commits.c.author_alias_id != None,
+                                commits.c.id > bindparam('max_id')
+                            )
+                        ).order_by(
+                            commits.c.id
+                        ).limit(
+                            flow_controller.batch_size
+                        ),
+                        dict(max_id=max_id)
+                    ).fetchall()
+                    if len(commit_batch) > 0:
+                        max_id = commit_batch[len(commit_batch)-1].id
+
+                        if batch > 0:
+                            logger.info(f"Processing batch: {batch}")
+
+                        new_commits, new_contributor_aliases = alias_cache.resolve_batch(session, commit_batch)
+
+                        publish.commit_history_imported(
+                            dict(
+                                organization_key=organization_key,
+                                repository_name=repository.name,
+                                repository_key=repository.key,
+                                total_commits=len(commit_batch),
+                                new_commits=new_commits,
+                                new_contributors=new_contributor_aliases
+                            )
                         )
-                    ).where(
-                        and_(
-                            commits.c.repository_id == repository.id,
-                            commits.c.analytics_commit_synced_at == None,
-                            commits.c.id > bindparam('max_id')
+                        alias_cache.mark_sent(new_contributor_aliases)
+                        synced = synced + len(commit_batch)
+                        checkpoints.save_checkpoint(
+                            repository.id,
+                            'commit_history',
+                            last_id=max_id,
+                            batches_sent=batch + 1,
+                            synced=checkpoint['synced'] + synced,
+                            started_at=checkpoint['started_at']
                         )
-                    ).order_by(
-                        commits.c.id
-                    ).limit(
-                        batch_size
-                    ),
-                    dict(max_id=max_id)
-                ).fetchall()
-                if len(commit_batch) > 0:
-                    max_id = commit_batch[len(commit_batch)-1].id
-
-                    if batch > 0:
-                        logger.info(f"Processing batch: {batch}")
-
-                    new_contributor_aliases = resolve_new_aliases(commit_batch, contributor_alias_cache)
-
-                    publish.publish_commit_history_imported(
-                        dict(
-                            organization_key=organization_key,
-                            repository_name=repository.name,
-                            repository_key=repository.key,
-                            total_commits=len(commit_batch),
-                            new_commits=commit_batch,
-                            new_contributors=new_contributor_aliases
+                        flow_controller.sent(
+                            len(commit_batch),
+                            lag=get_ack_lag(session, repository, max_id) if flow_controller.max_lag else None
                         )
-                    )
-                    synced = synced + len(commit_batch)
-                    time.sleep(2)
-                else:
-                    break
+                    else:
+                        break
 
-                batch = batch + 1
+                    batch = batch + 1
+            finally:
+                flow_controller.close()
+            flow_controller.report(f'Sync commit history for repository {repository.name}')
+            if batch > checkpoint['batches_sent'] or checkpoint['last_id'] > 0:
+                checkpoints.clear_checkpoint(repository.id, 'commit_history')
 
             logger.info(f'Synced {synced} commits for repository {repository.name}')
-        return total
+        return total if total is not None else synced
 
 
-def send_for_organization(organization_key, batch_size):
+def send_for_organization(organization_key, batch_size, workers=1, max_rate=None, resume=False):
+    # the aliases of every commit waiting in the organization are loaded with one query up front,
+    # and the cache is shared by all of its repositories.
     with db.orm_session() as session:
-        organization = Organization.find_by_organization_key(session, organization_key)
-        with Timer(
-            action=f"sync unacked commits for organization {organization.name}",
-            use_logger=logger,
-            loglevel=logging.INFO
-        ):
-            total = 0
-            repositories = Repository.find_by_organization_key(session, organization_key)
-            for repository in repositories:
-                total = total + send_for_repository(
-                    repository_key=repository.key,
-                    repository=repository,
-                    organization_key=organization.organization_key,
-                    batch_size=batch_size,
-                    session=session
-                )
+        alias_cache = ContributorAliasCache().preload(
+            session,
+            [repository.id for repository in Repository.find_by_organization_key(session, organization_key)]
+        )
 
-            logger.info(f"{total} commits synced for organization {organization.name} ")
+    return replay.replay_organization(
+        organization_key,
+        send_for_repository,
+        action='Sync commit history',
+        batch_size=batch_size,
+        workers=workers,
+        max_rate=max_rate,
+        resume=resume,
+        repository_kwargs=dict(alias_cache=alias_cache)
+    )
 
 
-def commit_history_imported(organization_key=None, repository_key=None, batch_size=1000):
+def commit_history_imported(organization_key=None, repository_key=None, batch_size=1000, workers=1, max_rate=None,
+        resume=False):
     if repository_key is not None:
-        send_for_repository(repository_key, batch_size=batch_size)
+        send_for_repository(repository_key, batch_size=batch_size, resume=resume)
     elif organization_key is not None:
-        send_for_organization(organization_key, batch_size)
+        send_for_organization(organization_key, batch_size, workers, float(max_rate) if max_rate else None, resume)
     else:
         raise Exception("At least one of organization_key or repository_key must be specified")
 
@@ -17,33 +17,93 @@ from polaris.vcs.integrations.atlassian import BitBucketRepository
 from polaris.vcs.integrations.azure import AzureRepository
 from polaris.common import db
 from polaris.repos.db.model import Repository
+from polaris.repos.db.schema import RepositoryImportState
+from polaris.utils.config import get_config_provider
 from polaris.vcs import connector_factory
+from polaris.vcs.ttl_cache import TTLCache, snapshot
 
 log = logging.getLogger('polaris.vcs.service.repository_factory')
 
 
+config_provider = get_config_provider()
+
+# Bindings from (connector_key, repository source id) to a snapshot of the repository row and its connector.
+# Only imported, enabled repositories are cached, and the pull request sync re-checks the import state
+# in the database, so a binding that has gone stale within its ttl cannot cause a disabled repository to sync.
+repository_bindings_cache = TTLCache(
+    max_size=int(config_provider.get('REPOSITORY_BINDING_CACHE_SIZE', 4096)),
+    ttl=int(config_provider.get('REPOSITORY_BINDING_CACHE_TTL', 60))
+)
+
+
+def create_provider_impl(repository, connector):
+    if repository.integration_type == VcsIntegrationTypes.gitlab.value:
+        return GitlabRepository.create(repository, connector)
+    elif repository.integration_type == VcsIntegrationTypes.github.value:
+        return GithubRepository.create(repository, connector)
+    elif repository.integration_type == VcsIntegrationTypes.bitbucket.value:
+        return BitBucketRepository.create(repository, connector)
+    elif repository.integration_type == VcsIntegrationTypes.azure.value:
+        return AzureRepository.create(repository, connector)
+    else:
+        log.info(f'Could not determine repository_implementation for repository_key {repository.key}')
+
+
 def get_provider_impl(repository_key, join_this=None):
     with db.orm_session(join_this) as session:
         repository = Repository.find_by_repository_key(session, repository_key)
         if repository:
-
-            connector = connector_factory.get_connector(
-                connector_key=repository.connector_key,
-                join_this=session
-            )
+            connector = connector_factory.get_cached_connector(repository.connector_key)
             if connector:
-                if repository.integration_type == VcsIntegrationTypes.gitlab.value:
-                    return GitlabRepository.create(repository, connector)
-                elif repository.integration_type == VcsIntegrationTypes.github.value:
-                    return GithubRepository.create(repository, connector)
-                elif repository.integration_type == VcsIntegrationTypes.bitbucket.value:
-                    return BitBucketRepository.create(repository, connector)
-                elif repository.integration_type == VcsIntegrationTypes.azure.value:
-                    return AzureRepository.create(repository, connector)
-                else:
-                    log.info(f'Could not determine repository_implementation for repository_key {repository.key}')
+                return create_provider_impl(repository, connector)
 
         else:
             raise ProcessingException(
                 f'Could not find repository with key {repository_key}'
             )
+
+
+def get_repository_binding(connector_key, repository_source_id):
+    """
+    Resolves the repository and connector for a webhook event. Returns a (repository, connector) tuple
+    if the repository exists and has been imported, or None otherwise.
+    """
+    cache_key = (str(connector_key), str(repository_source_id))
+    binding = repository_bindings_cache.get(cache_key)
+    if binding is None:
+        with db.orm_session() as session:
+            repository = Repository.find_by_connector_key_source_id(
+                session,
+                connector_key=connector_key,
+                source_id=repository_source_id
+            )
+            if repository is not None and \
+                    repository.import_state != RepositoryImportState.IMPORT_DISABLED and \
+                    repository.last_imported is not None:
+                connector = connector_factory.get_cached_connector(repository.connector_key)
+                if connector:
+                    binding = (
+                        snapshot(
+                            repository,
+                            latest_pull_request_update_timestamp=repository.latest_pull_request_update_timestamp
+                        ),
+                        connector
+                    )
+                    repository_bindings_cache.put(cache_key, binding)
+    return binding
+
+
+def invalidate_connector(connector_key):
+    connector_factory.invalidate_connector(connector_key)
+    repository_bindings_cache.invalidate_where(
+        lambda cache_key, _: cache_key[0] == str(connector_key)
+    )
+
+
+def invalidate_repository(connector_key, repository_source_id):
+    repository_bindings_cache.invalidate((str(connector_key), str(repository_source_id)))
+
+
+def clear_caches():
+    connector_factory.connectors_cache.clear()
+    repository_bindings_cache.clear()
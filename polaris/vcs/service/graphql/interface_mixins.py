@@ -8,13 +8,18 @@
 
 # Author: Krishna Kumar
 
+from promise import Promise
+
 from polaris.graphql.utils import create_tuple, init_tuple
 from polaris.graphql.mixins import KeyIdResolverMixin
 from .interfaces import RepositoryInfo, SyncStateSummary
+from .loaders import get_loader
 
 
 class RepositoryInfoResolverMixin(KeyIdResolverMixin):
     repository_info_tuple = create_tuple(RepositoryInfo)
+    # interface name -> query(keys), used to batch the interface across the nodes of a request.
+    interface_loader_queries = {}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -32,24 +37,41 @@ class RepositoryInfoResolverMixin(KeyIdResolverMixin):
             self.repository_info = self.resolve_repository_info_interface(info, **kwargs)
         return self.repository_info
 
+    def set_repository_info(self, repository_info):
+        self.repository_info = repository_info
+        return repository_info
+
+    def load_repository_info(self, info, **kwargs):
+        if self.repository_info is None:
+            loader = get_loader(info, 'RepositoryInfo', self.interface_loader_queries.get('RepositoryInfo'))
+            if loader is not None:
+                return loader.load(str(self.key)).then(self.set_repository_info)
+        return Promise.resolve(self.get_repository_info(info, **kwargs))
+
+    def repository_info_field(self, info, field, **kwargs):
+        return self.load_repository_info(info, **kwargs).then(
+            lambda repository_info: getattr(repository_info, field) if repository_info is not None else None
+        )
+
     def resolve_url(self, info, **kwargs):
-        return self.get_repository_info(info, **kwargs).url
+        return self.repository_info_field(info, 'url', **kwargs)
 
     def resolve_description(self, info, **kwargs):
-        return self.get_repository_info(info, **kwargs).description
+        return self.repository_info_field(info, 'description', **kwargs)
 
     def resolve_integration_type(self, info, **kwargs):
-        return self.get_repository_info(info, **kwargs).integration_type
+        return self.repository_info_field(info, 'integration_type', **kwargs)
 
     def resolve_import_state(self, info, **kwargs):
-        return self.get_repository_info(info, **kwargs).import_state
+        return self.repository_info_field(info, 'import_state', **kwargs)
 
     def resolve_public(self, info, **kwargs):
-        return self.get_repository_info(info, **kwargs).public
+        return self.repository_info_field(info, 'public', **kwargs)
 
 
 class SyncStateSummaryResolverMixin(KeyIdResolverMixin):
     sync_state_summary_tuple = create_tuple(SyncStateSummary)
+    interface_loader_queries = {}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -67,5 +89,21 @@ class SyncStateSummaryResolverMixin(KeyIdResolverMixin):
             self.sync_state_summary = self.resolve_sync_state_summary_interface(info, **kwargs)
         return self.sync_state_summary
 
+    def set_sync_state_summary(self, sync_state_summary):
+        self.sync_state_summary = sync_state_summary
+        return sync_state_summary
+
+    def load_sync_state_summary(self, info, **kwargs):
+        if self.sync_state_summary is None:
+            loader = get_loader(info, 'SyncStateSummary', self.interface_loader_queries.get('SyncStateSummary'))
+            if loader is not None:
+                return loader.load(str(self.key)).then(self.set_sync_state_summary)
+        return Promise.resolve(self.get_sync_state_summary(info, **kwargs))
+
     def get_commits_in_process(self, info, **kwargs):
         return self.get_sync_state_summary(info, **kwargs).commits_in_process
+
+    def resolve_commits_in_process(self, info, **kwargs):
+        return self.load_sync_state_summary(info, **kwargs).then(
+            lambda sync_state_summary: sync_state_summary.commits_in_process if sync_state_summary is not None else 0
+        )
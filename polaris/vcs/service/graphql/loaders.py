@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Request scoped loaders for the repository interfaces. Nodes that were not resolved with an interface
+# ask the loader for it by key, and the loader resolves the keys collected across the whole response
+# with one query per interface, instead of one query per node.
+#
+# The loaders are kept on info.context, so they live as long as the request. When there is no context,
+# as when the schema is executed directly, get_loader returns None and the mixins resolve each instance
+# on its own as before.
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from polaris.common import db
+
+
+class InterfaceLoader(DataLoader):
+    """
+    Loads the interface rows for a set of node keys. query(keys) returns a select with a key
+    column and the interface fields.
+    """
+
+    def __init__(self, query, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query = query
+
+    def batch_load_fn(self, keys):
+        with db.orm_session() as session:
+            rows = {
+                str(row.key): row
+                for row in session.connection().execute(self.query(keys)).fetchall()
+            }
+        return Promise.resolve([rows.get(key) for key in keys])
+
+
+def get_loader(info, interface, query):
+    context = info.context
+    if context is None or query is None:
+        return None
+
+    if isinstance(context, dict):
+        loaders = context.setdefault('interface_loaders', {})
+    else:
+        loaders = getattr(context, 'interface_loaders', None)
+        if loaders is None:
+            loaders = {}
+            setattr(context, 'interface_loaders', loaders)
+
+    loader = loaders.get(interface)
+    if loader is None:
+        loader = InterfaceLoader(query)
+        loaders[interface] = loader
+    return loader
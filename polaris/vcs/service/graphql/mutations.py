@@ -126,6 +126,17 @@ class TestVcsConnector(graphene.Mutation):
             )
 
 
+def publish_connector_changed(connector, event):
+    # The message listeners cache connectors in each process, invalidate_connector above only
+    # covers this one.
+    publish.connector_event(
+        connector_key=connector.key,
+        connector_type=connector.type,
+        product_type=connector.product_type,
+        event=event
+    )
+
+
 class CreateVcsConnector(CreateConnector):
     connector = VcsConnector.Field(key_is_required=False)
 
@@ -142,11 +153,13 @@ class CreateVcsConnector(CreateConnector):
                 can_create = commands.test_vcs_connector(connector.key, join_this=session)
 
             if can_create:
+                commands.invalidate_connector(connector.key)
                 resolved = CreateConnector(
                     connector=VcsConnector.resolve_field(info, connector.key)
                 )
                 # Do the publish right at the end.
                 integrations_publish.connector_created(connector)
+                publish_connector_changed(connector, 'created')
                 return resolved
             else:
                 raise ProcessingException("Could not create connector: Connector test failed")
@@ -160,12 +173,14 @@ class EditVcsConnector(EditConnector):
         with db.orm_session() as session:
             connector = update_connector(edit_connector_input.connector_type, edit_connector_input,
                                          join_this=session)
+            commands.invalidate_connector(connector.key)
             if commands.test_vcs_connector(connector.key, join_this=session):
                 resolved = EditConnector(
                     connector=VcsConnector.resolve_field(info, connector.key)
                 )
                 # Do the publish right at the end.
                 # integrations_publish.connector_created(connector)
+                publish_connector_changed(connector, 'updated')
                 return resolved
             else:
                 raise ProcessingException("Could not update connector: Connector test failed")
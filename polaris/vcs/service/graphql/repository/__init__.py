@@ -16,7 +16,8 @@ from polaris.graphql.interfaces import NamedNode
 from polaris.graphql.selectable import Selectable, CountableConnection, ConnectionResolverMixin
 from ..interfaces import RepositoryInfo, SyncStateSummary
 from ..interface_mixins import RepositoryInfoResolverMixin, SyncStateSummaryResolverMixin
-from .selectable import RepositoryNode, RepositorySyncStateSummary
+from .selectable import RepositoryNode, RepositorySyncStateSummary, repository_info_by_keys, \
+    sync_state_summary_by_keys
 from ..enums import RepositoryImportMode
 
 
@@ -33,6 +34,11 @@ class Repository(
         named_node_resolver = RepositoryNode
         connection_class = lambda: Repositories
 
+    interface_loader_queries = {
+        'RepositoryInfo': repository_info_by_keys,
+        'SyncStateSummary': sync_state_summary_by_keys
+    }
+
     @classmethod
     def ConnectionField(cls, named_node_resolver=None, **kwargs):
         return super().ConnectionField(
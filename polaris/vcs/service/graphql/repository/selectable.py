@@ -13,7 +13,7 @@ from polaris.graphql.interfaces import NamedNode
 from ..interfaces import RepositoryInfo, SyncStateSummary
 
 from polaris.repos.db.model import repositories
-from polaris.repos.db.schema import commits
+from polaris.vcs.db.impl.sync_state_counters import repository_sync_state_counters
 
 from .sql_expressions import repository_info_columns
 
@@ -39,17 +39,46 @@ class RepositorySyncStateSummary:
 
     @staticmethod
     def selectable(repository_nodes, **kwargs):
+        # commits in process are counted incrementally by triggers on repos.commits,
+        # so this is a lookup per repository rather than a count over its commits.
         return select(
             [
                 repository_nodes.c.id,
-                func.count(commits.c.id).label('commits_in_process')
+                func.coalesce(repository_sync_state_counters.c.commits_in_process, 0).label('commits_in_process')
             ]
         ).select_from(
             repository_nodes.outerjoin(
-                commits, commits.c.repository_id == repository_nodes.c.id
+                repository_sync_state_counters,
+                repository_sync_state_counters.c.repository_id == repository_nodes.c.id
             )
-        ).where(
-            commits.c.sync_state == 0
-        ).group_by(
-            repository_nodes.c.id
         )
+
+
+# Queries for the interface loaders: the interface fields for all the repositories with the given keys.
+
+def repository_info_by_keys(keys):
+    return select([
+        repositories.c.key,
+        *repository_info_columns(repositories)
+    ]).where(
+        repositories.c.key.in_(keys)
+    )
+
+
+def sync_state_summary_by_keys(keys):
+    repository_nodes = select([
+        repositories.c.id,
+        repositories.c.key
+    ]).where(
+        repositories.c.key.in_(keys)
+    ).alias('repository_nodes')
+
+    sync_state_summary = RepositorySyncStateSummary.selectable(repository_nodes).alias('sync_state_summary')
+    return select([
+        repository_nodes.c.key,
+        sync_state_summary.c.commits_in_process
+    ]).select_from(
+        repository_nodes.join(
+            sync_state_summary, sync_state_summary.c.id == repository_nodes.c.id
+        )
+    )
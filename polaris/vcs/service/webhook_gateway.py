@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+"""
+An optional standalone ingress for provider webhooks.
+
+The gateway accepts the same urls as the webhook blueprints mounted by the service endpoint, so it can
+be put in front of (or instead of) the flask app for these paths without re-registering any hooks.
+Events are queued for a single publisher thread, which publishes the events that arrive together to
+VcsTopic as one broker transaction, and each request is answered only once its event is published, so an
+acknowledged event is never lost. When the queue is full or the publish fails the gateway answers 503
+so that the provider retries later, and counts the request as shed or failed.
+
+Atlassian Connect requests must have their JWT verified against the installed connector record
+before they can be acknowledged, so they are handed to the flask app in a worker thread. Each worker
+thread publishes on a broker connection of its own, so the gateway needs MQ_URL.
+
+Run with: python -m polaris.vcs.service.webhook_gateway
+"""
+
+import asyncio
+import io
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pika
+
+from polaris.utils.config import get_config_provider
+from polaris.utils.exceptions import ProcessingException
+from polaris.utils.logging import config_logging
+from polaris.messaging.topics import VcsTopic
+from polaris.messaging.utils import init_topics_to_publish
+from polaris.vcs.messaging import publish
+from polaris.vcs.integrations.github import github_webhooks
+from polaris.vcs.integrations.gitlab import gitlab_webhooks
+from polaris.vcs.integrations.azure import azure_webhooks
+
+config_provider = get_config_provider()
+
+logger = logging.getLogger('polaris.vcs.service.webhook_gateway')
+
+# GitHub caps webhook payloads at 25MB, anything larger is not a webhook.
+MAX_BODY_SIZE = 25 * 1024 * 1024
+
+# Limits on the header section of a request. A single line is also limited by the stream reader,
+# to 64KB by default.
+MAX_HEADER_COUNT = 100
+MAX_HEADER_SIZE = 64 * 1024
+
+routes = [
+    (re.compile(r'^/github/repository/webhooks/(?P<connector_key>[^/]+)/?$'), 'github'),
+    (re.compile(r'^/gitlab/repository/(push|webhooks)/(?P<connector_key>[^/]+)/?$'), 'gitlab'),
+    (re.compile(r'^/azure/repository/webhooks/(?P<connector_key>[^/]+)/?$'), 'azure'),
+]
+
+publishers = dict(
+    github=publish.github_repository_event,
+    gitlab=publish.gitlab_repository_event,
+    azure=publish.azure_repository_event,
+)
+
+reasons = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+    503: 'Service Unavailable',
+}
+
+
+class RequestError(Exception):
+    # a malformed request, answered with status before the connection is closed.
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class Headers(dict):
+    # HTTP header names are case insensitive.
+    def __setitem__(self, key, value):
+        super().__setitem__(key.lower(), value)
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+def route(path):
+    for pattern, provider in routes:
+        match = pattern.match(path)
+        if match is not None:
+            return provider, match['connector_key']
+    return None, None
+
+
+def resolve_event_type(provider, headers, body):
+    if provider == 'github':
+        return github_webhooks.resolve_event_type(headers, body)
+    if provider == 'gitlab':
+        return gitlab_webhooks.resolve_event_type(headers, body)
+    if provider == 'azure':
+        return azure_webhooks.resolve_event_type(body)
+
+
+class GatewayMetrics:
+
+    def __init__(self):
+        self.received = 0
+        self.queued = 0
+        self.ignored = 0
+        self.shed = 0
+        self.published = 0
+        self.failed = 0
+        self.batches = 0
+        self.publish_time = 0.0
+
+    def snapshot(self, queue_depth):
+        return dict(
+            received=self.received,
+            queued=self.queued,
+            ignored=self.ignored,
+            shed=self.shed,
+            published=self.published,
+            failed=self.failed,
+            batches=self.batches,
+            queue_depth=queue_depth,
+            mean_batch_publish_ms=round(1000 * self.publish_time / self.batches, 1) if self.batches else 0
+        )
+
+
+class BatchPublisher:
+    """
+    Publishes batches of events on a single broker channel in transaction mode, so that a batch costs
+    one commit on the broker and is either published as a whole or not at all. All calls are made from
+    one worker thread, since pika channels are not thread safe.
+
+    The channel is on a connection of its own rather than the process wide default one, which the
+    Atlassian Connect handlers would otherwise share from other threads, so this requires MQ_URL.
+    """
+
+    def __init__(self, broker_url=None):
+        self.broker_url = broker_url or config_provider.get('MQ_URL')
+        if self.broker_url is None:
+            raise ProcessingException('MQ_URL must be set to run the webhook gateway')
+        self.connection = None
+        self.channel = None
+
+    def get_channel(self):
+        if self.channel is None or self.channel.is_closed:
+            self.close()
+            self.connection = pika.BlockingConnection(pika.URLParameters(self.broker_url))
+            self.channel = self.connection.channel()
+            self.channel.tx_select()
+        return self.channel
+
+    def publish_events(self, events):
+        channel = self.get_channel()
+        for provider, event_type, connector_key, body in events:
+            publishers[provider](event_type, connector_key, body, channel=channel)
+        channel.tx_commit()
+
+    def publish_batch(self, events):
+        try:
+            self.publish_events(events)
+        except Exception as exc:
+            # the open transaction is lost with the channel, so reconnect and publish the whole batch once more.
+            logger.warning(f'Batch publish failed, reconnecting: {exc}')
+            self.close()
+            self.publish_events(events)
+        return len(events)
+
+    def close(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception as exc:
+            logger.warning(f'Error closing publisher connection: {exc}')
+        finally:
+            self.connection = None
+            self.channel = None
+
+
+class WebhookGateway:
+
+    def __init__(self, queue_size=None, batch_size=None, batch_window=None, metrics_interval=None,
+                 publisher=None, wsgi_app=None):
+        self.queue_size = int(queue_size or config_provider.get('WEBHOOK_GATEWAY_QUEUE_SIZE', 10000))
+        self.batch_size = int(batch_size or config_provider.get('WEBHOOK_GATEWAY_BATCH_SIZE', 100))
+        self.batch_window = float(batch_window or config_provider.get('WEBHOOK_GATEWAY_BATCH_WINDOW', 0.05))
+        self.metrics_interval = float(
+            metrics_interval or config_provider.get('WEBHOOK_GATEWAY_METRICS_INTERVAL', 60)
+        )
+        self.publisher = publisher or BatchPublisher()
+        self.wsgi_app = wsgi_app
+        self.metrics = GatewayMetrics()
+        self.queue = None
+        # one thread for publishing, so that the broker channel stays on a single thread.
+        self.publish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhook-publisher')
+        self.wsgi_executor = ThreadPoolExecutor(
+            max_workers=int(config_provider.get('WEBHOOK_GATEWAY_WSGI_THREADS', 4)),
+            thread_name_prefix='webhook-wsgi'
+        )
+        # the flask handlers publish from the wsgi threads, each on a connection of its own. Every
+        # message is committed as it is published, before the request is answered.
+        self.wsgi_batches = publish.ThreadBatches(size=1) if wsgi_app is not None else None
+
+    def get_queue(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        return self.queue
+
+    async def accept(self, provider, connector_key, headers, body):
+        """
+        Queues a webhook delivery, waits for it to be published and returns the status code to answer with.
+        """
+        self.metrics.received = self.metrics.received + 1
+        try:
+            event_type = resolve_event_type(provider, headers, body)
+        except Exception as exc:
+            logger.error(f'Invalid {provider} webhook request for connector {connector_key}: {exc}')
+            return 400
+
+        if event_type is None:
+            # pings and event types we do not subscribe to
+            self.metrics.ignored = self.metrics.ignored + 1
+            return 200
+
+        published = asyncio.get_running_loop().create_future()
+        try:
+            self.get_queue().put_nowait(((provider, event_type, connector_key, body), published))
+        except asyncio.QueueFull:
+            self.metrics.shed = self.metrics.shed + 1
+            return 503
+
+        self.metrics.queued = self.metrics.queued + 1
+        return 200 if await published else 503
+
+    async def next_batch(self):
+        queue = self.get_queue()
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def publish_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            start = time.monotonic()
+            try:
+                await loop.run_in_executor(
+                    self.publish_executor, self.publisher.publish_batch, [event for event, _ in batch]
+                )
+                published = True
+            except Exception as exc:
+                logger.exception(f'Batch publish failed: {exc}')
+                published = False
+            for _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_result(published)
+            self.metrics.publish_time = self.metrics.publish_time + time.monotonic() - start
+            self.metrics.batches = self.metrics.batches + 1
+            if published:
+                self.metrics.published = self.metrics.published + len(batch)
+            else:
+                self.metrics.failed = self.metrics.failed + len(batch)
+
+    async def report_metrics(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            logger.info(f'Webhook gateway: {self.metrics.snapshot(self.get_queue().qsize())}')
+
+    def call_wsgi_app(self, method, path, query, headers, body):
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': headers.get('Host', 'localhost').split(':')[0],
+            'SERVER_PORT': str(config_provider.get('WEBHOOK_GATEWAY_PORT', 8101)),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': headers.get('X-Forwarded-Proto', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            if name not in ('content-type', 'content-length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = response_headers
+
+        with publish.batch(publish_batch=self.wsgi_batches.get()):
+            result = self.wsgi_app(environ, start_response)
+            try:
+                response_body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return response['status'], response['headers'], response_body
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        path = url.path
+
+        if path.startswith('/atlassian_connect') and self.wsgi_app is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.wsgi_executor, self.call_wsgi_app, method, path, url.query, headers, body
+            )
+
+        if path.rstrip('/') == '/azure/webhooks/ping':
+            return status_line(200), [], b'ok'
+
+        provider, connector_key = route(path)
+        if provider is None:
+            return status_line(404), [], b''
+
+        return status_line(await self.accept(provider, connector_key, headers, body.decode('utf-8'))), [], b''
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    # the request line is longer than the stream reader limit
+                    await write_response(writer, status_line(400), [], b'', keep_alive=False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await write_response(writer, status_line(400), [], b'', keep_alive=False)
+                    break
+
+                try:
+                    headers = await read_headers(reader)
+                    body = await read_body(reader, headers)
+                except RequestError as exc:
+                    await write_response(writer, status_line(exc.status), [], b'', keep_alive=False)
+                    break
+
+                try:
+                    status, response_headers, response_body = await self.dispatch(method, target, headers, body)
+                except Exception as exc:
+                    logger.exception(f'Error handling {method} {target}: {exc}')
+                    status, response_headers, response_body = status_line(500), [], b''
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('Connection', '').lower() != 'close'
+                await write_response(writer, status, response_headers, response_body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError) as exc:
+            logger.debug(f'Closing connection after a bad or interrupted request: {exc!r}')
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f'Webhook gateway listening on {host}:{port}')
+        tasks = [
+            asyncio.ensure_future(self.publish_batches()),
+            asyncio.ensure_future(self.report_metrics())
+        ]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.publish_executor.shutdown(wait=True)
+            self.publisher.close()
+            self.wsgi_executor.shutdown(wait=True)
+            if self.wsgi_batches is not None:
+                self.wsgi_batches.close()
+
+
+async def read_headers(reader):
+    headers = Headers()
+    count = 0
+    size = 0
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            # a header line longer than the stream reader limit
+            raise RequestError(431)
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        count = count + 1
+        size = size + len(line)
+        if count > MAX_HEADER_COUNT or size > MAX_HEADER_SIZE:
+            raise RequestError(431)
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip()] = value.strip()
+
+
+async def read_chunked_body(reader):
+    body = bytearray()
+    while True:
+        try:
+            size_line = await reader.readline()
+        except ValueError:
+            raise RequestError(400)
+        try:
+            # chunk extensions follow the size after a ';'
+            size = int(size_line.split(b';')[0].strip(), 16)
+        except ValueError:
+            raise RequestError(400)
+        if size == 0:
+            break
+        if size < 0:
+            raise RequestError(400)
+        if len(body) + size > MAX_BODY_SIZE:
+            raise RequestError(413)
+        body.extend(await reader.readexactly(size))
+        if await reader.readline() not in (b'\r\n', b'\n'):
+            raise RequestError(400)
+
+    # skip the trailer section
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+    return bytes(body)
+
+
+async def read_body(reader, headers):
+    transfer_encoding = headers.get('Transfer-Encoding')
+    if transfer_encoding is not None:
+        if transfer_encoding.lower() != 'chunked':
+            raise RequestError(501)
+        return await read_chunked_body(reader)
+
+    try:
+        content_length = int(headers.get('Content-Length', 0))
+    except ValueError:
+        raise RequestError(400)
+    if content_length < 0:
+        raise RequestError(400)
+    if content_length > MAX_BODY_SIZE:
+        raise RequestError(413)
+    return await reader.readexactly(content_length) if content_length else b''
+
+
+def status_line(status):
+    return f'{status} {reasons[status]}'
+
+
+async def write_response(writer, status, headers, body, keep_alive=True):
+    lines = [f'HTTP/1.1 {status}']
+    lines.extend(f'{name}: {value}' for name, value in headers if name.lower() not in ('content-length', 'connection'))
+    lines.append(f'Content-Length: {len(body)}')
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+
+if __name__ == "__main__":
+    config_logging()
+
+    # Make sure topics we interact with are available.
+    init_topics_to_publish(VcsTopic)
+
+    wsgi_app = None
+    if config_provider.get('WEBHOOK_GATEWAY_ATLASSIAN_CONNECT', 'true') == 'true':
+        from polaris.vcs.service.endpoint import app as wsgi_app
+
+    gateway = WebhookGateway(wsgi_app=wsgi_app)
+    asyncio.run(
+        gateway.serve(
+            host=config_provider.get('WEBHOOK_GATEWAY_HOST', '0.0.0.0'),
+            port=int(config_provider.get('WEBHOOK_GATEWAY_PORT', 8101))
+        )
+    )
@@ -9,6 +9,8 @@
 # Author: Krishna Kumar
 
 import argh
+from concurrent.futures import ThreadPoolExecutor
+
 from polaris.utils.agent import Agent
 from polaris.utils.logging import config_logging
 
@@ -16,7 +18,8 @@ from polaris.common import db
 from polaris.vcs.db import api
 from polaris.messaging.topics import VcsTopic
 from polaris.messaging.utils import init_topics_to_publish, shutdown
-from polaris.vcs.messaging import publish
+from polaris.vcs.messaging import publish, pull_request_events
+from polaris.vcs.messaging.flow_control import QueueDepthMonitor
 from logging import getLogger
 
 logger = getLogger('polaris.vcs.sync_agent')
@@ -24,37 +27,87 @@ logger = getLogger('polaris.vcs.sync_agent')
 
 class VcsSourceSyncAgent(Agent):
 
-    def run(self, days, limit):
-        self.loop(lambda: self.sync_pull_requests_with_source(days, limit))
-
-    def sync_pull_requests_with_source(self, days, limit):
+    def run(self, days, limit, publish_workers=4, max_queue_depth=5000):
+        self.loop(lambda: self.sync_pull_requests_with_source(days, limit, publish_workers, max_queue_depth))
+
+    def publish_sync_pull_requests(self, pull_requests, publish_batches=None):
+        published = 0
+        # each worker thread publishes on its own long lived connection.
+        with publish.batch(publish_batch=publish_batches.get() if publish_batches is not None else None):
+            for pull_request in pull_requests:
+                if self.exit_signal_received:
+                    break
+                publish.sync_pull_request(
+                    organization_key=pull_request['organization_key'],
+                    repository_key=pull_request['repository_key'],
+                    pull_request_key=pull_request['pull_request_key']
+                )
+                published = published + 1
+
+        return published
+
+    def sync_pull_requests_with_source(self, days, limit, publish_workers=4, max_queue_depth=5000):
         logger.info("Checking for pull requests to sync with remote source")
 
-        result = api.get_pull_requests_to_sync_with_source(days=days, limit=limit)
-        last_updated = None
-        while result['success']:
-            if len(result['pull_requests']) > 0:
-                for pull_request in result['pull_requests']:
-                    publish.sync_pull_request(
-                        organization_key=pull_request['organization_key'],
-                        repository_key=pull_request['repository_key'],
-                        pull_request_key=pull_request['pull_request_key']
+        if not publish.has_broker_url():
+            # without a broker url every publish goes through the shared channel,
+            # which only one thread may use.
+            publish_workers = 1
+
+        # Publishing is throttled on the depth of the queue that processes the
+        # sync messages, so that a large sweep does not flood the consumers.
+        queue_monitor = QueueDepthMonitor('vcs_vcs', max_depth=max_queue_depth)
+        # The publisher threads and their broker connections last for the whole sweep.
+        publish_batches = publish.ThreadBatches() if publish_workers > 1 else None
+        publishers = ThreadPoolExecutor(max_workers=publish_workers) if publish_batches is not None else None
+        published = 0
+        try:
+            with ThreadPoolExecutor(max_workers=1) as fetcher:
+                next_batch = fetcher.submit(api.get_pull_requests_to_sync_with_source, days=days, limit=limit)
+                while True:
+                    result = next_batch.result()
+                    if not result['success']:
+                        break
+
+                    pull_requests = result['pull_requests']
+                    if len(pull_requests) == 0:
+                        logger.info("No pull_requests left to sync...")
+                        break
+
+                    # fetch the next batch while this one is being published
+                    logger.info(f'Fetching next batch of {limit} pull requests')
+                    next_batch = fetcher.submit(
+                        api.get_pull_requests_to_sync_with_source,
+                        before=pull_requests[-1]['source_last_updated'],
+                        before_id=pull_requests[-1]['id'],
+                        days=days,
+                        limit=limit
                     )
-                    last_updated = pull_request['source_last_updated']
+
+                    queue_monitor.wait_for_capacity(should_stop=lambda: self.exit_signal_received)
+                    if publishers is None:
+                        published = published + self.publish_sync_pull_requests(pull_requests)
+                    else:
+                        for publishing in [
+                            publishers.submit(
+                                self.publish_sync_pull_requests,
+                                pull_requests[worker::publish_workers],
+                                publish_batches
+                            )
+                            for worker in range(publish_workers)
+                        ]:
+                            published = published + publishing.result()
+
                     if self.exit_signal_received:
                         shutdown()
                         break
+        finally:
+            queue_monitor.close()
+            if publishers is not None:
+                publishers.shutdown()
+                publish_batches.close()
 
-            else:
-                logger.info("No pull_requests left to sync...")
-                break
-
-            # fetch next batch
-            if self.exit_signal_received:
-                break
-            logger.info(f'Fetching next batch of {limit} pull requests')
-            result = api.get_pull_requests_to_sync_with_source(before=last_updated, days=days, limit=limit)
-
+        logger.info(f'Published {published} pull requests to sync with remote source')
         return True
 
 
@@ -66,66 +119,76 @@ class VcsAnalyticsSyncAgent(Agent):
     def sync_pull_requests_with_analytics(self, days, limit):
         logger.info("Checking for pull requests to sync with analytics")
 
-        result = api.get_pull_requests_to_sync_with_analytics(days=days, limit=limit)
-        last_updated = None
-        while result['success']:
-            if len(result['pull_requests']) > 0:
-                for pull_request in result['pull_requests']:
-                    pull_request_summary = pull_request['pull_request_summary']
-                    if pull_request_summary['is_new']:
-                        publish.pull_request_created_event(
-                            pull_request[
-                                'organization_key'
-                            ],
-                            pull_request[
-                                'repository_key'
-                            ],
-                            [
-                                pull_request_summary
-                            ]
+        with publish.batch():
+            result = api.get_pull_requests_to_sync_with_analytics(days=days, limit=limit)
+            last_updated = None
+            last_id = None
+            synced = 0
+            published = 0
+            while result['success']:
+                if len(result['pull_requests']) > 0:
+                    # one message per repository and kind of change rather than one per pull request
+                    published = published + pull_request_events.publish_pull_request_summaries(
+                        (
+                            pull_request['organization_key'],
+                            pull_request['repository_key'],
+                            pull_request['pull_request_summary']
                         )
-                    else:
-                        publish.pull_request_updated_event(
-                            pull_request[
-                                'organization_key'
-                            ],
-                            pull_request[
-                                'repository_key'
-                            ],
-                            [
-                                pull_request_summary
-                            ]
-                        )
-                    last_updated = pull_request_summary['updated_at']
+                        for pull_request in result['pull_requests']
+                    )
+                    synced = synced + len(result['pull_requests'])
+                    last_updated = result['pull_requests'][-1]['pull_request_summary']['updated_at']
+                    last_id = result['pull_requests'][-1]['id']
                     if self.exit_signal_received:
                         shutdown()
                         break
-            else:
-                logger.info('No pull requests to sync')
-                break
+                else:
+                    logger.info('No pull requests to sync')
+                    break
+
+                if self.exit_signal_received:
+                    break
+                # get the next batch
+                result = api.get_pull_requests_to_sync_with_analytics(
+                    before=last_updated, before_id=last_id, days=days, limit=limit
+                )
+
+        logger.info(f'Published {synced} pull requests to analytics in {published} messages')
+        return True
 
-            if self.exit_signal_received:
-                break
-            # get the next batch
-            result = api.get_pull_requests_to_sync_with_analytics(before=last_updated, days=days, limit=limit)
 
-        return True
+class SyncStateCounterReconcileAgent(Agent):
+
+    def run(self, batch_size):
+        self.loop(lambda: self.reconcile_sync_state_counters(batch_size))
+
+    def reconcile_sync_state_counters(self, batch_size):
+        logger.info("Reconciling sync state counters")
+        result = api.reconcile_sync_state_counters(batch_size=batch_size)
+        if result['success']:
+            logger.info(
+                f"Reconciled sync state counters for {result['reconciled']} repositories: "
+                f"{result['corrected']} corrected, {result['removed']} removed"
+            )
+        return result['success']
 
 
 # Command line drivers
 # This is the default command
-def start(name=None, poll_interval=None, one_shot=False, days=3, limit=100):
+def start(name=None, poll_interval=None, one_shot=False, days=3, limit=100, publish_workers=4,
+          max_queue_depth=5000):
     agent = VcsSourceSyncAgent(
         name=name,
         poll_interval=poll_interval,
         one_shot=one_shot
     )
     logger.info("Starting agent.")
-    agent.run(days, limit)
+    agent.run(days, limit, publish_workers, max_queue_depth)
 
 
-def sync_pull_requests_with_source(name=None, poll_interval=None, one_shot=False, days=3, limit=100):
-    start(name, poll_interval, one_shot, days, limit)
+def sync_pull_requests_with_source(name=None, poll_interval=None, one_shot=False, days=3, limit=100,
+                                   publish_workers=4, max_queue_depth=5000):
+    start(name, poll_interval, one_shot, days, limit, publish_workers, max_queue_depth)
 
 
 def sync_pull_requests_with_analytics(name=None, poll_interval=None, one_shot=False, days=1, limit=100):
@@ -138,6 +201,32 @@ def sync_pull_requests_with_analytics(name=None, poll_interval=None, one_shot=Fa
     agent.run(days, limit)
 
 
+def reconcile_sync_state_counters(name=None, poll_interval=3600, one_shot=False, batch_size=500):
+    agent = SyncStateCounterReconcileAgent(
+        name=name,
+        poll_interval=poll_interval,
+        one_shot=one_shot
+    )
+    logger.info("Starting SyncStateCounterReconcileAgent")
+    agent.run(batch_size)
+
+
+def install_sync_state_counters():
+    result = api.install_sync_state_counters()
+    if result['success']:
+        logger.info(f"Installed sync state counters for {result['reconciled']} repositories")
+    else:
+        logger.error(f"Failed to install sync state counters: {result.get('exception')}")
+
+
+def install_replay_checkpoints():
+    result = api.install_replay_checkpoints()
+    if result['success']:
+        logger.info("Installed replay checkpoints")
+    else:
+        logger.error(f"Failed to install replay checkpoints: {result.get('exception')}")
+
+
 if __name__ == '__main__':
     config_logging()
     logger.info("Connecting to database....")
@@ -148,5 +237,8 @@ if __name__ == '__main__':
     argh.dispatch_commands([
         start,
         sync_pull_requests_with_source,
-        sync_pull_requests_with_analytics
+        sync_pull_requests_with_analytics,
+        reconcile_sync_state_counters,
+        install_sync_state_counters,
+        install_replay_checkpoints
     ])
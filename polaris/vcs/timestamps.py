@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+# Timestamps reach us as datetimes from the database and as strings from providers and messages,
+# in whatever format and offset the sender used: "2020-06-11T18:57:00.000Z", "2020-06-11 18:57:00",
+# "2020-06-11T20:57:00+02:00". They have to be parsed before they are compared; comparing the strings
+# orders them by format rather than by time. Naive values are taken to be UTC, which is how they are
+# stored in the database.
+
+from datetime import datetime, timezone
+
+from dateutil.parser import isoparse
+
+
+def to_utc(value):
+    """
+    Returns an aware UTC datetime for a datetime or an ISO 8601 string, or None for None.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = isoparse(str(value))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def to_utc_naive(value):
+    """
+    Returns a naive UTC datetime, for binding to the TIMESTAMP WITHOUT TIME ZONE columns of the database.
+    """
+    value = to_utc(value)
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+def is_later(new, current):
+    """
+    True if new is at or after current. A missing timestamp on either side cannot be ordered, so the
+    new value is taken.
+    """
+    new, current = to_utc(new), to_utc(current)
+    if new is None or current is None:
+        return True
+    return new >= current
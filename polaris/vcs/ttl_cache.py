@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from sqlalchemy import inspect
+
+
+def snapshot(instance, **attributes):
+    """
+    Returns the column values of an ORM instance, and any extra attributes, as a plain object. Cached
+    values are shared by the handler threads, so they must not carry session state of their own.
+    """
+    values = {
+        attribute.key: getattr(instance, attribute.key)
+        for attribute in inspect(instance).mapper.column_attrs
+    }
+    values.update(attributes)
+    return SimpleNamespace(**values)
+
+
+class TTLCache:
+    """
+    A small thread safe LRU cache whose entries also expire ttl seconds after they were added.
+    A ttl of 0 disables the cache: gets always miss and puts are dropped.
+    """
+
+    def __init__(self, max_size=256, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits = self.hits + 1
+                    return value
+                del self.entries[key]
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, key, value):
+        if not self.ttl:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self.lock:
+            for key in [key for key, (value, _) in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
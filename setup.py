@@ -50,7 +50,8 @@ setup(
         'polaris.vcs.integrations.atlassian',
         'polaris.vcs.integrations.gitlab',
         'polaris.vcs.integrations.github',
-        'polaris.vcs.integrations.azure'
+        'polaris.vcs.integrations.azure',
+        'polaris.vcs.integrations.fetch'
 
     ],
     url='',
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from test.shared_fixtures import *
+from polaris.vcs.db import api
+from polaris.repos.db.model import pull_requests
+
+
+@pytest.fixture()
+def setup_pull_requests(setup_org_repo):
+    repository, organization = setup_org_repo
+    keys = [uuid.uuid4() for _ in range(3)]
+    with db.create_session() as session:
+        session.connection.execute(
+            pull_requests.insert([
+                dict(
+                    pull_requests_common_fields,
+                    source_id=str(1000 + i),
+                    source_display_id=str(i),
+                    repository_id=repository.id,
+                    source_repository_id=repository.id,
+                    key=key,
+                    last_sync=datetime.utcnow()
+                )
+                for i, key in enumerate(keys)
+            ])
+        )
+
+    yield keys
+
+
+def analytics_last_updated(key):
+    return db.connection().execute(
+        f"select analytics_last_updated from repos.pull_requests where key='{key}'"
+    ).scalar()
+
+
+class TestAckPullRequestEvent:
+
+    def it_acks_all_pull_requests_in_one_call(self, setup_pull_requests):
+        keys = setup_pull_requests
+        updated_at = datetime.utcnow().replace(microsecond=0)
+
+        result = api.ack_pull_request_event([
+            dict(key=str(key), updated_at=updated_at.isoformat())
+            for key in keys
+        ])
+        assert result['success']
+        assert result['updated'] == 3
+        assert all(analytics_last_updated(key) == updated_at for key in keys)
+
+    def it_applies_the_latest_of_duplicate_acks(self, setup_pull_requests):
+        key = setup_pull_requests[0]
+        latest = datetime.utcnow().replace(microsecond=0)
+
+        result = api.ack_pull_request_event([
+            dict(key=str(key), updated_at=latest.isoformat()),
+            dict(key=str(key), updated_at=(latest - timedelta(hours=1)).isoformat())
+        ])
+        assert result['success']
+        assert result['updated'] == 1
+        assert analytics_last_updated(key) == latest
+
+    def it_ignores_acks_that_go_back_in_time(self, setup_pull_requests):
+        key = setup_pull_requests[0]
+        latest = datetime.utcnow().replace(microsecond=0)
+        api.ack_pull_request_event([dict(key=str(key), updated_at=latest.isoformat())])
+
+        result = api.ack_pull_request_event([
+            dict(key=str(key), updated_at=(latest - timedelta(days=1)).isoformat())
+        ])
+        assert result['success']
+        assert result['updated'] == 0
+        assert analytics_last_updated(key) == latest
+
+    def it_stores_acks_with_offsets_in_utc(self, setup_pull_requests):
+        key = setup_pull_requests[0]
+
+        result = api.ack_pull_request_event([
+            dict(key=str(key), updated_at="2020-06-11T20:57:08.500+02:00")
+        ])
+        assert result['success']
+        assert analytics_last_updated(key) == datetime(2020, 6, 11, 18, 57, 8, 500000)
+
+    def it_compares_duplicate_acks_as_times(self, setup_pull_requests):
+        key = setup_pull_requests[0]
+
+        # as strings the first would sort last, but it is the earliest of the three.
+        result = api.ack_pull_request_event([
+            dict(key=str(key), updated_at="2020-06-11T19:00:00+02:00"),
+            dict(key=str(key), updated_at="2020-06-11T18:57:08Z"),
+            dict(key=str(key), updated_at="2020-06-11T18:57:08.777Z")
+        ])
+        assert result['success']
+        assert analytics_last_updated(key) == datetime(2020, 6, 11, 18, 57, 8, 777000)
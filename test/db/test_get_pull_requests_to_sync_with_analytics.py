@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from test.shared_fixtures import *
+from polaris.vcs.db import api
+from polaris.repos.db.model import pull_requests
+
+
+@pytest.fixture()
+def setup_pull_requests_to_sync(setup_org_repo):
+    repository, organization = setup_org_repo
+    now = datetime.utcnow()
+
+    def pull_request(i, source_last_updated, analytics_last_updated=None):
+        return dict(
+            pull_requests_common_fields,
+            source_id=str(1000 + i),
+            source_display_id=str(i),
+            description=f'Description {i}',
+            source_last_updated=source_last_updated,
+            analytics_last_updated=analytics_last_updated,
+            repository_id=repository.id,
+            source_repository_id=repository.id,
+            key=uuid.uuid4(),
+            last_sync=now
+        )
+
+    with db.create_session() as session:
+        session.connection.execute(
+            pull_requests.insert([
+                # never synced, in and before the window
+                pull_request(0, now - timedelta(hours=1)),
+                pull_request(1, now - timedelta(days=5)),
+                # synced, then updated at the source inside the window
+                pull_request(2, now - timedelta(hours=2), now - timedelta(hours=3)),
+                # synced, then updated at the source before the window
+                pull_request(3, now - timedelta(days=5, hours=1), now - timedelta(days=6)),
+                # synced and up to date
+                pull_request(4, now - timedelta(hours=4), now - timedelta(hours=4)),
+                # updated too recently to sync
+                pull_request(5, now - timedelta(minutes=1)),
+            ])
+        )
+
+    yield repository, organization
+
+
+class TestGetPullRequestsToSyncWithAnalytics:
+
+    def it_returns_new_and_out_of_date_pull_requests_newest_first(self, setup_pull_requests_to_sync):
+        result = api.get_pull_requests_to_sync_with_analytics(days=1, limit=10)
+
+        assert result['success']
+        summaries = [pr['pull_request_summary'] for pr in result['pull_requests']]
+        assert [summary['display_id'] for summary in summaries] == ['0', '2', '1']
+        assert [summary['is_new'] for summary in summaries] == [True, False, True]
+        assert summaries[0]['description'] == 'Description 0'
+
+    def it_pages_through_the_candidates(self, setup_pull_requests_to_sync):
+        seen = []
+        result = api.get_pull_requests_to_sync_with_analytics(days=1, limit=1)
+        while result['success'] and len(result['pull_requests']) > 0:
+            summary = result['pull_requests'][-1]['pull_request_summary']
+            seen.append(summary['display_id'])
+            result = api.get_pull_requests_to_sync_with_analytics(before=summary['updated_at'], days=1, limit=1)
+
+        # the window moves with before, so the out of date pull request from 5 days ago is reached too
+        assert seen == ['0', '2', '1', '3']
+
+    def it_pages_through_pull_requests_sharing_a_timestamp(self, setup_org_repo):
+        repository, organization = setup_org_repo
+        now = datetime.utcnow()
+        source_last_updated = now - timedelta(hours=1)
+
+        with db.create_session() as session:
+            session.connection.execute(
+                pull_requests.insert([
+                    dict(
+                        pull_requests_common_fields,
+                        source_id=str(2000 + i),
+                        source_display_id=str(i),
+                        source_last_updated=source_last_updated,
+                        analytics_last_updated=None,
+                        repository_id=repository.id,
+                        source_repository_id=repository.id,
+                        key=uuid.uuid4(),
+                        last_sync=now
+                    )
+                    for i in range(3)
+                ])
+            )
+
+        seen = []
+        result = api.get_pull_requests_to_sync_with_analytics(days=1, limit=1)
+        while result['success'] and len(result['pull_requests']) > 0:
+            last = result['pull_requests'][-1]
+            seen.append(last['pull_request_summary']['display_id'])
+            result = api.get_pull_requests_to_sync_with_analytics(
+                before=last['pull_request_summary']['updated_at'], before_id=last['id'], days=1, limit=1
+            )
+
+        assert result['success']
+        assert sorted(seen) == ['0', '1', '2']
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from test.shared_fixtures import *
+from polaris.vcs.db import api
+from polaris.repos.db.model import pull_requests
+
+
+@pytest.fixture()
+def setup_open_pull_requests(setup_org_repo):
+    repository, organization = setup_org_repo
+    # every pull request shares the same source_last_updated timestamp
+    source_last_updated = datetime.utcnow() - timedelta(days=10)
+    with db.create_session() as session:
+        session.connection.execute(
+            f"update repos.repositories set public=FALSE where key='{repository.key}'"
+        )
+        session.connection.execute(
+            pull_requests.insert([
+                dict(
+                    pull_requests_common_fields,
+                    source_id=str(1000 + i),
+                    source_display_id=str(i),
+                    state='open',
+                    source_state='open',
+                    source_last_updated=source_last_updated,
+                    repository_id=repository.id,
+                    source_repository_id=repository.id,
+                    key=uuid.uuid4(),
+                    last_sync=datetime.utcnow()
+                )
+                for i in range(5)
+            ])
+        )
+
+    yield repository, organization
+
+
+class TestGetPullRequestsToSyncWithSource:
+
+    def it_pages_through_pull_requests_that_share_a_timestamp(self, setup_open_pull_requests):
+        seen = set()
+        result = api.get_pull_requests_to_sync_with_source(days=3, limit=2)
+        while result['success'] and len(result['pull_requests']) > 0:
+            seen.update(pr['pull_request_key'] for pr in result['pull_requests'])
+            last = result['pull_requests'][-1]
+            result = api.get_pull_requests_to_sync_with_source(
+                before=last['source_last_updated'],
+                before_id=last['id'],
+                days=3,
+                limit=2
+            )
+
+        assert len(seen) == 5
+
+    def it_excludes_pull_requests_updated_inside_the_window(self, setup_open_pull_requests):
+        result = api.get_pull_requests_to_sync_with_source(days=30, limit=10)
+        assert result['success']
+        assert len(result['pull_requests']) == 0
@@ -8,6 +8,7 @@
 
 # Author: Pragya Goyal
 
+from datetime import timezone
 from unittest.mock import patch
 
 from ..shared_fixtures import *
@@ -201,3 +202,132 @@ class TestSyncGithubPullRequests:
         assert prs[0]['state'] == 'merged'
         assert db.connection().execute(
             "select count(*) from repos.pull_requests where source_id='61296045' and source_state='merged'").scalar() == 1
+
+
+@pytest.fixture()
+def setup_multiple_repos(setup_org_repo):
+    repository, organization = setup_org_repo
+    with db.orm_session() as session:
+        session.expire_on_commit = False
+        session.add(organization)
+        second_repository = Repository(
+            connector_key=github_connector_key,
+            organization_key=test_organization_key,
+            key=uuid.uuid4(),
+            name='second-test-repo',
+            source_id='2000',
+            import_state=RepositoryImportState.CHECK_FOR_UPDATES,
+            last_imported=datetime.utcnow(),
+            description='Another neat new repo',
+            integration_type=VcsIntegrationTypes.github.value,
+            url='https://foo.bar.com'
+        )
+        disabled_repository = Repository(
+            connector_key=github_connector_key,
+            organization_key=test_organization_key,
+            key=uuid.uuid4(),
+            name='disabled-test-repo',
+            source_id='3000',
+            import_state=RepositoryImportState.IMPORT_DISABLED,
+            description='A repo that has not been imported',
+            integration_type=VcsIntegrationTypes.github.value,
+            url='https://foo.bar.com'
+        )
+        organization.repositories.append(second_repository)
+        organization.repositories.append(disabled_repository)
+        session.flush()
+
+    yield repository, second_repository, disabled_repository
+
+
+class TestSyncPullRequestsForRepositories:
+
+    def it_syncs_pull_requests_for_multiple_repositories_in_one_call(self, setup_multiple_repos):
+        repository, second_repository, disabled_repository = setup_multiple_repos
+
+        result = api.sync_pull_requests_for_repositories({
+            str(repository.key): iter([[
+                dict(pull_requests_common_fields, source_id='1', source_display_id='1'),
+                dict(pull_requests_common_fields, source_id='2', source_display_id='2'),
+            ]]),
+            str(second_repository.key): iter([[
+                dict(
+                    pull_requests_common_fields,
+                    source_id='1',
+                    source_display_id='1',
+                    source_repository_source_id='2000',
+                    target_repository_source_id='2000'
+                ),
+            ]]),
+            str(disabled_repository.key): iter([[
+                dict(
+                    pull_requests_common_fields,
+                    source_repository_source_id='3000',
+                    target_repository_source_id='3000'
+                ),
+            ]])
+        })
+
+        assert result['success']
+        synced = {synced_repository['repository_key']: synced_repository for synced_repository in result['repositories']}
+        assert len(synced[str(repository.key)]['created']) == 2
+        assert len(synced[str(second_repository.key)]['created']) == 1
+        assert result['skipped_repositories'] == [str(disabled_repository.key)]
+        assert db.connection().execute("select count(*) from repos.pull_requests").scalar() == 3
+
+    def it_reports_updates_separately_from_creates(self, setup_multiple_repos):
+        repository, second_repository, _ = setup_multiple_repos
+
+        api.sync_pull_requests_for_repositories({
+            str(repository.key): iter([[dict(pull_requests_common_fields, source_id='1')]])
+        })
+        result = api.sync_pull_requests_for_repositories({
+            str(repository.key): iter([[
+                dict(
+                    pull_requests_common_fields,
+                    source_id='1',
+                    title='Updated title',
+                    source_last_updated="2020-06-12T18:57:08.777Z"
+                ),
+                dict(pull_requests_common_fields, source_id='2'),
+            ]])
+        })
+
+        assert result['success']
+        synced = result['repositories'][0]
+        assert len(synced['created']) == 1
+        assert len(synced['updated']) == 1
+        assert synced['updated'][0]['title'] == 'Updated title'
+
+
+class TestSyncPullRequestsWithCopy:
+
+    def it_loads_pull_requests_with_copy(self, setup_org_repo):
+        pull_requests = [
+            dict(pull_requests_common_fields, source_id='1', description='Line one\nLine\ttwo \\ done'),
+            dict(pull_requests_common_fields, source_id='2', source_merged_at=None),
+        ]
+
+        result = api.sync_pull_requests(test_repository_key, iter([pull_requests, []]), use_copy=True)
+        assert result['success']
+        assert len(result['pull_requests']) == 2
+        assert db.connection().execute(
+            "select description from repos.pull_requests where source_id='1'"
+        ).scalar() == 'Line one\nLine\ttwo \\ done'
+        assert db.connection().execute(
+            "select source_merged_at from repos.pull_requests where source_id='2'"
+        ).scalar() is None
+
+    def it_stores_aware_timestamps_in_utc(self, setup_org_repo):
+        pull_requests = [
+            dict(
+                pull_requests_common_fields,
+                source_last_updated=datetime(2020, 6, 11, 20, 57, 8, tzinfo=timezone(timedelta(hours=2)))
+            )
+        ]
+
+        result = api.sync_pull_requests(test_repository_key, iter([pull_requests]), use_copy=True)
+        assert result['success']
+        assert db.connection().execute(
+            f"select source_last_updated from repos.pull_requests where source_id='{pull_requests_common_fields['source_id']}'"
+        ).scalar() == datetime(2020, 6, 11, 18, 57, 8)
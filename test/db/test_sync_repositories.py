@@ -23,6 +23,20 @@ from polaris.vcs.db import api
 
 class TestSyncGithubRepositories:
 
+    def it_imports_repositories_streamed_from_a_generator_with_copy(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        source_repos = (
+            dict(repositories_common_fields, source_id=source_id, name=f'repo-{source_id}')
+            for source_id in ['20001', '20002']
+        )
+
+        result = api.sync_repositories(organization_key, connector_key, source_repos, use_copy=True)
+        assert result['success']
+        assert len(result['repositories']) == 2
+        assert all(repository['is_new'] for repository in result['repositories'])
+
     def it_imports_a_new_repository(self, setup_sync_repos):
         organization_key, connectors = setup_sync_repos
         connector_key = connectors['github']
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from test.shared_fixtures import *
+from polaris.vcs.db import api
+
+
+def commits_in_process(repository):
+    return db.connection().execute(
+        f"select commits_in_process from repos.repository_sync_state_counters "
+        f"where repository_id={repository.id}"
+    ).scalar()
+
+
+class TestSyncStateCounters:
+
+    def it_counts_commits_as_they_are_inserted(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+
+        assert commits_in_process(repository) == 2
+
+    def it_counts_changes_of_sync_state(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+
+        db.connection().execute(
+            f"update repos.commits set sync_state=1 where key='{setup_commits[0]['key']}'"
+        )
+        assert commits_in_process(repository) == 1
+
+        # updates that leave sync_state alone do not change the count
+        db.connection().execute(f"update repos.commits set commit_message='Amended' where repository_id={repository.id}")
+        assert commits_in_process(repository) == 1
+
+        db.connection().execute(f"update repos.commits set sync_state=0 where repository_id={repository.id}")
+        assert commits_in_process(repository) == 2
+
+    def it_counts_deleted_commits(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+
+        db.connection().execute(f"delete from repos.commits where key='{setup_commits[0]['key']}'")
+
+        assert commits_in_process(repository) == 1
+
+    def it_reconciles_counters_that_have_drifted(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+        db.connection().execute(
+            f"update repos.repository_sync_state_counters set commits_in_process=10 "
+            f"where repository_id={repository.id}"
+        )
+
+        result = api.reconcile_sync_state_counters()
+
+        assert result['success']
+        assert result['corrected'] == 1
+        assert commits_in_process(repository) == 2
@@ -10,10 +10,66 @@
 
 
 
+from sqlalchemy import event
+
 from test.shared_fixtures import *
 from graphene.test import Client
 from polaris.vcs.service.graphql import schema
 
+
+def add_repositories(organization, count):
+    with db.orm_session() as session:
+        session.add(organization)
+        for _ in range(count):
+            source_id = uuid.uuid4().hex
+            organization.repositories.append(
+                Repository(
+                    connector_key=github_connector_key,
+                    organization_key=test_organization_key,
+                    key=uuid.uuid4(),
+                    name=f'repo-{source_id}',
+                    source_id=source_id,
+                    import_state=RepositoryImportState.CHECK_FOR_UPDATES,
+                    description='Another repo',
+                    integration_type=VcsIntegrationTypes.github.value,
+                    url=f'https://foo.bar.com/{source_id}'
+                )
+            )
+
+
+def list_repositories():
+    # returns the response and the statements executed to resolve it.
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine(), 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = Client(schema).execute("""
+            query getConnectorRepositories($connectorKey: String!){
+                vcsConnector(key: $connectorKey) {
+                    repositories {
+                        edges {
+                            node {
+                                key
+                                url
+                                importState
+                                commitsInProcess
+                            }
+                        }
+                    }
+                }
+            }
+        """, variable_values=dict(
+            connectorKey=github_connector_key
+        ), context_value=dict())
+    finally:
+        event.remove(db.engine(), 'before_cursor_execute', before_cursor_execute)
+
+    return response, statements
+
+
 class TestRepositoryQueries:
 
     def it_returns_info_about_a_repository(self, setup_sync_repos):
@@ -45,5 +101,63 @@ class TestRepositoryQueries:
         assert response['data']['repository']['integrationType']
         assert response['data']['repository']['description']
 
+    def it_returns_the_commits_in_process(self, setup_sync_repos, setup_commits):
+        client = Client(schema)
+
+        response = client.execute("""
+            query getRepositorySyncState($repositoryKey: String!) {
+                repository(key: $repositoryKey, interfaces: [SyncStateSummary]) {
+                    commitsInProcess
+                }
+            }
+        """, variable_values=dict(
+            repositoryKey=test_repository_key
+        ))
 
+        assert response['data']
+        assert response['data']['repository']['commitsInProcess'] == 2
+
+    def it_resolves_interfaces_through_the_request_loaders(self, setup_sync_repos, setup_commits):
+        client = Client(schema)
+        context = dict()
+
+        response = client.execute("""
+            query getRepositoryInfo($repositoryKey: String!) {
+                repository(key: $repositoryKey) {
+                    url
+                    importState
+                    commitsInProcess
+                }
+            }
+        """, variable_values=dict(
+            repositoryKey=test_repository_key
+        ), context_value=context)
+
+        assert response['data']
+        assert response['data']['repository']['url']
+        assert response['data']['repository']['importState']
+        assert response['data']['repository']['commitsInProcess'] == 2
+        assert set(context['interface_loaders'].keys()) == {'RepositoryInfo', 'SyncStateSummary'}
+
+    def it_resolves_each_interface_of_a_repository_list_with_one_query(self, setup_org_repo, setup_sync_repos):
+        _, organization = setup_org_repo
+
+        add_repositories(organization, 1)
+        _, two_repositories = list_repositories()
+        add_repositories(organization, 3)
+        response, five_repositories = list_repositories()
+
+        assert response['data']
+        repositories = response['data']['vcsConnector']['repositories']['edges']
+        assert len(repositories) == 5
+        for repository in repositories:
+            assert repository['node']['url']
+            assert repository['node']['importState']
+            assert repository['node']['commitsInProcess'] == 0
 
+        # SyncStateSummary is not prefetched by the connection, so it is loaded for all the nodes at once.
+        assert len([
+            statement for statement in five_repositories if 'repository_sync_state_counters' in statement
+        ]) == 1
+        # and no interface costs a query per node.
+        assert len(five_repositories) == len(two_repositories)
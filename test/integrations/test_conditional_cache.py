@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import json
+import os
+import stat
+import uuid
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from polaris.vcs.integrations.fetch import conditional_cache
+from polaris.vcs.integrations.fetch.conditional_cache import ConditionalRequestCache, conditional_get
+
+projects_url = 'https://gitlab.com/api/v4/projects'
+
+
+def response(status_code=200, body=None, next_url=None, **headers):
+    return MagicMock(
+        status_code=status_code,
+        ok=200 <= status_code < 300,
+        text=json.dumps(body) if body is not None else '',
+        headers=headers,
+        links=dict(next=dict(url=next_url)) if next_url is not None else {}
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ConditionalRequestCache(str(tmp_path / 'conditional_requests.db'), ttl=3600, max_entries=3)
+    with patch.object(conditional_cache, 'get_conditional_cache', return_value=cache):
+        yield cache
+
+
+class TestConditionalGet:
+
+    def it_sends_the_validators_and_serves_not_modified_pages_from_the_cache(self, cache):
+        connector_key = uuid.uuid4()
+        session = MagicMock()
+        session.get.side_effect = [
+            response(body=[dict(id=1)], next_url=f'{projects_url}?page=2', ETag='"v1"'),
+            response(304)
+        ]
+        conditional_get(session, connector_key, projects_url, params=dict(membership=True))
+        page = conditional_get(session, connector_key, projects_url, params=dict(membership=True))
+
+        assert session.get.call_args_list[1][1]['headers']['If-None-Match'] == '"v1"'
+        assert page.from_cache
+        assert page.json() == [dict(id=1)]
+        assert page.links['next']['url'] == f'{projects_url}?page=2'
+
+    def it_keys_the_cache_by_the_full_query(self, cache):
+        connector_key = uuid.uuid4()
+        session = MagicMock()
+        session.get.side_effect = [response(body=[], ETag='"v1"'), response(body=[], ETag='"v2"')]
+        conditional_get(session, connector_key, projects_url, params=dict(page=1))
+        conditional_get(session, connector_key, projects_url, params=dict(page=2))
+
+        assert 'If-None-Match' not in session.get.call_args_list[1][1]['headers']
+        assert cache.count() == 2
+
+    def it_does_not_cache_pages_without_validators(self, cache):
+        session = MagicMock()
+        session.get.return_value = response(body=[])
+        conditional_get(session, uuid.uuid4(), projects_url)
+
+        assert cache.count() == 0
+
+    def it_is_a_plain_get_without_a_cache(self):
+        session = MagicMock()
+        with patch.object(conditional_cache, 'get_conditional_cache', return_value=None):
+            assert conditional_get(session, uuid.uuid4(), projects_url) is session.get.return_value
+
+
+class TestConditionalRequestCache:
+
+    def it_expires_entries_after_the_ttl(self, cache):
+        cache.put('connector', projects_url, '"v1"', None, '[]', None)
+        assert cache.get('connector', projects_url) is not None
+
+        with patch.object(conditional_cache.time, 'time', return_value=conditional_cache.time.time() + 3601):
+            assert cache.get('connector', projects_url) is None
+            cache.put('connector', f'{projects_url}?page=2', '"v2"', None, '[]', None)
+
+        # the expired entry is removed on the next write.
+        assert cache.count() == 1
+
+    def it_removes_the_least_recently_used_entries_beyond_the_max(self, cache):
+        now = conditional_cache.time.time()
+        for page in range(5):
+            with patch.object(conditional_cache.time, 'time', return_value=now + page):
+                cache.put('connector', f'{projects_url}?page={page}', f'"v{page}"', None, '[]', None)
+
+        assert cache.count() == 3
+        assert cache.get('connector', f'{projects_url}?page=1') is None
+        assert cache.get('connector', f'{projects_url}?page=4') is not None
+
+    def it_keeps_pages_served_from_the_cache(self, cache):
+        now = conditional_cache.time.time()
+        for page in range(3):
+            with patch.object(conditional_cache.time, 'time', return_value=now + page):
+                cache.put('connector', f'{projects_url}?page={page}', f'"v{page}"', None, '[]', None)
+        with patch.object(conditional_cache.time, 'time', return_value=now + 3):
+            cache.touch('connector', f'{projects_url}?page=0')
+        with patch.object(conditional_cache.time, 'time', return_value=now + 4):
+            cache.put('connector', f'{projects_url}?page=3', '"v3"', None, '[]', None)
+
+        assert cache.get('connector', f'{projects_url}?page=0') is not None
+        assert cache.get('connector', f'{projects_url}?page=1') is None
+
+    def it_creates_the_cache_file_readable_by_its_owner_only(self, cache):
+        assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+
+    def it_invalidates_a_connector(self, cache):
+        cache.put('connector', projects_url, '"v1"', None, '[]', None)
+        cache.put('other', projects_url, '"v1"', None, '[]', None)
+        cache.invalidate('connector')
+
+        assert cache.get('connector', projects_url) is None
+        assert cache.get('other', projects_url) is not None
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import threading
+import uuid
+from unittest.mock import patch
+
+import requests
+
+from polaris.vcs.integrations.fetch import sessions, get_session, close_session
+
+
+class BlockingRateLimiter:
+    # holds each request in flight until released, without making the http call.
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def call(self, fn, *args, **kwargs):
+        self.started.set()
+        assert self.release.wait(timeout=5)
+        return 'response'
+
+
+def request_in_flight(session):
+    rate_limiter = BlockingRateLimiter()
+    session.rate_limiter = rate_limiter
+    request = threading.Thread(target=session.get, args=('https://gitlab.com/api/v4/projects',))
+    request.start()
+    assert rate_limiter.started.wait(timeout=5)
+    return rate_limiter, request
+
+
+class TestConnectorSessions:
+
+    def it_reuses_the_session_for_a_connector(self):
+        connector_key, other_connector_key = uuid.uuid4(), uuid.uuid4()
+        try:
+            assert get_session(connector_key) is get_session(str(connector_key))
+            assert get_session(connector_key) is not get_session(other_connector_key)
+        finally:
+            close_session(connector_key)
+            close_session(other_connector_key)
+
+    def it_evicts_idle_sessions(self):
+        connector_key = uuid.uuid4()
+        session = get_session(connector_key)
+        with patch.object(session, 'close') as close:
+            sessions.evict_idle_sessions(idle_timeout=-1)
+
+        assert str(connector_key) not in sessions._sessions
+        assert close.call_count == 1
+        assert get_session(connector_key) is not session
+        close_session(connector_key)
+
+    def it_does_not_evict_a_session_with_a_request_in_flight(self):
+        connector_key = uuid.uuid4()
+        session = get_session(connector_key)
+        rate_limiter, request = request_in_flight(session)
+        try:
+            with patch.object(session, 'close') as close:
+                sessions.evict_idle_sessions(idle_timeout=-1)
+
+            assert sessions._sessions[str(connector_key)] is session
+            close.assert_not_called()
+        finally:
+            rate_limiter.release.set()
+            request.join()
+
+        assert session.leases == 0
+        close_session(connector_key)
+
+    def it_closes_a_session_with_a_request_in_flight_when_the_request_completes(self):
+        connector_key = uuid.uuid4()
+        session = get_session(connector_key)
+        rate_limiter, request = request_in_flight(session)
+        with patch.object(requests.Session, 'close') as close:
+            close_session(connector_key)
+            assert str(connector_key) not in sessions._sessions
+            close.assert_not_called()
+
+            rate_limiter.release.set()
+            request.join()
+
+            assert close.call_count == 1
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import threading
+import time
+import uuid
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.integrations.fetch import paging, prefetch_pages, connector_fetch_slot
+
+
+def limit_concurrency(limit):
+    get = paging.config_provider.get
+    return patch.object(
+        paging.config_provider,
+        'get',
+        side_effect=lambda key, default=None: limit if key == 'CONNECTOR_FETCH_CONCURRENCY' else get(key, default)
+    )
+
+
+class TestPrefetchPages:
+
+    def it_yields_pages_in_order(self):
+        pages = [[i, i + 1] for i in range(0, 20, 2)]
+
+        assert list(prefetch_pages(iter(pages), connector_key=uuid.uuid4(), prefetch=2)) == pages
+
+    def it_yields_pages_in_order_without_prefetching(self):
+        pages = [[1], [2], [3]]
+
+        assert list(prefetch_pages(iter(pages), connector_key=uuid.uuid4(), prefetch=0)) == pages
+
+    def it_fetches_the_pages_on_another_thread(self):
+        fetched_on = []
+
+        def pages():
+            for page in range(3):
+                fetched_on.append(threading.current_thread())
+                yield [page]
+
+        assert list(prefetch_pages(pages(), connector_key=uuid.uuid4(), prefetch=1)) == [[0], [1], [2]]
+        assert threading.current_thread() not in fetched_on
+
+    def it_raises_fetch_errors_in_the_caller_after_the_pages_before_them(self):
+        def pages():
+            yield [1]
+            yield [2]
+            raise ProcessingException('Fetch pull requests failed')
+
+        received = []
+        with pytest.raises(ProcessingException):
+            for page in prefetch_pages(pages(), connector_key=uuid.uuid4(), prefetch=1):
+                received.append(page)
+
+        assert received == [[1], [2]]
+
+    def it_stops_fetching_when_the_caller_closes_the_pages(self):
+        closed = threading.Event()
+
+        def pages():
+            try:
+                page = 0
+                while True:
+                    yield [page]
+                    page = page + 1
+            finally:
+                closed.set()
+
+        prefetched = prefetch_pages(pages(), connector_key=uuid.uuid4(), prefetch=1)
+        assert next(prefetched) == [0]
+        prefetched.close()
+
+        assert closed.wait(timeout=5)
+
+
+class TestConnectorFetchSlot:
+
+    def it_limits_the_concurrent_fetches_for_a_connector(self):
+        connector_key = uuid.uuid4()
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fetch():
+            with connector_fetch_slot(connector_key):
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.05)
+                with lock:
+                    in_flight.pop()
+
+        with limit_concurrency(2):
+            threads = [threading.Thread(target=fetch) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert len(peak) == 6
+        assert max(peak) == 2
+
+    def it_keeps_a_separate_limit_per_connector(self):
+        first, second = uuid.uuid4(), uuid.uuid4()
+        with limit_concurrency(1):
+            with connector_fetch_slot(first):
+                # would block if the connectors shared a semaphore
+                assert paging.get_connector_semaphore(str(second)).acquire(timeout=1)
+                paging.get_connector_semaphore(str(second)).release()
+                assert not paging.get_connector_semaphore(str(first)).acquire(timeout=0.1)
+
+    def it_holds_the_slot_while_advancing_the_pages(self):
+        connector_key = uuid.uuid4()
+
+        def pages():
+            for page in range(2):
+                # the fetch thread holds the only slot while it fetches.
+                assert not paging.get_connector_semaphore(str(connector_key)).acquire(blocking=False)
+                yield [page]
+
+        with limit_concurrency(1):
+            assert list(prefetch_pages(pages(), connector_key=connector_key, prefetch=1)) == [[0], [1]]
+
+
+class TestAzurePullRequestPages:
+
+    def it_does_not_read_the_repository_on_the_fetch_thread(self):
+        from polaris.vcs.integrations.azure.azure_connector import AzureRepository
+
+        read_on = []
+
+        class Repository:
+            # stands in for the orm instance and records which threads read it.
+            def __getattribute__(self, name):
+                read_on.append(threading.current_thread())
+                return dict(
+                    name='polaris', url='https://dev.azure.com/exathink/_git/polaris', organization_key=uuid.uuid4(),
+                    source_id='1000', latest_pull_request_update_timestamp=None, properties={}
+                )[name]
+
+        connector = MagicMock()
+        connector.key = uuid.uuid4()
+        repository = AzureRepository(Repository(), connector)
+        read_on.clear()
+
+        response = MagicMock(status_code=500, text='Internal Server Error')
+        with patch('polaris.vcs.integrations.azure.azure_connector.get_session') as get_session:
+            get_session.return_value.get.return_value = response
+            with pytest.raises(ProcessingException):
+                list(repository.fetch_active_pull_requests())
+
+        assert read_on == []
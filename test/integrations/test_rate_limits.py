@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import uuid
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from polaris.vcs.integrations.fetch import rate_limits, get_remaining_budget
+from polaris.vcs.integrations.fetch.rate_limits import ConnectorRateLimiter
+
+
+class Clock:
+    # stands in for the time module, sleeping only advances the clock.
+    epoch = 1600000000
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.epoch + self.elapsed
+
+    def monotonic(self):
+        return self.elapsed
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.elapsed = self.elapsed + seconds
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch.object(rate_limits, 'time', clock):
+        yield clock
+
+
+def max_retries(retries):
+    get = rate_limits.config_provider.get
+    return patch.object(
+        rate_limits.config_provider,
+        'get',
+        side_effect=lambda key, default=None: retries if key == 'CONNECTOR_RATE_LIMIT_RETRIES' else get(key, default)
+    )
+
+
+def response(status_code=200, **headers):
+    return MagicMock(status_code=status_code, headers=headers)
+
+
+class TestTokenBucket:
+
+    def it_allows_a_burst_without_waiting(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+
+        assert clock.sleeps == []
+
+    def it_waits_for_a_token_once_the_burst_is_used(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=2)
+        for _ in range(4):
+            limiter.acquire()
+
+        assert clock.sleeps == pytest.approx([0.1, 0.1])
+
+    def it_refills_while_idle(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+        clock.elapsed = clock.elapsed + 1
+        limiter.acquire()
+        limiter.acquire()
+
+        assert clock.sleeps == []
+
+    def it_waits_for_the_provider_reset_when_the_budget_is_exhausted(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=2)
+        limiter.observe(response(**{
+            'X-RateLimit-Remaining': '0', 'X-RateLimit-Limit': '5000', 'X-RateLimit-Reset': str(clock.time() + 30)
+        }))
+        limiter.acquire()
+
+        assert clock.sleeps == [30]
+
+    def it_reads_gitlab_budget_headers_with_relative_resets(self, clock):
+        connector_key = str(uuid.uuid4())
+        limiter = rate_limits.get_rate_limiter(connector_key)
+        limiter.observe(response(**{'RateLimit-Remaining': '10', 'RateLimit-Limit': '600', 'RateLimit-Reset': '60'}))
+
+        budget = get_remaining_budget(connector_key)
+        assert budget['remaining'] == 10
+        assert budget['limit'] == 600
+        assert budget['reset_at'] == clock.time() + 60
+
+
+class TestBackoff:
+
+    def it_backs_off_exponentially_without_a_provider_hint(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=10)
+        limiter.backoff(3)
+
+        assert limiter.blocked_until == clock.time() + 8
+
+    def it_honours_retry_after_instead_of_backing_off(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=10)
+        limiter.observe(response(429, **{'Retry-After': '20'}))
+        limiter.backoff(1)
+
+        assert limiter.blocked_until == clock.time() + 20
+
+    def it_retries_rate_limited_requests(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=10)
+        request = MagicMock(side_effect=[response(429, **{'Retry-After': '5'}), response(200)])
+
+        assert limiter.call(request, 'https://gitlab.com/api/v4/projects').status_code == 200
+        assert request.call_count == 2
+        assert clock.sleeps == [5]
+
+    def it_does_not_treat_a_plain_forbidden_as_rate_limited(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=10)
+        request = MagicMock(return_value=response(403))
+
+        assert limiter.call(request).status_code == 403
+        assert request.call_count == 1
+
+    def it_gives_up_after_the_configured_retries(self, clock):
+        limiter = ConnectorRateLimiter(str(uuid.uuid4()), requests_per_second=10, burst=10)
+        request = MagicMock(return_value=response(429))
+        with max_retries(2):
+            assert limiter.call(request).status_code == 429
+
+        assert request.call_count == 3
+        assert clock.sleeps == [2, 4]
+
+
+class TestGithubPages:
+
+    def connector(self):
+        from polaris.vcs.integrations.github import GithubRepositoriesConnector
+        return GithubRepositoriesConnector(MagicMock(key=uuid.uuid4()))
+
+    def github(self):
+        github = MagicMock(per_page=2, rate_limiting=(4000, 5000), rate_limiting_resettime=Clock.epoch + 3600)
+        return github
+
+    def it_fetches_pages_until_a_short_page(self, clock):
+        connector = self.connector()
+        paginator = MagicMock()
+        paginator.get_page.side_effect = [[1, 2], [3]]
+
+        assert list(connector.fetch_pages(self.github(), paginator)) == [[1, 2], [3]]
+        assert [call[0][0] for call in paginator.get_page.call_args_list] == [0, 1]
+
+    def it_records_the_budget_github_reported(self, clock):
+        connector = self.connector()
+        paginator = MagicMock()
+        paginator.get_page.side_effect = [[1]]
+        list(connector.fetch_pages(self.github(), paginator))
+
+        budget = get_remaining_budget(connector.key)
+        assert budget['remaining'] == 4000
+        assert budget['limit'] == 5000
+
+    def it_retries_when_the_rate_limit_is_exceeded(self, clock):
+        from github import RateLimitExceededException
+        connector = self.connector()
+        paginator = MagicMock()
+        paginator.get_page.side_effect = [RateLimitExceededException(403, {}), [1]]
+
+        assert list(connector.fetch_pages(self.github(), paginator)) == [[1]]
+
+    def it_gives_up_after_the_configured_retries(self, clock):
+        from github import RateLimitExceededException
+        connector = self.connector()
+        paginator = MagicMock()
+        paginator.get_page.side_effect = RateLimitExceededException(403, {})
+
+        with max_retries(1), pytest.raises(RateLimitExceededException):
+            list(connector.fetch_pages(self.github(), paginator))
+        assert paginator.get_page.call_count == 2
@@ -8,9 +8,13 @@
 
 # Author: Krishna Kumar
 
+import json
+from unittest.mock import MagicMock, patch
+
 from sqlalchemy import select, func
-from polaris.messaging.messages import CommitsCreated, CommitDetailsCreated
+from polaris.messaging.messages import CommitsCreated, CommitDetailsCreated, PullRequestsCreated, PullRequestsUpdated
 from polaris.messaging.test_utils import mock_channel, fake_send
+from polaris.vcs.messaging.subscribers import analytics_topic_subscriber
 from polaris.vcs.messaging.subscribers.analytics_topic_subscriber import AnalyticsTopicSubscriber
 from test.shared_fixtures import *
 
@@ -92,6 +96,110 @@ class TestAnalyticsTopicSubscriber:
                 "select count(id) from repos.commits where analytics_details_synced_at is NULL "
             ).scalar() == 0
 
+    class TestCommitAckBatching:
+
+        def it_acks_commits_from_waiting_messages_in_one_write(self, setup_commits):
+            commits = setup_commits
+            channel = mock_channel()
+            waiting = [
+                (MagicMock(delivery_tag=1), MagicMock(type=CommitDetailsCreated.message_type), json.dumps(dict(
+                    organization_key=str(test_organization_key),
+                    repository_key=str(test_repository_key),
+                    commit_details=[dict(key=commit['key']) for commit in commits]
+                ))),
+                # classified by its type, not by its payload.
+                (MagicMock(delivery_tag=2), MagicMock(type=PullRequestsUpdated.message_type), json.dumps(dict(
+                    commit_details=[dict(key=commit['key']) for commit in commits]
+                ))),
+            ]
+            channel.basic_get = MagicMock(side_effect=waiting)
+
+            message = fake_send(CommitsCreated(send=dict(
+                organization_key=test_organization_key,
+                repository_key=test_repository_key,
+                branch='master',
+                new_commits=commits
+            )))
+            subscriber = AnalyticsTopicSubscriber(channel)
+            subscriber.commit_ack_batch_size = 100
+            result = subscriber.dispatch(channel, message)
+
+            assert result['success']
+            assert result['commits_updated'] == len(commits)
+            assert result['details_updated'] == len(commits)
+            channel.basic_ack.assert_called_once_with(delivery_tag=1)
+            channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=True)
+            assert db.connection().execute(
+                "select count(id) from repos.commits "
+                "where analytics_commit_synced_at is NULL or analytics_details_synced_at is NULL"
+            ).scalar() == 0
+
+    class TestPullRequestAckCoalescing:
 
+        @staticmethod
+        def summary(key, updated_at):
+            return dict(key=key, updated_at=updated_at, is_new=False)
 
+        @staticmethod
+        def waiting_message(delivery_tag, message_type, pull_request_summaries):
+            return (
+                MagicMock(delivery_tag=delivery_tag),
+                MagicMock(type=message_type),
+                json.dumps(dict(pull_request_summaries=pull_request_summaries))
+            )
 
+        def it_writes_the_latest_ack_of_waiting_messages_and_acks_them_after(self):
+            keys = [str(uuid.uuid4()) for _ in range(2)]
+            channel = mock_channel()
+            channel.basic_get = MagicMock(side_effect=[
+                self.waiting_message(1, PullRequestsUpdated.message_type, [
+                    self.summary(keys[0], "2020-06-11T18:57:08.777Z"),
+                    self.summary(keys[1], "2020-06-11T18:57:08Z")
+                ]),
+                self.waiting_message(2, CommitsCreated.message_type, []),
+            ])
+            message = fake_send(PullRequestsCreated(send=dict(
+                organization_key=test_organization_key,
+                repository_key=test_repository_key,
+                pull_request_summaries=[self.summary(keys[0], "2020-06-11T19:00:00+02:00")]
+            )))
+            subscriber = AnalyticsTopicSubscriber(channel)
+            subscriber.pull_request_ack_coalesce_window = 60
+
+            with patch.object(
+                    analytics_topic_subscriber.api, 'ack_pull_request_event', return_value=dict(success=True, updated=2)
+            ) as ack_pull_request_event:
+                assert subscriber.dispatch(channel, message)['success']
+
+            ack_pull_request_event.assert_called_once_with([
+                dict(key=keys[0], updated_at="2020-06-11T18:57:08.777Z"),
+                dict(key=keys[1], updated_at="2020-06-11T18:57:08Z")
+            ])
+            channel.basic_ack.assert_called_once_with(delivery_tag=1)
+            channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=True)
+
+        def it_returns_waiting_messages_to_the_queue_when_the_write_fails(self):
+            channel = mock_channel()
+            channel.basic_get = MagicMock(side_effect=[
+                self.waiting_message(1, PullRequestsUpdated.message_type, [
+                    self.summary(str(uuid.uuid4()), "2020-06-11T18:57:08Z")
+                ]),
+                (None, None, None)
+            ])
+            message = fake_send(PullRequestsCreated(send=dict(
+                organization_key=test_organization_key,
+                repository_key=test_repository_key,
+                pull_request_summaries=[self.summary(str(uuid.uuid4()), "2020-06-11T18:57:08Z")]
+            )))
+            subscriber = AnalyticsTopicSubscriber(channel)
+            subscriber.pull_request_ack_coalesce_window = 60
+
+            with patch.object(
+                    analytics_topic_subscriber.api,
+                    'ack_pull_request_event',
+                    return_value=dict(success=False, exception='write failed')
+            ), pytest.raises(Exception):
+                subscriber.dispatch(channel, message)
+
+            assert channel.basic_ack.call_count == 0
+            channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=True)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from test.shared_fixtures import *
+
+from polaris.messaging.test_utils import fake_send, mock_channel, mock_publisher
+from polaris.messaging.messages import ConnectorEvent, RepositoryUpdated, RepositoriesImported
+from polaris.vcs.messaging.subscribers import ConnectorCacheSubscriber, RepositoryCacheSubscriber
+from polaris.vcs.messaging.subscribers.cache_subscribers import process_queue
+from polaris.vcs import connector_factory, repository_factory
+
+
+def repository_summary(organization_key, connector_key):
+    return dict(
+        key=str(test_repository_key),
+        name=test_repository_name,
+        description='A neat new repo',
+        url='https://foo.bar.com',
+        integration_type='github',
+        public=False,
+        source_id=test_repository_source_id,
+        organization_key=str(organization_key),
+        connector_key=str(connector_key)
+    )
+
+
+class TestCachedBindings:
+
+    def it_caches_a_snapshot_of_the_repository_rather_than_the_orm_instance(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        repository, connector = repository_factory.get_repository_binding(connector_key, test_repository_source_id)
+
+        assert not isinstance(repository, Repository)
+        assert str(repository.key) == str(test_repository_key)
+        assert repository.organization_key == organization_key
+        assert str(connector.key) == str(connector_key)
+
+
+class TestConnectorCacheSubscriber:
+
+    def it_consumes_from_a_queue_of_its_own_in_each_process(self):
+        assert process_queue('connectors_vcs_cache') != process_queue('connectors_vcs_cache')
+
+    def it_invalidates_the_cached_connector(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        cached = connector_factory.get_cached_connector(connector_key)
+        assert connector_factory.get_cached_connector(connector_key) is cached
+
+        message = fake_send(ConnectorEvent(
+            send=dict(
+                connector_key=str(connector_key),
+                connector_type='github',
+                product_type='github',
+                event='updated'
+            )
+        ))
+        channel = mock_channel()
+        ConnectorCacheSubscriber(channel, mock_publisher()).dispatch(channel, message)
+
+        assert connector_factory.get_cached_connector(connector_key) is not cached
+
+    def it_invalidates_the_repository_bindings_of_the_connector(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        binding = repository_factory.get_repository_binding(connector_key, test_repository_source_id)
+        assert binding is not None
+
+        message = fake_send(ConnectorEvent(
+            send=dict(
+                connector_key=str(connector_key),
+                connector_type='github',
+                product_type='github',
+                event='updated'
+            )
+        ))
+        channel = mock_channel()
+        ConnectorCacheSubscriber(channel, mock_publisher()).dispatch(channel, message)
+
+        assert repository_factory.get_repository_binding(connector_key, test_repository_source_id) is not binding
+
+
+class TestRepositoryCacheSubscriber:
+
+    def it_invalidates_the_binding_of_an_updated_repository(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        binding = repository_factory.get_repository_binding(connector_key, test_repository_source_id)
+        assert repository_factory.get_repository_binding(connector_key, test_repository_source_id) is binding
+
+        message = fake_send(RepositoryUpdated(
+            send=dict(
+                organization_key=str(organization_key),
+                repository=dict(is_new=False, **repository_summary(organization_key, connector_key))
+            )
+        ))
+        channel = mock_channel()
+        RepositoryCacheSubscriber(channel, mock_publisher()).dispatch(channel, message)
+
+        assert repository_factory.get_repository_binding(connector_key, test_repository_source_id) is not binding
+
+    def it_invalidates_the_bindings_of_imported_repositories(self, setup_sync_repos):
+        organization_key, connectors = setup_sync_repos
+        connector_key = connectors['github']
+
+        binding = repository_factory.get_repository_binding(connector_key, test_repository_source_id)
+
+        message = fake_send(RepositoriesImported(
+            send=dict(
+                organization_key=str(organization_key),
+                imported_repositories=[repository_summary(organization_key, connector_key)]
+            )
+        ))
+        channel = mock_channel()
+        RepositoryCacheSubscriber(channel, mock_publisher()).dispatch(channel, message)
+
+        assert repository_factory.get_repository_binding(connector_key, test_repository_source_id) is not binding
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from unittest.mock import patch
+
+from polaris.vcs.messaging.flow_control import FlowController
+
+
+class TestFlowController:
+
+    def it_grows_the_batch_without_pausing_while_the_queue_is_idle(self):
+        controller = FlowController('commits_analytics', batch_size=100, target_depth=10)
+        with patch.object(controller.monitor, 'get_queue_depth', return_value=0), \
+                patch('polaris.vcs.messaging.flow_control.time.sleep') as sleep:
+            for _ in range(3):
+                controller.sent(controller.batch_size)
+
+        assert controller.batch_size == 175
+        sleep.assert_not_called()
+
+    def it_backs_off_when_the_queue_backs_up(self):
+        controller = FlowController('commits_analytics', batch_size=100, target_depth=10)
+        with patch.object(controller.monitor, 'get_queue_depth', return_value=50), \
+                patch('polaris.vcs.messaging.flow_control.time.sleep') as sleep:
+            controller.sent(100)
+            controller.sent(50)
+
+        assert controller.batch_size == 25
+        assert [call[0][0] for call in sleep.call_args_list] == [1, 2]
+        assert controller.backoffs == 2
+
+    def it_backs_off_when_acks_lag_behind(self):
+        controller = FlowController('commits_analytics', batch_size=100, max_lag=500)
+        with patch.object(controller.monitor, 'get_queue_depth', return_value=None), \
+                patch('polaris.vcs.messaging.flow_control.time.sleep'):
+            controller.sent(100, lag=1000)
+
+        assert controller.batch_size == 50
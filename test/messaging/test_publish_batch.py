@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from polaris.messaging.topics import VcsTopic
+from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.messages import SyncPullRequest
+
+
+class TestPublishBatch:
+
+    def it_publishes_on_the_batch_channel_and_commits_on_size(self):
+        channel = MagicMock()
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish') as messaging_publish, \
+                patch.object(publish.PublishBatch, 'get_channel', return_value=channel):
+            with publish.batch(size=2) as batch:
+                for i in range(5):
+                    publish.sync_pull_request('org', 'repo', pull_request_key=str(i))
+
+            assert messaging_publish.call_count == 5
+            topic, message = messaging_publish.call_args[0]
+            assert topic == VcsTopic
+            assert message.message_type == SyncPullRequest.message_type
+            assert messaging_publish.call_args[1]['channel'] == channel
+            # two full batches and the remainder on exit
+            assert batch.batches == 3
+            assert batch.published == 5
+
+    def it_commits_on_the_next_message_after_the_interval(self):
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish'), \
+                patch.object(publish.PublishBatch, 'get_channel', return_value=MagicMock()), \
+                patch.object(publish.time, 'monotonic', side_effect=[0.0, 0.0, 1.0] + [5.0] * 10):
+            with publish.batch(size=100, interval=2) as batch:
+                publish.sync_pull_request('org', 'repo', pull_request_key='1')
+                publish.sync_pull_request('org', 'repo', pull_request_key='2')
+                # no message after the interval has passed, so the batch is still open
+                assert batch.pending == 2
+                publish.sync_pull_request('org', 'repo', pull_request_key='3')
+                assert batch.pending == 0
+                assert batch.batches == 1
+
+    def it_only_commits_on_size_or_exit_without_an_interval(self):
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish'), \
+                patch.object(publish.PublishBatch, 'get_channel', return_value=MagicMock()), \
+                patch.object(publish.config_provider, 'get', side_effect=lambda key, default=None: default):
+            with publish.batch(size=100) as batch:
+                for i in range(3):
+                    publish.sync_pull_request('org', 'repo', pull_request_key=str(i))
+                assert batch.interval is None
+                assert batch.pending == 3
+
+            assert batch.pending == 0
+            assert batch.batches == 1
+
+    def it_joins_an_enclosing_batch(self):
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish'):
+            with publish.batch(size=100) as outer:
+                with publish.batch() as inner:
+                    assert inner is outer
+
+    def it_does_not_batch_messages_outside_a_batch(self):
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish') as messaging_publish:
+            publish.sync_pull_request('org', 'repo', pull_request_key='1')
+
+            assert messaging_publish.call_args[1]['channel'] is None
+
+
+class TestThreadBatches:
+
+    def it_keeps_one_batch_per_thread_across_tasks(self):
+        with patch('polaris.vcs.messaging.publish.messaging_utils.publish'), \
+                patch.object(publish.PublishBatch, 'get_channel', return_value=MagicMock()), \
+                patch.object(publish.PublishBatch, 'close') as close:
+            with publish.ThreadBatches(broker_url='amqp://test') as batches:
+                def task(i):
+                    with publish.batch(publish_batch=batches.get()) as current:
+                        publish.sync_pull_request('org', 'repo', pull_request_key=str(i))
+                    return current
+
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    used = set(pool.map(task, range(20)))
+
+                # the batches are committed after each task but stay open for the next one
+                assert close.call_count == 0
+                assert len(used) <= 2
+                assert sum(current.published for current in used) == 20
+
+            assert close.call_count == len(used)
+
+    def it_needs_a_broker_url(self):
+        with patch.object(publish.config_provider, 'get', return_value=None):
+            with pytest.raises(ProcessingException):
+                publish.ThreadBatches()
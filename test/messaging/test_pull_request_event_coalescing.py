@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import json
+from unittest.mock import patch, MagicMock
+
+from test.shared_fixtures import *
+from polaris.messaging.test_utils import assert_topic_and_message, fake_send, mock_channel
+from polaris.messaging.topics import VcsTopic
+from polaris.messaging.messages import PullRequestsCreated
+from polaris.vcs.messaging import pull_request_events
+from polaris.vcs.messaging.messages import GitlabRepositoryEvent
+from polaris.vcs.messaging.pull_request_events import PullRequestEventBatch, is_newer_pull_request
+from polaris.vcs.messaging.subscribers import vcs_topic_subscriber
+from polaris.vcs.messaging.subscribers.vcs_topic_subscriber import VcsTopicSubscriber
+
+
+def pull_request_event(source_last_updated):
+    return None, None, dict(source_last_updated=source_last_updated)
+
+
+def gitlab_event(pull_request_data):
+    return dict(
+        connector_key=str(gitlab_connector_key),
+        event_type='merge_request',
+        payload=json.dumps(pull_request_data)
+    )
+
+
+def waiting_message(delivery_tag, message_type, body):
+    return MagicMock(delivery_tag=delivery_tag), MagicMock(type=message_type), json.dumps(body)
+
+
+@pytest.fixture()
+def coalescing_subscriber(setup_org_repo_gitlab):
+    repository, organization = setup_org_repo_gitlab
+
+    # maps the payload straight to the pull request data, so the events don't need a connector binding.
+    def handle_gitlab_event(connector_key, event_type, payload, channel=None, batch=None):
+        return pull_request_events.sync_pull_request_event(repository, json.loads(payload), batch=batch)
+
+    channel = mock_channel()
+    subscriber = VcsTopicSubscriber(channel)
+    subscriber.pull_request_event_coalesce_window = 60
+    with patch.object(vcs_topic_subscriber.gitlab_message_handler, 'handle_gitlab_event', handle_gitlab_event):
+        yield channel, subscriber
+
+
+class TestIsNewerPullRequest:
+
+    def it_compares_fractional_seconds_as_times(self):
+        # as strings '.' sorts before 'Z', so the later timestamp would compare as the older one.
+        assert is_newer_pull_request(
+            pull_request_event("2020-06-11T18:57:08Z"),
+            pull_request_event("2020-06-11T18:57:08.777Z")
+        )
+        assert not is_newer_pull_request(
+            pull_request_event("2020-06-11T18:57:08.777Z"),
+            pull_request_event("2020-06-11T18:57:08Z")
+        )
+
+    def it_compares_timestamps_with_different_offsets_in_utc(self):
+        assert not is_newer_pull_request(
+            pull_request_event("2020-06-11T18:57:08Z"),
+            pull_request_event("2020-06-11T19:00:00+02:00")
+        )
+        assert is_newer_pull_request(
+            pull_request_event("2020-06-11T18:57:08+00:00"),
+            pull_request_event("2020-06-11T14:00:00-05:00")
+        )
+
+    def it_treats_naive_timestamps_as_utc(self):
+        assert is_newer_pull_request(
+            pull_request_event("2020-06-11T20:57:08+02:00"),
+            pull_request_event(datetime(2020, 6, 11, 18, 57, 9))
+        )
+
+    def it_takes_the_new_payload_when_either_has_no_timestamp(self):
+        assert is_newer_pull_request(pull_request_event(None), pull_request_event("2020-06-11T18:57:08Z"))
+        assert is_newer_pull_request(pull_request_event("2020-06-11T18:57:08Z"), pull_request_event(None))
+
+
+class TestPullRequestEventBatch:
+
+    def it_syncs_only_the_newest_payload_per_pull_request(self, setup_org_repo_gitlab):
+        repository, organization = setup_org_repo_gitlab
+        batch = PullRequestEventBatch()
+
+        with patch('polaris.vcs.messaging.publish.publish') as publish:
+            for i, title in enumerate(['first', 'second', 'third']):
+                assert pull_request_events.sync_pull_request_event(
+                    repository,
+                    dict(
+                        pull_requests_common_fields,
+                        title=title,
+                        source_last_updated=f"2020-06-11T18:57:0{i}.000Z"
+                    ),
+                    batch=batch
+                ) is None
+            pull_request_events.sync_pull_request_event(
+                repository,
+                dict(pull_requests_common_fields, source_id='61296046'),
+                batch=batch
+            )
+            assert db.connection().execute("select count(*) from repos.pull_requests").scalar() == 0
+
+            assert batch.flush()['pull_requests'] == 2
+
+            assert publish.call_count == 1
+            assert_topic_and_message(publish, VcsTopic, PullRequestsCreated)
+            assert db.connection().execute("select count(*) from repos.pull_requests").scalar() == 2
+            assert db.connection().execute(
+                "select title from repos.pull_requests where source_id='61296045'"
+            ).scalar() == 'third'
+
+    def it_keeps_the_newest_payload_when_events_arrive_out_of_order(self, setup_org_repo_gitlab):
+        repository, organization = setup_org_repo_gitlab
+        batch = PullRequestEventBatch()
+
+        with patch('polaris.vcs.messaging.publish.publish'):
+            pull_request_events.sync_pull_request_event(
+                repository,
+                dict(pull_requests_common_fields, title='newer', source_last_updated="2020-06-11T20:57:09+02:00"),
+                batch=batch
+            )
+            pull_request_events.sync_pull_request_event(
+                repository,
+                dict(pull_requests_common_fields, title='older', source_last_updated="2020-06-11T18:57:01.000Z"),
+                batch=batch
+            )
+            batch.flush()
+
+        assert db.connection().execute(
+            "select title from repos.pull_requests where source_id='61296045'"
+        ).scalar() == 'newer'
+
+
+class TestCoalescingSubscriber:
+
+    def it_syncs_waiting_events_with_the_dispatched_one_and_acks_them_after(self, coalescing_subscriber):
+        channel, subscriber = coalescing_subscriber
+        channel.basic_get = MagicMock(side_effect=[
+            waiting_message(1, GitlabRepositoryEvent.message_type, gitlab_event(
+                dict(pull_requests_common_fields, title='second', source_last_updated="2020-06-11T18:57:09.000Z")
+            )),
+            waiting_message(2, GitlabRepositoryEvent.message_type, gitlab_event(
+                dict(pull_requests_common_fields, source_id='61296046')
+            )),
+            waiting_message(3, 'PullRequestsCreated', dict(pull_request_summaries=[]))
+        ])
+        message = fake_send(GitlabRepositoryEvent(send=gitlab_event(
+            dict(pull_requests_common_fields, title='first', source_last_updated="2020-06-11T18:57:08.000Z")
+        )))
+
+        with patch('polaris.vcs.messaging.publish.publish') as publish:
+            result = subscriber.dispatch(channel, message)
+
+        assert result['success']
+        assert result['pull_requests'] == 2
+        assert publish.call_count == 1
+        assert [call[1] for call in channel.basic_ack.call_args_list] == [dict(delivery_tag=1), dict(delivery_tag=2)]
+        channel.basic_nack.assert_called_once_with(delivery_tag=3, requeue=True)
+        assert db.connection().execute(
+            "select title from repos.pull_requests where source_id='61296045'"
+        ).scalar() == 'second'
+
+    def it_returns_waiting_events_to_the_queue_when_the_sync_fails(self, coalescing_subscriber):
+        channel, subscriber = coalescing_subscriber
+        channel.basic_get = MagicMock(side_effect=[
+            waiting_message(1, GitlabRepositoryEvent.message_type, gitlab_event(pull_requests_common_fields)),
+            (None, None, None)
+        ])
+        message = fake_send(GitlabRepositoryEvent(send=gitlab_event(pull_requests_common_fields)))
+
+        with patch('polaris.vcs.messaging.publish.publish') as publish, patch.object(
+                pull_request_events.api,
+                'sync_pull_requests_for_repositories',
+                return_value=dict(success=False, exception='sync failed')
+        ), pytest.raises(Exception):
+            subscriber.dispatch(channel, message)
+
+        assert publish.call_count == 0
+        assert channel.basic_ack.call_count == 0
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=True)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from unittest.mock import patch
+
+from test.shared_fixtures import *
+from polaris.messaging.messages import PullRequestsCreated, PullRequestsUpdated
+from polaris.vcs.messaging import pull_request_events
+
+repository_a = uuid.uuid4()
+repository_b = uuid.uuid4()
+
+
+def summary(number, is_new, title='A pull request'):
+    return dict(key=str(uuid.uuid4()), display_id=str(number), title=title, is_new=is_new)
+
+
+class TestPullRequestSummaryGroups:
+
+    def it_groups_by_repository_and_kind_of_change(self):
+        pull_requests = [
+            (test_organization_key, repository_a, summary(1, True)),
+            (test_organization_key, repository_b, summary(2, False)),
+            (test_organization_key, repository_a, summary(3, False)),
+            (test_organization_key, repository_a, summary(4, True)),
+        ]
+        groups = list(pull_request_events.pull_request_summary_groups(pull_requests, 100, 1024 * 1024))
+
+        assert [
+            (repository_key, is_new, [pr['display_id'] for pr in summaries])
+            for _, repository_key, is_new, summaries in groups
+        ] == [
+            (repository_a, True, ['1', '4']),
+            (repository_b, False, ['2']),
+            (repository_a, False, ['3'])
+        ]
+
+    def it_caps_the_summaries_per_message(self):
+        pull_requests = [(test_organization_key, repository_a, summary(i, True)) for i in range(25)]
+        groups = list(pull_request_events.pull_request_summary_groups(pull_requests, 10, 1024 * 1024))
+
+        assert [len(summaries) for _, _, _, summaries in groups] == [10, 10, 5]
+
+    def it_caps_the_bytes_per_message(self):
+        pull_requests = [(test_organization_key, repository_a, summary(i, True, title='x' * 350)) for i in range(6)]
+        groups = list(pull_request_events.pull_request_summary_groups(pull_requests, 100, 1000))
+
+        assert [len(summaries) for _, _, _, summaries in groups] == [2, 2, 2]
+
+    def it_sends_an_oversized_summary_on_its_own(self):
+        pull_requests = [(test_organization_key, repository_a, summary(1, True, title='x' * 2000))]
+        groups = list(pull_request_events.pull_request_summary_groups(pull_requests, 100, 1000))
+
+        assert len(groups) == 1
+
+    def it_publishes_one_message_per_group(self):
+        pull_requests = [
+            (test_organization_key, repository_a, summary(1, True)),
+            (test_organization_key, repository_a, summary(2, True)),
+            (test_organization_key, repository_a, summary(3, False)),
+        ]
+        with patch('polaris.vcs.messaging.publish.publish') as publish:
+            published = pull_request_events.publish_pull_request_summaries(pull_requests, 100, 1024 * 1024)
+
+        assert published == 2
+        assert publish.call_count == 2
+        messages = [call[0][1] for call in publish.call_args_list]
+        assert [message.message_type for message in messages] == [
+            PullRequestsCreated.message_type, PullRequestsUpdated.message_type
+        ]
+        assert len(messages[0].dict['pull_request_summaries']) == 2
+        assert len(messages[1].dict['pull_request_summaries']) == 1
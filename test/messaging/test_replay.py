@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import threading
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.tasks import replay
+from polaris.vcs.messaging.tasks.replay import replay_repositories
+
+
+def repositories(count):
+    return [(uuid.uuid4(), f'repository-{i}') for i in range(count)]
+
+
+class Replays:
+    """
+    A send_for_repository that records the calls it gets. Each replay waits until all workers have
+    started one, so that a run only completes if the repositories are replayed in parallel.
+    """
+
+    def __init__(self, workers=1, commits=10, fail=None):
+        self.commits = commits
+        self.fail = fail or set()
+        self.started = threading.Barrier(workers, timeout=10)
+        self.calls = []
+        self.publish_batches = {}
+        self.serialized = False
+        self.lock = threading.Lock()
+
+    def __call__(self, repository_key, organization_key, batch_size, rate_limiter, resume, **kwargs):
+        with self.lock:
+            self.calls.append(dict(repository_key=repository_key, rate_limiter=rate_limiter, resume=resume, **kwargs))
+            self.publish_batches[threading.current_thread().name] = getattr(publish._batches, 'current', None)
+        try:
+            self.started.wait()
+        except threading.BrokenBarrierError:
+            self.serialized = True
+        if repository_key in self.fail:
+            raise Exception(f'replay of {repository_key} failed')
+        return self.commits
+
+
+@pytest.fixture
+def thread_batches():
+    # the workers' batches are opened without connecting, nothing is published by these replays.
+    batches_class = publish.ThreadBatches
+    with patch.object(
+            replay.publish,
+            'ThreadBatches',
+            side_effect=lambda size=None: batches_class(size, broker_url='amqp://localhost')
+    ):
+        yield
+
+
+class TestReplayRepositories:
+
+    def it_replays_the_repositories_in_parallel(self, thread_batches):
+        targets = repositories(4)
+        replays = Replays(workers=4)
+
+        summary = replay_repositories(uuid.uuid4(), targets, replays, 'Replay', batch_size=100, workers=4)
+
+        assert not replays.serialized
+        assert summary['repositories'] == 4
+        assert summary['failed'] == 0
+        assert summary['commits'] == 40
+        assert {call['repository_key'] for call in replays.calls} == {key for key, _ in targets}
+
+    def it_publishes_on_a_batch_of_its_own_in_each_worker(self, thread_batches):
+        replays = Replays(workers=3)
+
+        replay_repositories(uuid.uuid4(), repositories(3), replays, 'Replay', batch_size=100, workers=3)
+
+        batches = list(replays.publish_batches.values())
+        assert len(batches) == 3
+        assert all(batch is not None for batch in batches)
+        assert len({id(batch) for batch in batches}) == 3
+
+    def it_reports_the_errors_of_failed_repositories_and_completes_the_rest(self, thread_batches):
+        targets = repositories(3)
+        failed_key, failed_name = targets[1]
+        replays = Replays(workers=3, fail={failed_key})
+
+        summary = replay_repositories(uuid.uuid4(), targets, replays, 'Replay', batch_size=100, workers=3)
+
+        assert summary['failed'] == 1
+        assert summary['commits'] == 20
+        assert summary['errors'] == {failed_name: f'replay of {failed_key} failed'}
+
+    def it_shares_one_rate_limiter_between_the_workers(self, thread_batches):
+        replays = Replays(workers=3)
+
+        replay_repositories(uuid.uuid4(), repositories(3), replays, 'Replay', batch_size=100, workers=3, max_rate=50)
+
+        rate_limiters = {id(call['rate_limiter']) for call in replays.calls}
+        assert len(rate_limiters) == 1
+        assert replays.calls[0]['rate_limiter'] is not None
+
+    def it_passes_the_shared_repository_state_to_every_replay(self, thread_batches):
+        alias_cache = object()
+        replays = Replays(workers=2)
+
+        replay_repositories(
+            uuid.uuid4(), repositories(2), replays, 'Replay', batch_size=100, workers=2, resume=True,
+            repository_kwargs=dict(alias_cache=alias_cache)
+        )
+
+        assert all(call['alias_cache'] is alias_cache and call['resume'] for call in replays.calls)
+
+    def it_replays_serially_on_the_calling_thread_with_one_worker(self):
+        replays = Replays(workers=1, fail=set())
+        targets = repositories(3)
+
+        summary = replay_repositories(uuid.uuid4(), targets, replays, 'Replay', batch_size=100, workers=1)
+
+        assert summary['commits'] == 30
+        assert list(replays.publish_batches) == [threading.current_thread().name]
+        assert [call['repository_key'] for call in replays.calls] == [key for key, _ in targets]
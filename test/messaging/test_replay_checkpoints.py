@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from test.shared_fixtures import *
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.tasks import checkpoints
+from polaris.vcs.messaging.tasks.send_commit_history_imported import send_for_repository
+
+
+@pytest.fixture
+def clear_checkpoints():
+    yield
+    db.connection().execute("delete from repos.replay_checkpoints")
+
+
+@pytest.fixture
+def count_queries():
+    # the statements that count the commits of the repository that are waiting to be replayed.
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'count(repos.commits.id)' in statement and 'repos.commits.id <=' not in statement:
+            statements.append(statement)
+
+    event.listen(db.engine(), 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(db.engine(), 'before_cursor_execute', before_cursor_execute)
+
+
+def commit_ids(repository):
+    return [
+        row.id
+        for row in db.connection().execute(
+            commits.select().where(commits.c.repository_id == repository.id).order_by(commits.c.id)
+        ).fetchall()
+    ]
+
+
+def sent_commit_ids(commit_history_imported):
+    return [
+        commit['id']
+        for call in commit_history_imported.call_args_list
+        for commit in call[0][0]['new_commits']
+    ]
+
+
+class TestReplayCheckpoints:
+
+    def it_saves_and_loads_a_checkpoint(self, setup_org_repo, clear_checkpoints):
+        repository, _ = setup_org_repo
+        started_at = datetime.utcnow()
+
+        checkpoints.save_checkpoint(repository.id, 'commit_history', 100, 1, 1000, started_at)
+        checkpoints.save_checkpoint(repository.id, 'commit_history', 200, 2, 2000, started_at)
+
+        checkpoint = checkpoints.load_checkpoint(repository.id, 'commit_history')
+        assert checkpoint['last_id'] == 200
+        assert checkpoint['batches_sent'] == 2
+        assert checkpoint['synced'] == 2000
+        assert checkpoint['started_at'] == started_at
+        assert checkpoint['updated_at'] >= started_at
+        assert checkpoints.load_checkpoint(repository.id, 'commit_details') is None
+
+    def it_clears_only_the_completed_replay(self, setup_org_repo, clear_checkpoints):
+        repository, _ = setup_org_repo
+        started_at = datetime.utcnow()
+        checkpoints.save_checkpoint(repository.id, 'commit_history', 100, 1, 1000, started_at)
+        checkpoints.save_checkpoint(repository.id, 'commit_details', 50, 1, 100, started_at)
+
+        assert checkpoints.clear_checkpoint(repository.id, 'commit_history') == 1
+
+        assert checkpoints.load_checkpoint(repository.id, 'commit_history') is None
+        assert checkpoints.load_checkpoint(repository.id, 'commit_details')['last_id'] == 50
+
+
+class TestResumingAReplay:
+
+    def it_sends_only_the_commits_after_the_checkpoint(self, setup_org_repo, setup_commits, clear_checkpoints):
+        repository, _ = setup_org_repo
+        first_id, second_id = commit_ids(repository)
+        checkpoints.save_checkpoint(repository.id, 'commit_history', first_id, 1, 1, datetime.utcnow())
+
+        with patch.object(publish, 'commit_history_imported') as commit_history_imported:
+            synced = send_for_repository(repository.key, batch_size=1, resume=True)
+
+        assert synced == 1
+        assert commit_history_imported.call_count == 1
+        assert sent_commit_ids(commit_history_imported) == [second_id]
+        assert checkpoints.load_checkpoint(repository.id, 'commit_history') is None
+
+    def it_does_not_count_the_commits_when_it_resumes(self, setup_org_repo, setup_commits, clear_checkpoints,
+                                                      count_queries):
+        repository, _ = setup_org_repo
+        first_id, _ = commit_ids(repository)
+        checkpoints.save_checkpoint(repository.id, 'commit_history', first_id, 1, 1, datetime.utcnow())
+
+        with patch.object(publish, 'commit_history_imported'):
+            send_for_repository(repository.key, batch_size=1, resume=True)
+
+        assert count_queries == []
+
+    def it_ignores_the_checkpoint_without_resume(self, setup_org_repo, setup_commits, clear_checkpoints,
+                                                 count_queries):
+        repository, _ = setup_org_repo
+        first_id, second_id = commit_ids(repository)
+        checkpoints.save_checkpoint(repository.id, 'commit_history', first_id, 1, 1, datetime.utcnow())
+
+        with patch.object(publish, 'commit_history_imported') as commit_history_imported:
+            synced = send_for_repository(repository.key, batch_size=1)
+
+        assert synced == 2
+        assert len(count_queries) == 1
+        assert sent_commit_ids(commit_history_imported) == [first_id, second_id]
+        assert checkpoints.load_checkpoint(repository.id, 'commit_history') is None
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from types import SimpleNamespace
+
+from test.shared_fixtures import *
+from polaris.vcs.messaging.tasks.send_commit_details_imported import get_commit_details
+
+
+class TestGetCommitDetails:
+
+    def it_returns_the_same_details_when_files_are_aggregated_in_the_database(self, setup_commits):
+        with db.orm_session() as session:
+            commits_batch = [
+                SimpleNamespace(id=row.id)
+                for row in session.connection().execute("select id from repos.commits order by id")
+            ]
+            rows = get_commit_details(session, commits_batch, aggregate_files=False)
+            aggregated = get_commit_details(session, commits_batch, aggregate_files=True)
+
+        assert len(rows) == 2
+        assert [str(commit['key']) for commit in aggregated] == [str(commit['key']) for commit in rows]
+        assert all(commit['source_files'] == [] for commit in aggregated)
+        assert [commit['parents'] for commit in aggregated] == [commit['parents'] for commit in rows]
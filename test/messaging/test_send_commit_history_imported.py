@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from test.shared_fixtures import *
+from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.messaging import publish
+from polaris.vcs.messaging.tasks.send_commit_history_imported import ContributorAliasCache, send_for_organization
+
+
+def commit_batch(repository):
+    return db.connection().execute(
+        commits.select().where(commits.c.repository_id == repository.id).order_by(commits.c.id)
+    ).fetchall()
+
+
+class TestContributorAliasCache:
+
+    def it_resolves_aliases_for_each_commit(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+        with db.orm_session() as session:
+            alias_cache = ContributorAliasCache().preload(session, [repository.id])
+            resolved, new_aliases = alias_cache.resolve_batch(session, commit_batch(repository))
+
+        assert len(resolved) == 2
+        for commit in resolved:
+            assert commit['committer_alias'] == 'joe@blow.com'
+            assert commit['author_alias'] == 'joe@blow.com'
+            assert commit['committer_name'] == test_contributor_name
+            assert commit['committer_alias_key'] == commit['author_alias_key']
+        assert len(new_aliases) == 1
+        assert new_aliases[0]['alias'] == 'joe@blow.com'
+
+    def it_sends_each_alias_once_across_batches(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+        with db.orm_session() as session:
+            alias_cache = ContributorAliasCache()
+            _, first = alias_cache.resolve_batch(session, commit_batch(repository))
+            alias_cache.mark_sent(first)
+            resolved, second = alias_cache.resolve_batch(session, commit_batch(repository))
+
+        assert len(first) == 1
+        assert len(second) == 0
+        assert resolved[0]['committer_alias'] == 'joe@blow.com'
+
+    def it_sends_an_alias_again_until_it_is_marked_sent(self, setup_org_repo, setup_commits):
+        repository, _ = setup_org_repo
+        with db.orm_session() as session:
+            alias_cache = ContributorAliasCache()
+            # the publish of the first batch failed, so its aliases were never marked sent.
+            _, first = alias_cache.resolve_batch(session, commit_batch(repository))
+            _, second = alias_cache.resolve_batch(session, commit_batch(repository))
+
+        assert first == second
+        assert len(second) == 1
+
+    def it_raises_when_a_commit_references_a_missing_alias(self, setup_org_repo, setup_commits):
+        commit = SimpleNamespace(key='missing-alias-commit', committer_alias_id=-1, author_alias_id=-1)
+        with db.orm_session() as session, pytest.raises(ProcessingException) as exc:
+            ContributorAliasCache().resolve_batch(session, [commit])
+
+        assert 'missing-alias-commit' in str(exc.value)
+        assert '-1' in str(exc.value)
+
+
+class TestSendForOrganization:
+
+    def it_loads_the_aliases_for_the_whole_organization_with_one_query(self, setup_org_repo, setup_commits):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM repos.contributor_aliases' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine(), 'before_cursor_execute', before_cursor_execute)
+        try:
+            with patch.object(publish, 'commit_history_imported') as commit_history_imported:
+                summary = send_for_organization(test_organization_key, batch_size=1)
+        finally:
+            event.remove(db.engine(), 'before_cursor_execute', before_cursor_execute)
+
+        assert summary['commits'] == 2
+        assert commit_history_imported.call_count == 2
+        # the preload, and no alias lookups for the batches
+        assert len(statements) == 1
+        assert 'UNION' in statements[0]
@@ -8,14 +8,33 @@
 
 # Author: Pragya Goyal
 
+import json
+
 from ..shared_fixtures import *
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock, call
 
 from polaris.messaging.test_utils import fake_send, mock_channel, mock_publisher
 from polaris.vcs.messaging.subscribers import VcsTopicSubscriber
 from polaris.messaging.messages import PullRequestsCreated
-from polaris.vcs.messaging.messages import SyncPullRequests
+from polaris.vcs.messaging.messages import SyncPullRequests, RemoteRepositoryPushEvent
 from polaris.messaging.topics import VcsTopic
+from polaris.vcs.messaging.subscribers import vcs_topic_subscriber
+
+
+def push_event(repository_source_id):
+    return dict(connector_key=str(github_connector_key), repository_source_id=repository_source_id)
+
+
+def waiting_message(delivery_tag, message_type, body):
+    return MagicMock(delivery_tag=delivery_tag), MagicMock(type=message_type), json.dumps(body)
+
+
+@pytest.fixture()
+def debouncing_subscriber():
+    channel = mock_channel()
+    subscriber = VcsTopicSubscriber(channel, mock_publisher())
+    subscriber.repository_push_debounce_window = 60
+    yield channel, subscriber
 
 
 class TestSyncPullRequests:
@@ -79,4 +98,51 @@ class TestSyncPullRequests:
             ]
             created_messages, updated_messages = VcsTopicSubscriber(channel, publisher).dispatch(channel, message)
             assert len(created_messages) == 0
-            assert len(updated_messages) == 0
\ No newline at end of file
+            assert len(updated_messages) == 0
+
+
+class TestRemoteRepositoryPushDebouncing:
+
+    def it_transitions_each_pushed_repository_once_and_acks_the_waiting_pushes_after(self, debouncing_subscriber):
+        channel, subscriber = debouncing_subscriber
+        channel.basic_get = MagicMock(side_effect=[
+            waiting_message(1, RemoteRepositoryPushEvent.message_type, push_event('1000')),
+            waiting_message(2, RemoteRepositoryPushEvent.message_type, push_event('1000')),
+            waiting_message(3, RemoteRepositoryPushEvent.message_type, push_event('2000')),
+            waiting_message(4, SyncPullRequests.message_type, dict(organization_key='', repository_key=''))
+        ])
+        message = fake_send(RemoteRepositoryPushEvent(send=push_event('1000')))
+
+        with patch.object(
+                vcs_topic_subscriber.commands,
+                'handle_remote_repository_push',
+                return_value=dict(success=True)
+        ) as handle_push:
+            result = subscriber.dispatch(channel, message)
+
+        assert result['success']
+        assert handle_push.call_args_list == [
+            call(str(github_connector_key), '1000'),
+            call(str(github_connector_key), '1000'),
+            call(str(github_connector_key), '2000')
+        ]
+        assert channel.basic_ack.call_args_list == [call(delivery_tag=1), call(delivery_tag=2), call(delivery_tag=3)]
+        channel.basic_nack.assert_called_once_with(delivery_tag=4, requeue=True)
+
+    def it_returns_the_waiting_pushes_to_the_queue_when_a_transition_fails(self, debouncing_subscriber):
+        channel, subscriber = debouncing_subscriber
+        channel.basic_get = MagicMock(side_effect=[
+            waiting_message(1, RemoteRepositoryPushEvent.message_type, push_event('1000')),
+            (None, None, None)
+        ])
+        message = fake_send(RemoteRepositoryPushEvent(send=push_event('1000')))
+
+        with patch.object(
+                vcs_topic_subscriber.commands,
+                'handle_remote_repository_push',
+                side_effect=[dict(success=True), dict(success=False, exception='transition failed')]
+        ), pytest.raises(Exception):
+            subscriber.dispatch(channel, message)
+
+        assert channel.basic_ack.call_count == 0
+        channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=True)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import json
+
+from polaris.vcs.integrations.github import github_webhooks
+from polaris.vcs.integrations.gitlab import gitlab_webhooks
+from polaris.vcs.integrations.azure import azure_webhooks
+
+
+class TestWebhookEventRouting:
+
+    def it_routes_github_events_by_header(self):
+        assert github_webhooks.resolve_event_type({'X-GitHub-Event': 'push'}, '{}') == 'push'
+        assert github_webhooks.resolve_event_type({'X-GitHub-Event': 'pull_request'}, '{}') == 'pull_request'
+        assert github_webhooks.resolve_event_type({'X-GitHub-Event': 'ping'}, '{"zen": "hi"}') is None
+
+    def it_falls_back_to_the_body_for_github_events_without_a_header(self):
+        body = json.dumps(dict(ref='refs/heads/master', repository=dict(id=1)))
+        assert github_webhooks.resolve_event_type({}, body) == 'push'
+
+    def it_routes_gitlab_events_by_header(self):
+        assert gitlab_webhooks.resolve_event_type({'X-Gitlab-Event': 'Merge Request Hook'}, '{}') == 'merge_request'
+
+    def it_falls_back_to_object_kind_for_gitlab_system_hooks(self):
+        body = json.dumps(dict(object_kind='push', project_id=1))
+        assert gitlab_webhooks.resolve_event_type({'X-Gitlab-Event': 'System Hook'}, body) == 'push'
+
+    def it_reads_the_azure_event_type_without_decoding_the_body(self):
+        body = json.dumps(dict(subscriptionId='s', eventType='git.pullrequest.updated', resource=dict(url='u')))
+        assert azure_webhooks.resolve_event_type(body) == 'git.pullrequest.updated'
+        assert azure_webhooks.resolve_event_type('not json') is None
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2018) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from polaris.utils.exceptions import ProcessingException
+from polaris.vcs.messaging import publish
+from polaris.vcs.service import webhook_gateway
+from polaris.vcs.service.webhook_gateway import WebhookGateway, BatchPublisher, Headers
+
+push_body = json.dumps(dict(ref='refs/heads/master', repository=dict(id=1)))
+
+
+class RecordingPublisher:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def publish_batch(self, events):
+        if self.fail:
+            raise ConnectionError('broker unavailable')
+        self.batches.append(events)
+        return len(events)
+
+    def close(self):
+        pass
+
+
+def push_headers():
+    headers = Headers()
+    headers['X-GitHub-Event'] = 'push'
+    return headers
+
+
+def request(head, body=b''):
+    return head.replace('\n', '\r\n').encode('latin-1') + body
+
+
+def github_push(body=push_body, content_length=None, extra_headers=''):
+    body = body.encode('utf-8')
+    return request(
+        f'POST /github/repository/webhooks/abc/ HTTP/1.1\n'
+        f'Host: localhost\n'
+        f'X-GitHub-Event: push\n'
+        f'{extra_headers}'
+        f'Content-Length: {len(body) if content_length is None else content_length}\n'
+        f'Connection: close\n\n',
+        body
+    )
+
+
+def chunked_github_push(chunks):
+    body = b''.join(f'{len(chunk):x}\r\n'.encode('latin-1') + chunk + b'\r\n' for chunk in chunks) + b'0\r\n\r\n'
+    return request(
+        'POST /github/repository/webhooks/abc/ HTTP/1.1\n'
+        'Host: localhost\n'
+        'X-GitHub-Event: push\n'
+        'Transfer-Encoding: chunked\n'
+        'Connection: close\n\n',
+        body
+    )
+
+
+def exchange(gateway, *requests):
+    # Serves the gateway on a free port, sends each request on its own connection, all at once, and
+    # returns the status codes of the responses.
+    async def send(port, data):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(data)
+        await writer.drain()
+        status_line = await reader.readline()
+        writer.close()
+        return int(status_line.split()[1])
+
+    async def run():
+        server = await asyncio.start_server(gateway.handle_connection, '127.0.0.1', 0)
+        publisher = asyncio.ensure_future(gateway.publish_batches())
+        try:
+            port = server.sockets[0].getsockname()[1]
+            return await asyncio.gather(*[send(port, data) for data in requests])
+        finally:
+            publisher.cancel()
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+class TestWebhookGateway:
+
+    def it_accepts_the_webhook_blueprint_urls(self):
+        assert webhook_gateway.route('/github/repository/webhooks/abc/') == ('github', 'abc')
+        assert webhook_gateway.route('/gitlab/repository/push/abc/') == ('gitlab', 'abc')
+        assert webhook_gateway.route('/gitlab/repository/webhooks/abc') == ('gitlab', 'abc')
+        assert webhook_gateway.route('/azure/repository/webhooks/abc/') == ('azure', 'abc')
+        assert webhook_gateway.route('/graphql/') == (None, None)
+
+    def it_sheds_load_when_the_queue_is_full(self):
+        gateway = WebhookGateway(queue_size=1, publisher=RecordingPublisher())
+
+        async def run():
+            # nothing publishes here, so the first event stays queued.
+            waiting = asyncio.ensure_future(gateway.accept('github', 'abc', push_headers(), push_body))
+            await asyncio.sleep(0)
+            status = await gateway.accept('github', 'abc', push_headers(), push_body)
+            waiting.cancel()
+            return status
+
+        assert asyncio.run(run()) == 503
+
+        metrics = gateway.metrics.snapshot(gateway.get_queue().qsize())
+        assert metrics['queued'] == 1
+        assert metrics['shed'] == 1
+        assert metrics['queue_depth'] == 1
+
+    def it_acknowledges_events_it_does_not_publish(self):
+        gateway = WebhookGateway(queue_size=1, publisher=RecordingPublisher())
+        headers = Headers()
+        headers['X-GitHub-Event'] = 'ping'
+
+        assert asyncio.run(gateway.accept('github', 'abc', headers, '{}')) == 200
+        assert gateway.metrics.ignored == 1
+        assert gateway.get_queue().qsize() == 0
+
+
+class TestWebhookRequests:
+
+    def it_answers_once_the_event_is_published(self):
+        publisher = RecordingPublisher()
+        gateway = WebhookGateway(publisher=publisher)
+
+        assert exchange(gateway, github_push()) == [200]
+        assert publisher.batches == [[('github', 'push', 'abc', push_body)]]
+        assert gateway.metrics.published == 1
+
+    def it_publishes_requests_that_arrive_together_in_one_batch(self):
+        publisher = RecordingPublisher()
+        gateway = WebhookGateway(batch_window=0.5, publisher=publisher)
+
+        assert exchange(gateway, *[github_push() for _ in range(5)]) == [200] * 5
+        assert [len(batch) for batch in publisher.batches] == [5]
+
+    def it_asks_the_provider_to_retry_when_the_publish_fails(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher(fail=True))
+
+        assert exchange(gateway, github_push()) == [503]
+        assert gateway.metrics.failed == 1
+        assert gateway.metrics.published == 0
+
+    def it_reads_chunked_bodies(self):
+        publisher = RecordingPublisher()
+        gateway = WebhookGateway(publisher=publisher)
+        body = push_body.encode('utf-8')
+
+        assert exchange(gateway, chunked_github_push([body[:10], body[10:]])) == [200]
+        assert publisher.batches == [[('github', 'push', 'abc', push_body)]]
+
+    def it_rejects_a_malformed_content_length(self):
+        publisher = RecordingPublisher()
+        gateway = WebhookGateway(publisher=publisher)
+
+        assert exchange(gateway, github_push(content_length='ten'), github_push(content_length=-1)) == [400, 400]
+        assert publisher.batches == []
+
+    def it_rejects_a_malformed_chunk(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+        malformed = chunked_github_push([b'{}']).replace(b'2\r\n{}', b'zz\r\n{}')
+
+        assert exchange(gateway, malformed) == [400]
+
+    def it_rejects_bodies_over_the_limit(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        with patch.object(webhook_gateway, 'MAX_BODY_SIZE', 8):
+            assert exchange(
+                gateway,
+                github_push(),
+                chunked_github_push([b'{"a":', b'"bcdefg"}'])
+            ) == [413, 413]
+
+    def it_does_not_support_other_transfer_encodings(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        assert exchange(gateway, github_push().replace(b'Content-Length', b'Transfer-Encoding: gzip\r\nX-Length')) == [501]
+
+    def it_answers_unknown_paths_with_not_found(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        assert exchange(gateway, request('GET /nowhere HTTP/1.1\nConnection: close\n\n')) == [404]
+
+    def it_rejects_too_many_headers(self):
+        publisher = RecordingPublisher()
+        gateway = WebhookGateway(publisher=publisher)
+
+        with patch.object(webhook_gateway, 'MAX_HEADER_COUNT', 5):
+            assert exchange(gateway, github_push(extra_headers='X-Extra: 1\n' * 5)) == [431]
+        assert publisher.batches == []
+
+    def it_rejects_a_header_section_over_the_limit(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        with patch.object(webhook_gateway, 'MAX_HEADER_SIZE', 128):
+            assert exchange(gateway, github_push(extra_headers=f"X-Extra: {'a' * 128}\n")) == [431]
+
+    def it_rejects_a_header_line_over_the_reader_limit(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        assert exchange(gateway, github_push(extra_headers=f"X-Extra: {'a' * 70000}\n")) == [431]
+
+    def it_rejects_a_request_line_over_the_reader_limit(self):
+        gateway = WebhookGateway(publisher=RecordingPublisher())
+
+        assert exchange(gateway, request(f"GET /{'a' * 70000} HTTP/1.1\nConnection: close\n\n")) == [400]
+
+
+class TestAtlassianConnectRequests:
+
+    def it_publishes_from_each_wsgi_thread_on_a_batch_of_its_own(self):
+        batches_class = publish.ThreadBatches
+        batches = []
+
+        def wsgi_app(environ, start_response):
+            batches.append(getattr(publish._batches, 'current', None))
+            start_response('200 OK', [])
+            return [b'ok']
+
+        with patch.object(
+                webhook_gateway.publish,
+                'ThreadBatches',
+                side_effect=lambda size=None: batches_class(size, broker_url='amqp://localhost')
+        ):
+            gateway = WebhookGateway(publisher=RecordingPublisher(), wsgi_app=wsgi_app)
+
+        assert exchange(gateway, request(
+            'POST /atlassian_connect/webhook HTTP/1.1\nContent-Length: 0\nConnection: close\n\n'
+        )) == [200]
+        assert len(batches) == 1
+        assert batches[0] is not None
+        assert batches[0].size == 1
+
+
+class TestBatchPublisher:
+
+    def it_needs_a_broker_url(self):
+        with patch.object(webhook_gateway.config_provider, 'get', return_value=None):
+            with pytest.raises(ProcessingException):
+                BatchPublisher()
+
+    def it_publishes_a_batch_in_one_transaction(self):
+        connection = MagicMock()
+        publish = MagicMock()
+        with patch.object(webhook_gateway.pika, 'BlockingConnection', return_value=connection), \
+                patch.dict(webhook_gateway.publishers, github=publish):
+            publisher = BatchPublisher(broker_url='amqp://localhost')
+            publisher.publish_batch([('github', 'push', 'abc', push_body)] * 3)
+
+        channel = connection.channel.return_value
+        channel.tx_select.assert_called_once_with()
+        channel.tx_commit.assert_called_once_with()
+        assert publish.call_count == 3
+
+    def it_reconnects_and_publishes_the_whole_batch_again_after_a_failure(self):
+        connection = MagicMock()
+        publish = MagicMock(side_effect=[None, ConnectionError('connection reset'), None, None])
+        with patch.object(webhook_gateway.pika, 'BlockingConnection', return_value=connection), \
+                patch.dict(webhook_gateway.publishers, github=publish):
+            publisher = BatchPublisher(broker_url='amqp://localhost')
+            assert publisher.publish_batch([('github', 'push', 'abc', push_body)] * 2) == 2
+
+        assert publish.call_count == 4
+        assert connection.channel.return_value.tx_commit.call_count == 1